@@ -0,0 +1,73 @@
+# callbacks.py
+"""
+Формат callback_data инлайн-кнопок.
+
+Все кнопки кодируются одной фабрикой PaymentCb: "p1:<действие>:<id>:<стр.>",
+например "p1:t:42:0" — 9 байт вместо "edit_title:42". Префикс "p1" — версия
+формата: при несовместимом изменении заводится новый префикс, а старые
+кнопки, оставшиеся в чатах, продолжают разбираться decode_callback.
+"""
+from aiogram.filters.callback_data import CallbackData
+
+
+class Action:
+    """
+    Однобуквенные коды действий.
+    """
+    OPEN_LIST = "o"  # открыть постраничный редактор
+    PAGE = "g"  # страница редактора
+    VIEW = "v"  # карточка платежа
+    EDIT_TITLE = "t"
+    EDIT_AMOUNT = "m"
+    EDIT_DAY = "d"
+    DELETE = "x"  # спросить подтверждение удаления
+    DELETE_YES = "y"
+    DELETE_NO = "n"
+    PAY = "p"  # отметить платёж месяца оплаченным (id — payment_instances.id)
+
+
+class PaymentCb(CallbackData, prefix="p1"):
+    a: str
+    id: int = 0
+    pg: int = 0
+
+
+# Формат до появления PaymentCb: "<префикс>:<id>" (и "open_pay:<id>:<стр.>")
+_LEGACY_ACTIONS = {
+    "edit_page": Action.PAGE,
+    "open_pay": Action.VIEW,
+    "edit_title": Action.EDIT_TITLE,
+    "edit_amount": Action.EDIT_AMOUNT,
+    "edit_day": Action.EDIT_DAY,
+    "del": Action.DELETE,
+    "confirm_del_yes": Action.DELETE_YES,
+    "confirm_del_no": Action.DELETE_NO,
+}
+
+
+def pack(action: str, payment_id: int = 0, page: int = 0) -> str:
+    return PaymentCb(a=action, id=payment_id, pg=page).pack()
+
+
+def decode_callback(data: str | None) -> PaymentCb | None:
+    """
+    Разбирает callback_data текущего или старого формата; None — если не удалось.
+    """
+    if not data:
+        return None
+    prefix, _, rest = data.partition(":")
+    try:
+        if prefix == PaymentCb.__prefix__:
+            return PaymentCb.unpack(data)
+        if data == "open_edit_list":
+            return PaymentCb(a=Action.OPEN_LIST)
+        action = _LEGACY_ACTIONS.get(prefix)
+        if action is None:
+            return None
+        values = [int(value) for value in rest.split(":")]
+    except (ValueError, TypeError):
+        # TypeError — у PaymentCb.unpack при другом числе полей
+        return None
+    if action == Action.PAGE:
+        return PaymentCb(a=action, pg=values[0])
+    return PaymentCb(a=action, id=values[0], pg=values[1] if len(values) > 1 else 0)
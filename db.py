@@ -1,138 +1,1014 @@
 # db.py
+import calendar
 import sqlite3
+import threading
+from bisect import bisect_left
+from itertools import accumulate
 from pathlib import Path
-from datetime import date
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+
+import recurrence
+from cache import LRUCache
+from money import to_minor
+from recurrence import MONTHLY, Schedule, schedule_of
 
 DB_PATH = Path("payments.db")
 
+# Размер кэша подготовленных выражений на соединение
+STATEMENT_CACHE_SIZE = 128
+
+_local = threading.local()
+_connections: list[sqlite3.Connection] = []
+_connections_lock = threading.Lock()
+
+# tg_id -> users.id: связь никогда не меняется, поэтому TTL нужен только
+# чтобы со временем вытеснять давно неактивных пользователей
+_user_id_cache = LRUCache(maxsize=50_000, ttl=24 * 60 * 60)
 
-def get_connection():
-    conn = sqlite3.connect(DB_PATH)
+# user_id -> PaymentSummary; сбрасывается при любом изменении платежей пользователя
+_summary_cache = LRUCache(maxsize=10_000)
+# user_id -> месяц ("YYYY-MM"), для которого payment_instances уже
+# совпадают с текущими платежами; сбрасывается вместе со сводкой
+_materialized_months = LRUCache(maxsize=50_000)
+# True, если с базой одновременно работают несколько процессов бота
+_multiprocess = False
+
+
+def _open_connection() -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        DB_PATH,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=False,  # закрываем из другого потока в close_connections()
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA cache_size = -16000")  # ~16 МБ
+    conn.execute("PRAGMA mmap_size = 268435456")  # 256 МБ
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA busy_timeout = 5000")
+    return conn
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Долгоживущее соединение текущего потока.
+    Открывается один раз на поток, закрывать его после запроса не нужно.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _open_connection()
+        _local.conn = conn
+        with _connections_lock:
+            _connections.append(conn)
     return conn
 
 
+def close_connections():
+    """
+    Закрывает все открытые соединения. Вызывается при остановке бота.
+    """
+    with _connections_lock:
+        for conn in _connections:
+            # обновляет статистику планировщика запросов по накопленной нагрузке
+            conn.execute("PRAGMA optimize")
+            conn.close()
+        _connections.clear()
+
+
+# Миграции схемы. Миграция N — это MIGRATIONS[N - 1], номер последней
+# применённой миграции хранится в PRAGMA user_version.
+# Уже выпущенные миграции не меняем, новые добавляем только в конец.
+MIGRATIONS = [
+    # 1: исходная схема (IF NOT EXISTS — для старых payments.db без user_version)
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tg_id INTEGER UNIQUE NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS payments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        amount REAL NOT NULL,
+        day_of_month INTEGER NOT NULL,
+        active INTEGER NOT NULL DEFAULT 1,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    );
+    """,
+    # 2: частичные индексы по активным платежам
+    """
+    CREATE INDEX IF NOT EXISTS idx_payments_user_day
+        ON payments(user_id, day_of_month) WHERE active = 1;
+    CREATE INDEX IF NOT EXISTS idx_payments_day
+        ON payments(day_of_month) WHERE active = 1;
+    """,
+    # 3: индекс для напоминаний отдаёт строки уже сгруппированными по пользователю
+    """
+    DROP INDEX IF EXISTS idx_payments_day;
+    CREATE INDEX IF NOT EXISTS idx_payments_day_user
+        ON payments(day_of_month, user_id) WHERE active = 1;
+    """,
+    # 4: часовой пояс и час напоминаний пользователя
+    """
+    ALTER TABLE users ADD COLUMN tz TEXT NOT NULL DEFAULT 'Europe/Moscow';
+    ALTER TABLE users ADD COLUMN remind_hour INTEGER NOT NULL DEFAULT 9;
+    CREATE INDEX IF NOT EXISTS idx_users_slice ON users(tz, remind_hour);
+    """,
+    # 5: очередь напоминаний (outbox): одно сообщение на пользователя и дату
+    """
+    CREATE TABLE IF NOT EXISTS reminder_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        tg_id INTEGER NOT NULL,
+        due_date TEXT NOT NULL,
+        text TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_retry_at INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        created_at INTEGER NOT NULL DEFAULT (strftime('%s', 'now')),
+        sent_at INTEGER,
+        UNIQUE (user_id, due_date),
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_outbox_pending
+        ON reminder_outbox(next_retry_at) WHERE status = 'pending';
+    CREATE TABLE IF NOT EXISTS reminder_runs (
+        tz TEXT NOT NULL,
+        remind_hour INTEGER NOT NULL,
+        due_date TEXT NOT NULL,
+        finished_at INTEGER NOT NULL,
+        PRIMARY KEY (tz, remind_hour, due_date)
+    );
+    """,
+    # 6: состояния FSM (незавершённые диалоги добавления/редактирования)
+    """
+    CREATE TABLE IF NOT EXISTS fsm_storage (
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT NOT NULL DEFAULT '{}',
+        updated_at INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_fsm_updated ON fsm_storage(updated_at);
+    """,
+    # 7: аренды (leader lock) для нескольких процессов бота
+    """
+    CREATE TABLE IF NOT EXISTS leases (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at INTEGER NOT NULL
+    );
+    """,
+    # 8: мягкое удаление платежей; старые active = 0 считаем удалёнными сейчас
+    """
+    ALTER TABLE payments ADD COLUMN deleted_at INTEGER;
+    UPDATE payments SET deleted_at = strftime('%s', 'now') WHERE active = 0;
+    CREATE INDEX IF NOT EXISTS idx_payments_deleted
+        ON payments(deleted_at) WHERE active = 0;
+    CREATE INDEX IF NOT EXISTS idx_outbox_done
+        ON reminder_outbox(created_at) WHERE status != 'pending';
+    """,
+    # 9: суммы в копейках. Индекс пользователя покрывает SUM(amount_minor):
+    # active — чтобы SQLite не читал таблицу ради условия active = 1,
+    # id перед amount_minor — чтобы сохранился порядок (day_of_month, id)
+    """
+    ALTER TABLE payments ADD COLUMN amount_minor INTEGER NOT NULL DEFAULT 0;
+    UPDATE payments SET amount_minor = CAST(ROUND(amount * 100) AS INTEGER);
+    ALTER TABLE payments DROP COLUMN amount;
+    DROP INDEX IF EXISTS idx_payments_user_day;
+    CREATE INDEX IF NOT EXISTS idx_payments_user_day
+        ON payments(user_id, day_of_month, id, amount_minor, active) WHERE active = 1;
+    """,
+    # 10: платежи по месяцам (оплачен / нет) и итоги по пользователю и месяцу.
+    # Итоги ведут триггеры, поэтому они всегда совпадают с payment_instances.
+    """
+    CREATE TABLE IF NOT EXISTS payment_instances (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        payment_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        month TEXT NOT NULL,
+        due_date TEXT NOT NULL,
+        title TEXT NOT NULL,
+        amount_minor INTEGER NOT NULL,
+        paid_at INTEGER,
+        UNIQUE (payment_id, month),
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_instances_unpaid
+        ON payment_instances(user_id, month, due_date) WHERE paid_at IS NULL;
+    CREATE TABLE IF NOT EXISTS monthly_summary (
+        user_id INTEGER NOT NULL,
+        month TEXT NOT NULL,
+        total_minor INTEGER NOT NULL DEFAULT 0,
+        paid_minor INTEGER NOT NULL DEFAULT 0,
+        payments_count INTEGER NOT NULL DEFAULT 0,
+        paid_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, month)
+    ) WITHOUT ROWID;
+    CREATE TRIGGER IF NOT EXISTS trg_instances_insert AFTER INSERT ON payment_instances
+    BEGIN
+        INSERT INTO monthly_summary (user_id, month, total_minor, paid_minor, payments_count, paid_count)
+        VALUES (
+            NEW.user_id, NEW.month, NEW.amount_minor,
+            iif(NEW.paid_at IS NULL, 0, NEW.amount_minor), 1, NEW.paid_at IS NOT NULL
+        )
+        ON CONFLICT (user_id, month) DO UPDATE SET
+            total_minor = total_minor + excluded.total_minor,
+            paid_minor = paid_minor + excluded.paid_minor,
+            payments_count = payments_count + 1,
+            paid_count = paid_count + excluded.paid_count;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_instances_update
+    AFTER UPDATE OF amount_minor, paid_at ON payment_instances
+    BEGIN
+        UPDATE monthly_summary SET
+            total_minor = total_minor - OLD.amount_minor + NEW.amount_minor,
+            paid_minor = paid_minor
+                - iif(OLD.paid_at IS NULL, 0, OLD.amount_minor)
+                + iif(NEW.paid_at IS NULL, 0, NEW.amount_minor),
+            paid_count = paid_count - (OLD.paid_at IS NOT NULL) + (NEW.paid_at IS NOT NULL)
+        WHERE user_id = NEW.user_id AND month = NEW.month;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_instances_delete AFTER DELETE ON payment_instances
+    BEGIN
+        UPDATE monthly_summary SET
+            total_minor = total_minor - OLD.amount_minor,
+            paid_minor = paid_minor - iif(OLD.paid_at IS NULL, 0, OLD.amount_minor),
+            payments_count = payments_count - 1,
+            paid_count = paid_count - (OLD.paid_at IS NOT NULL)
+        WHERE user_id = OLD.user_id AND month = OLD.month;
+    END;
+    """,
+    # 11: периодичность (см. recurrence.py) и ближайшая дата платежа.
+    # Существующие платежи ежемесячные: ближайшая дата — это число в этом
+    # месяце (с переносом на последний день), если оно ещё не прошло, иначе в следующем.
+    # Напоминания выбираются по next_due_date: для каждого пользователя слота
+    # индекс (user_id, next_due_date) отдаёт только наступившие платежи,
+    # индекс по дню месяца больше не нужен.
+    """
+    ALTER TABLE payments ADD COLUMN recurrence TEXT NOT NULL DEFAULT 'monthly';
+    ALTER TABLE payments ADD COLUMN anchor_date TEXT;
+    ALTER TABLE payments ADD COLUMN next_due_date TEXT;
+    UPDATE payments SET next_due_date = CASE
+        WHEN min(
+            date('now', 'start of month', '+' || (day_of_month - 1) || ' days'),
+            date('now', 'start of month', '+1 month', '-1 day')
+        ) >= date('now')
+        THEN min(
+            date('now', 'start of month', '+' || (day_of_month - 1) || ' days'),
+            date('now', 'start of month', '+1 month', '-1 day')
+        )
+        ELSE min(
+            date('now', 'start of month', '+1 month', '+' || (day_of_month - 1) || ' days'),
+            date('now', 'start of month', '+2 months', '-1 day')
+        )
+    END
+    WHERE active = 1;
+    DROP INDEX IF EXISTS idx_payments_day_user;
+    CREATE INDEX IF NOT EXISTS idx_payments_next_due
+        ON payments(user_id, next_due_date) WHERE active = 1;
+    DROP INDEX IF EXISTS idx_payments_user_day;
+    CREATE INDEX IF NOT EXISTS idx_payments_user_day
+        ON payments(user_id, day_of_month, id, amount_minor, active, recurrence) WHERE active = 1;
+    """,
+    # 12: напоминания идут от пользователей слота (idx_users_slice, по id),
+    # а их платежи — по (user_id, id): порядок keyset-страниц даёт индекс
+    # без сортировки, next_due_date <= ? проверяется прямо по индексу
+    """
+    DROP INDEX IF EXISTS idx_payments_next_due;
+    CREATE INDEX IF NOT EXISTS idx_payments_due
+        ON payments(user_id, id, next_due_date) WHERE active = 1;
+    """,
+    # 13: счётчик изменений платежей для кэшей нескольких процессов
+    # (см. sync_with_other_processes). Сдвиг next_due_date после напоминания
+    # и физическое удаление уже удалённых платежей его не меняют.
+    """
+    CREATE TABLE IF NOT EXISTS payments_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO payments_version (id, version) VALUES (1, 0);
+    CREATE TRIGGER IF NOT EXISTS trg_payments_version_insert AFTER INSERT ON payments
+    BEGIN
+        UPDATE payments_version SET version = version + 1 WHERE id = 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_payments_version_update
+    AFTER UPDATE OF title, amount_minor, day_of_month, recurrence, anchor_date, active ON payments
+    BEGIN
+        UPDATE payments_version SET version = version + 1 WHERE id = 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_payments_version_delete AFTER DELETE ON payments
+    WHEN OLD.active = 1
+    BEGIN
+        UPDATE payments_version SET version = version + 1 WHERE id = 1;
+    END;
+    """,
+]
+
+
+def _split_sql(script: str) -> list[str]:
+    """
+    Делит SQL-скрипт на отдельные выражения (с учётом BEGIN ... END в триггерах).
+    """
+    statements = []
+    buf = ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            statements.append(buf.strip())
+            buf = ""
+    if buf.strip():
+        statements.append(buf.strip())
+    return statements
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection):
+    """
+    Применяет недостающие миграции в одной транзакции.
+    BEGIN IMMEDIATE не даёт двум процессам мигрировать одну базу одновременно.
+    """
+    if get_schema_version(conn) >= len(MIGRATIONS):
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # версию перечитываем под блокировкой: её мог поднять другой процесс
+        version = get_schema_version(conn)
+        for number in range(version + 1, len(MIGRATIONS) + 1):
+            for statement in _split_sql(MIGRATIONS[number - 1]):
+                conn.execute(statement)
+        conn.execute(f"PRAGMA user_version = {max(version, len(MIGRATIONS))}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def enable_incremental_vacuum(conn: sqlite3.Connection):
+    """
+    Включает auto_vacuum = INCREMENTAL, чтобы место после очистки можно было
+    возвращать порциями (PRAGMA incremental_vacuum), а не полным VACUUM.
+    На существующей базе режим меняется только через VACUUM — он выполняется
+    один раз, вне транзакции; на новой пустой базе это мгновенно.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+
+
 def init_db():
+    conn = get_connection()
+    enable_incremental_vacuum(conn)
+    migrate(conn)
+
+
+def prepare_database():
+    """
+    init_db до запуска нескольких процессов: VACUUM при включении
+    incremental vacuum и миграции выполняются один раз, а не в каждом
+    процессе наперегонки (на большой базе они упирались бы в busy_timeout).
+    Соединения закрываются, чтобы не достаться процессам через fork.
+    """
+    init_db()
+    close_connections()
+
+
+def get_cached_user_id(tg_id: int) -> int | None:
+    """
+    user_id из кэша без обращения к БД (None, если в кэше нет).
+    """
+    return _user_id_cache.get(tg_id)
+
+
+def get_or_create_user(tg_id: int):
+    user_id = get_cached_user_id(tg_id)
+    if user_id is not None:
+        return user_id
+    return upsert_user(tg_id)
+
+
+def upsert_user(tg_id: int) -> int:
+    """
+    Создаёт пользователя, если его ещё нет, и кладёт user_id в кэш.
+    """
     conn = get_connection()
     cur = conn.cursor()
+    # один запрос и для нового, и для существующего пользователя
     cur.execute(
         """
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            tg_id INTEGER UNIQUE NOT NULL
-        );
-        """
+        INSERT INTO users (tg_id) VALUES (?)
+        ON CONFLICT(tg_id) DO UPDATE SET tg_id = excluded.tg_id
+        RETURNING id
+        """,
+        (tg_id,),
     )
+    user_id = cur.fetchone()["id"]
+    conn.commit()
+    _user_id_cache.set(tg_id, user_id)
+    return user_id
+
+
+def get_user_cache_stats() -> dict:
+    return _user_id_cache.stats()
+
+
+def get_user_settings(user_id: int):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT tz, remind_hour FROM users WHERE id = ?", (user_id,))
+    return cur.fetchone()
+
+
+def set_user_timezone(user_id: int, tz: str):
+    conn = get_connection()
+    conn.execute("UPDATE users SET tz = ? WHERE id = ?", (tz, user_id))
+    conn.commit()
+
+
+def set_user_remind_hour(user_id: int, hour: int):
+    conn = get_connection()
+    conn.execute("UPDATE users SET remind_hour = ? WHERE id = ?", (hour, user_id))
+    conn.commit()
+
+
+def get_reminder_slices() -> list[tuple[str, int]]:
+    """
+    Все пары (часовой пояс, час напоминаний), для которых есть пользователи.
+    Вместо DISTINCT по всей таблице — прыжки по idx_users_slice: следующий пояс
+    и следующий час ищутся через min(), так что читается по одной записи
+    индекса на пару, а не по записи на пользователя.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
     cur.execute(
         """
-        CREATE TABLE IF NOT EXISTS payments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            title TEXT NOT NULL,
-            amount REAL NOT NULL,
-            day_of_month INTEGER NOT NULL,
-            active INTEGER NOT NULL DEFAULT 1,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        );
+        WITH RECURSIVE
+            zones(tz) AS (
+                SELECT min(tz) FROM users
+                UNION ALL
+                SELECT (SELECT min(tz) FROM users WHERE tz > zones.tz)
+                FROM zones WHERE tz IS NOT NULL
+            ),
+            slices(tz, remind_hour) AS (
+                SELECT tz, (SELECT min(remind_hour) FROM users WHERE users.tz = zones.tz)
+                FROM zones WHERE tz IS NOT NULL
+                UNION ALL
+                SELECT tz, (
+                    SELECT min(remind_hour) FROM users
+                    WHERE users.tz = slices.tz AND users.remind_hour > slices.remind_hour
+                )
+                FROM slices WHERE remind_hour IS NOT NULL
+            )
+        SELECT tz, remind_hour FROM slices WHERE remind_hour IS NOT NULL
         """
     )
+    return [(row["tz"], row["remind_hour"]) for row in cur.fetchall()]
+
+
+def user_today(user_id: int) -> date:
+    """
+    Сегодняшняя дата в часовом поясе пользователя.
+    """
+    settings = get_user_settings(user_id)
+    if settings is None:
+        return date.today()
+    return datetime.now(ZoneInfo(settings["tz"])).date()
+
+
+_INSERT_PAYMENT_SQL = """
+    INSERT INTO payments
+        (user_id, title, amount_minor, day_of_month, recurrence, anchor_date, next_due_date)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _payment_values(user_id: int, title: str, amount: Decimal, schedule: Schedule, today: date) -> tuple:
+    anchor = schedule.anchor_date.isoformat() if schedule.anchor_date is not None else None
+    return (
+        user_id,
+        title,
+        to_minor(amount),
+        schedule.day_of_month,
+        schedule.recurrence,
+        anchor,
+        recurrence.next_due(schedule, today).isoformat(),
+    )
+
+
+def add_payment(user_id: int, title: str, amount: Decimal, schedule: Schedule):
+    conn = get_connection()
+    conn.execute(_INSERT_PAYMENT_SQL, _payment_values(user_id, title, amount, schedule, user_today(user_id)))
     conn.commit()
-    conn.close()
+    invalidate_payment_summary(user_id)
 
 
-def get_or_create_user(tg_id: int):
+def add_payments(user_id: int, payments) -> int:
+    """
+    Добавляет платежи (title, amount, schedule) одной транзакцией.
+    """
     conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM users WHERE tg_id = ?", (tg_id,))
-    row = cur.fetchone()
-    if row:
-        conn.close()
-        return row["id"]
+    today = user_today(user_id)
+    with conn:
+        cur = conn.executemany(
+            _INSERT_PAYMENT_SQL,
+            (_payment_values(user_id, title, amount, schedule, today) for title, amount, schedule in payments),
+        )
+    invalidate_payment_summary(user_id)
+    return cur.rowcount
 
-    cur.execute("INSERT INTO users (tg_id) VALUES (?)", (tg_id,))
-    conn.commit()
-    user_id = cur.lastrowid
-    conn.close()
-    return user_id
 
+class PaymentSummary:
+    """
+    Активные платежи пользователя, отсортированные по дню месяца.
+    Ежемесячные (monthly) — с префиксными суммами: prefix[i] — сумма первых
+    i ежемесячных платежей в копейках; остальные (others) — с датами по правилам
+    из recurrence.py.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.monthly = [row for row in rows if row["recurrence"] == MONTHLY]
+        self.others = [row for row in rows if row["recurrence"] != MONTHLY]
+        self.days = [row["day_of_month"] for row in self.monthly]
+        self.prefix = [0, *accumulate(row["amount_minor"] for row in self.monthly)]
+        # готовые тексты по этим данным (например, список);
+        # живут вместе со сводкой и сбрасываются при изменении платежей
+        self.rendered: dict = {}
+        # то же для текстов на дату — только за последнюю (см. rendered_for)
+        self._rendered_day: date | None = None
+        self._rendered_today: dict = {}
+        # длина месяца -> суммы ежемесячных платежей по дням (см. daily_outflow)
+        self._daily: dict[int, list[int]] = {}
+
+    def rendered_for(self, today: date) -> dict:
+        """
+        Готовые тексты на дату today (сводка, прогноз). Со сменой даты
+        прежние выбрасываются, чтобы у сводки, подолгу живущей в кэше,
+        они не копились по одному на день.
+        """
+        if self._rendered_day != today:
+            self._rendered_day = today
+            self._rendered_today = {}
+        return self._rendered_today
+
+    def month_total(self) -> int:
+        """
+        Сумма ежемесячных платежей, в копейках.
+        """
+        return self.prefix[-1]
+
+    def remaining_from(self, day: int) -> int:
+        """
+        Сумма ежемесячных платежей с day_of_month >= day, в копейках.
+        """
+        return self.prefix[-1] - self.prefix[bisect_left(self.days, day)]
+
+    def daily_outflow(self, month_length: int) -> list[int]:
+        """
+        Сумма ежемесячных платежей по дням месяца длиной month_length в копейках:
+        элемент i — день i + 1. Платежи на 29–31 в коротком месяце
+        попадают на последний день. Считается один раз на длину месяца.
+        """
+        daily = self._daily.get(month_length)
+        if daily is None:
+            by_day = [0] * 32
+            for row in self.monthly:
+                by_day[row["day_of_month"]] += row["amount_minor"]
+            daily = self._daily[month_length] = [*by_day[1:month_length], sum(by_day[month_length:])]
+        return daily
+
+    def next_due(self, today: date):
+        """
+        Ближайший платёж начиная с today: (row, дата) или None, если платежей нет.
+        Дата учитывает перенос 29–31 на последний день месяца.
+        """
+        best = None
+        if self.monthly:
+            i = bisect_left(self.days, today.day)
+            if i < len(self.monthly):
+                row = self.monthly[i]
+                best = row, today.replace(day=effective_due_day(row["day_of_month"], today))
+            else:
+                # в этом месяце всё уже прошло — первый платёж следующего месяца
+                row = self.monthly[0]
+                first_next = (today.replace(day=1) + timedelta(days=32)).replace(day=1)
+                best = row, first_next.replace(day=effective_due_day(row["day_of_month"], first_next))
+        for row in self.others:
+            due = recurrence.next_due(schedule_of(row), today)
+            if best is None or due < best[1]:
+                best = row, due
+        return best
+
+
+def enable_multiprocess_mode():
+    """
+    Базу меняют и другие процессы бота: перед чтением сводок из кэша
+    нужно проверять, не изменилась ли база (sync_with_other_processes).
+    """
+    global _multiprocess
+    _multiprocess = True
+
+
+def is_multiprocess_mode() -> bool:
+    return _multiprocess
+
+
+def sync_with_other_processes():
+    """
+    Счётчик payments_version растёт при каждом изменении платежей, в каком бы
+    процессе оно ни было. Если с прошлой проверки он изменился, кэш сводок
+    может быть устаревшим. Прочие записи (состояния FSM, аренды, outbox)
+    кэш не сбрасывают.
+    """
+    version = get_connection().execute("SELECT version FROM payments_version WHERE id = 1").fetchone()[0]
+    if getattr(_local, "payments_version", version) != version:
+        _summary_cache.clear()
+        _materialized_months.clear()
+    _local.payments_version = version
 
-def add_payment(user_id: int, title: str, amount: float, day_of_month: int):
+
+def get_cached_payment_summary(user_id: int) -> PaymentSummary | None:
+    return _summary_cache.get(user_id)
+
+
+def load_payment_summary(user_id: int) -> PaymentSummary:
     conn = get_connection()
     cur = conn.cursor()
     cur.execute(
         """
-        INSERT INTO payments (user_id, title, amount, day_of_month)
-        VALUES (?, ?, ?, ?)
+        SELECT * FROM payments
+        WHERE user_id = ? AND active = 1
+        ORDER BY day_of_month, id
         """,
-        (user_id, title, amount, day_of_month),
+        (user_id,),
     )
-    conn.commit()
-    conn.close()
+    summary = PaymentSummary(cur.fetchall())
+    _summary_cache.set(user_id, summary)
+    return summary
+
+
+def get_payment_summary(user_id: int) -> PaymentSummary:
+    if _multiprocess:
+        sync_with_other_processes()
+    summary = get_cached_payment_summary(user_id)
+    if summary is None:
+        summary = load_payment_summary(user_id)
+    return summary
+
+
+def invalidate_payment_summary(user_id: int):
+    _summary_cache.pop(user_id)
+    _materialized_months.pop(user_id)
 
 
-def get_payments_for_user(user_id: int):
+def get_summary_cache_stats() -> dict:
+    return _summary_cache.stats()
+
+
+def get_payments_page(user_id: int, offset: int, limit: int):
+    """
+    Одна страница активных платежей пользователя в порядке списка.
+    """
     conn = get_connection()
     cur = conn.cursor()
     cur.execute(
-        "SELECT * FROM payments WHERE user_id = ? AND active = 1 ORDER BY day_of_month",
-        (user_id,),
+        """
+        SELECT * FROM payments
+        WHERE user_id = ? AND active = 1
+        ORDER BY day_of_month, id
+        LIMIT ? OFFSET ?
+        """,
+        (user_id, limit, offset),
     )
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    return cur.fetchall()
 
 
-def get_month_total_for_user(user_id: int) -> float:
+def iter_user_payments(user_id: int, page_size: int = 500):
+    """
+    Все активные платежи пользователя в порядке списка, страницами по page_size
+    (keyset по (day_of_month, id)), чтобы не держать весь список в памяти.
+    """
+    conn = get_connection()
+    after = (0, 0)
+    while True:
+        rows = conn.execute(
+            """
+            SELECT * FROM payments
+            WHERE user_id = ? AND active = 1 AND (day_of_month, id) > (?, ?)
+            ORDER BY day_of_month, id
+            LIMIT ?
+            """,
+            (user_id, *after, page_size),
+        ).fetchall()
+        yield from rows
+        if len(rows) < page_size:
+            return
+        after = (rows[-1]["day_of_month"], rows[-1]["id"])
+
+
+def get_total_minor(user_id: int, from_day: int = 1) -> int:
+    """
+    Сумма активных ежемесячных платежей с day_of_month >= from_day, в копейках.
+    Если сводка уже в кэше — по её префиксным суммам, иначе одним SUM
+    по индексу idx_payments_user_day, не читая сами строки платежей.
+    """
+    if _multiprocess:
+        sync_with_other_processes()
+    summary = get_cached_payment_summary(user_id)
+    if summary is not None:
+        return summary.remaining_from(from_day)
+    return get_connection().execute(
+        """
+        SELECT COALESCE(SUM(amount_minor), 0) FROM payments
+        WHERE user_id = ? AND active = 1 AND recurrence = 'monthly' AND day_of_month >= ?
+        """,
+        (user_id, from_day),
+    ).fetchone()[0]
+
+
+# Размер страницы при постраничном чтении напоминаний
+REMINDER_PAGE_SIZE = 1000
+
+
+def days_in_month(day: date) -> int:
+    return calendar.monthrange(day.year, day.month)[1]
+
+
+def effective_due_day(day_of_month: int, today: date) -> int:
+    """
+    День, на который платёж приходится в месяце today:
+    29–31 в коротких месяцах переносятся на последний день месяца.
+    """
+    return min(day_of_month, days_in_month(today))
+
+
+def get_payments_due_page(
+    today: date,
+    tz: str,
+    remind_hour: int,
+    after: tuple[int, int] = (0, 0),
+    limit: int = REMINDER_PAGE_SIZE,
+):
+    """
+    Страница платежей с next_due_date не позже today у пользователей
+    с часовым поясом tz и часом напоминаний remind_hour — при любой
+    периодичности это условие по индексу idx_payments_due, правила
+    повторения здесь не разбираются.
+    Строки упорядочены по (user_id, id), чтобы их можно было группировать на лету;
+    after — (user_id, id) последней строки предыдущей страницы (keyset-пагинация).
+    CROSS JOIN фиксирует порядок соединения: пользователи слота идут по
+    idx_users_slice в порядке id, поэтому ORDER BY обходится без сортировки
+    и каждая страница продолжает чтение с места, где остановилась предыдущая.
+    """
     conn = get_connection()
     cur = conn.cursor()
     cur.execute(
-        "SELECT SUM(amount) as total FROM payments WHERE user_id = ? AND active = 1",
-        (user_id,),
+        """
+        SELECT p.*, u.tg_id
+        FROM users u
+        CROSS JOIN payments p ON p.user_id = u.id
+        WHERE u.tz = ? AND u.remind_hour = ? AND u.id >= ?
+          AND p.active = 1 AND p.next_due_date <= ?
+          AND (p.user_id, p.id) > (?, ?)
+        ORDER BY u.id, p.id
+        LIMIT ?
+        """,
+        (tz, remind_hour, after[0], today.isoformat(), after[0], after[1], limit),
     )
-    row = cur.fetchone()
-    conn.close()
-    return row["total"] or 0.0
+    return cur.fetchall()
+
 
+def iter_payments_due(
+    today: date,
+    tz: str,
+    remind_hour: int,
+    after: tuple[int, int] = (0, 0),
+    page_size: int = REMINDER_PAGE_SIZE,
+):
+    """
+    Все платежи для напоминаний постранично, без загрузки всей выборки в память.
+    after — (user_id, id), после которого продолжить чтение.
+    """
+    while True:
+        rows = get_payments_due_page(today, tz, remind_hour, after, page_size)
+        yield from rows
+        if len(rows) < page_size:
+            return
+        after = (rows[-1]["user_id"], rows[-1]["id"])
+
+# --- Очередь напоминаний (outbox) ---
+#
+# status: pending — ждёт отправки, sent — отправлено, failed — попытки исчерпаны.
+# Взятая в работу запись остаётся pending, но next_retry_at сдвигается на время
+# аренды: если процесс упадёт посреди рассылки, запись снова станет доступной.
+
+
+def enqueue_reminders(items, advances=()) -> int:
+    """
+    Добавляет в outbox записи (user_id, tg_id, due_date, text) и в той же
+    транзакции переносит next_due_date платежей: advances — (новая дата, payment_id).
+    Повторная постановка того же пользователя на ту же дату игнорируется.
+    Возвращает число добавленных записей.
+    """
+    conn = get_connection()
+    with conn:
+        cur = conn.executemany(
+            """
+            INSERT OR IGNORE INTO reminder_outbox (user_id, tg_id, due_date, text, next_retry_at)
+            VALUES (?, ?, ?, ?, CAST(strftime('%s', 'now') AS INTEGER))
+            """,
+            items,
+        )
+        added = cur.rowcount
+        conn.executemany("UPDATE payments SET next_due_date = ? WHERE id = ?", advances)
+    # сводки не сбрасываем: в них next_due_date не используется
+    return added
 
-def get_remaining_total_for_user(user_id: int, today: date | None = None) -> float:
-    if today is None:
-        today = date.today()
-    day = today.day
 
+def is_reminder_run_finished(tz: str, remind_hour: int, due_date: str) -> bool:
     conn = get_connection()
     cur = conn.cursor()
     cur.execute(
+        "SELECT 1 FROM reminder_runs WHERE tz = ? AND remind_hour = ? AND due_date = ?",
+        (tz, remind_hour, due_date),
+    )
+    return cur.fetchone() is not None
+
+
+def mark_reminder_run_finished(tz: str, remind_hour: int, due_date: str, now: int):
+    conn = get_connection()
+    conn.execute(
         """
-        SELECT SUM(amount) as total
-        FROM payments
-        WHERE user_id = ? AND active = 1 AND day_of_month >= ?
+        INSERT OR IGNORE INTO reminder_runs (tz, remind_hour, due_date, finished_at)
+        VALUES (?, ?, ?, ?)
         """,
-        (user_id, day),
+        (tz, remind_hour, due_date, now),
     )
-    row = cur.fetchone()
-    conn.close()
-    return row["total"] or 0.0
+    conn.commit()
 
 
-def get_payments_for_day(day: int):
+def claim_outbox_batch(
+    now: int,
+    limit: int,
+    lease_seconds: int,
+    partition: tuple[int, int] = (0, 1),
+    takeover_after: int = 300,
+):
     """
-    Платежи для напоминаний: все платежи с таким day_of_month.
+    Забирает в работу до limit записей, которые пора отправлять.
+    partition = (номер, всего): процесс берёт только своих пользователей
+    (user_id % всего = номер), а чужие — лишь если они ждут дольше
+    takeover_after секунд (их процесс, видимо, остановлен).
     """
     conn = get_connection()
     cur = conn.cursor()
     cur.execute(
         """
-        SELECT p.*, u.tg_id
-        FROM payments p
-        JOIN users u ON p.user_id = u.id
-        WHERE p.active = 1 AND p.day_of_month = ?
+        UPDATE reminder_outbox
+        SET attempts = attempts + 1, next_retry_at = ?
+        WHERE id IN (
+            SELECT id FROM reminder_outbox
+            WHERE status = 'pending' AND next_retry_at <= ?
+              AND (user_id % ? = ? OR next_retry_at <= ?)
+            ORDER BY next_retry_at, id
+            LIMIT ?
+        )
+        RETURNING *
         """,
-        (day,),
+        (now + lease_seconds, now, partition[1], partition[0], now - takeover_after, limit),
     )
     rows = cur.fetchall()
-    conn.close()
+    conn.commit()
     return rows
 
+
+def mark_outbox_sent(outbox_id: int, now: int):
+    conn = get_connection()
+    conn.execute(
+        "UPDATE reminder_outbox SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?",
+        (now, outbox_id),
+    )
+    conn.commit()
+
+
+def mark_outbox_failed(outbox_id: int, error: str, next_retry_at: int | None):
+    """
+    next_retry_at = None — больше не пытаться (status = 'failed').
+    """
+    conn = get_connection()
+    if next_retry_at is None:
+        conn.execute(
+            "UPDATE reminder_outbox SET status = 'failed', last_error = ? WHERE id = ?",
+            (error, outbox_id),
+        )
+    else:
+        conn.execute(
+            "UPDATE reminder_outbox SET next_retry_at = ?, last_error = ? WHERE id = ?",
+            (next_retry_at, error, outbox_id),
+        )
+    conn.commit()
+
+
+# --- Аренды (leader lock) ---
+
+
+def try_acquire_lease(name: str, owner: str, now: int, ttl: int) -> bool:
+    """
+    Берёт или продлевает аренду name на ttl секунд.
+    Удаётся, если аренды нет, она уже у owner или истекла.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+        ON CONFLICT(name) DO UPDATE
+        SET owner = excluded.owner, expires_at = excluded.expires_at
+        WHERE leases.owner = excluded.owner OR leases.expires_at < ?
+        """,
+        (name, owner, now + ttl, now),
+    )
+    conn.commit()
+    return cur.rowcount > 0
+
+
+def release_lease(name: str, owner: str):
+    conn = get_connection()
+    conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+    conn.commit()
+
+
+# --- Хранилище FSM ---
+
+
+def fsm_load(key: str, not_before: int):
+    """
+    Строка (state, data) по ключу; записи старше not_before считаются истёкшими.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT state, data FROM fsm_storage WHERE key = ? AND updated_at >= ?",
+        (key, not_before),
+    )
+    return cur.fetchone()
+
+
+def fsm_save(entries, now: int):
+    """
+    Сохраняет накопленные изменения одной транзакцией.
+    entries — пары (key, changes), где changes содержит "state" и/или "data" (JSON).
+    Пустые записи (без состояния и данных) удаляются.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    for key, changes in entries:
+        columns = [column for column in ("state", "data") if column in changes]
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns)
+        cur.execute(
+            f"""
+            INSERT INTO fsm_storage (key, {", ".join(columns)}, updated_at)
+            VALUES (?, {", ".join("?" for _ in columns)}, ?)
+            ON CONFLICT(key) DO UPDATE SET {updates}, updated_at = excluded.updated_at
+            """,
+            (key, *(changes[column] for column in columns), now),
+        )
+        cur.execute(
+            "DELETE FROM fsm_storage WHERE key = ? AND state IS NULL AND data = '{}'",
+            (key,),
+        )
+    conn.commit()
+
+
+def purge_fsm_storage(before: int, batch_size: int = 1000) -> int:
+    """
+    Удаляет состояния, не менявшиеся с before, порциями по batch_size,
+    чтобы не держать блокировку записи долго.
+    """
+    conn = get_connection()
+    total = 0
+    while True:
+        cur = conn.execute(
+            """
+            DELETE FROM fsm_storage
+            WHERE key IN (SELECT key FROM fsm_storage WHERE updated_at < ? LIMIT ?)
+            """,
+            (before, batch_size),
+        )
+        conn.commit()
+        total += cur.rowcount
+        if cur.rowcount < batch_size:
+            return total
+
+
 def get_payment_by_id(user_id: int, payment_id: int):
     conn = get_connection()
     cur = conn.cursor()
@@ -144,57 +1020,325 @@ def get_payment_by_id(user_id: int, payment_id: int):
         (payment_id, user_id),
     )
     row = cur.fetchone()
-    conn.close()
     return row
 
 
 def delete_payment(user_id: int, payment_id: int) -> bool:
+    """
+    Мягкое удаление: платёж помечается active = 0 и пропадает из всех выборок,
+    а физически строку позже удаляет compact_deleted_payments.
+    """
     conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
+    cur = conn.execute(
         """
-        DELETE FROM payments
-        WHERE id = ? AND user_id = ?
+        UPDATE payments
+        SET active = 0, deleted_at = strftime('%s', 'now')
+        WHERE id = ? AND user_id = ? AND active = 1
         """,
         (payment_id, user_id),
     )
-    conn.commit()
     deleted = cur.rowcount > 0
-    conn.close()
+    if deleted:
+        # неоплаченный платёж этого месяца больше не нужен; история прошлых остаётся
+        conn.execute(
+            "DELETE FROM payment_instances WHERE payment_id = ? AND month >= ? AND paid_at IS NULL",
+            (payment_id, month_key(user_today(user_id))),
+        )
+    conn.commit()
+    if deleted:
+        invalidate_payment_summary(user_id)
     return deleted
 
 
-
-def update_payment(user_id: int, payment_id: int, title: str, amount: float, day_of_month: int) -> bool:
+def _update_payment_field(user_id: int, payment_id: int, column: str, value):
+    """
+    Меняет одно поле активного платежа одним запросом и возвращает
+    обновлённую строку (None, если платёж не найден или удалён).
+    column подставляется в SQL, поэтому сюда передаются только имена
+    из функций ниже, а не ввод пользователя.
+    """
     conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
+    row = conn.execute(
+        f"""
         UPDATE payments
-        SET title = ?, amount = ?, day_of_month = ?
+        SET {column} = ?
         WHERE id = ? AND user_id = ? AND active = 1
+        RETURNING *
         """,
-        (title, amount, day_of_month, payment_id, user_id),
+        (value, payment_id, user_id),
+    ).fetchone()
+    conn.commit()
+    if row is not None:
+        invalidate_payment_summary(user_id)
+    return row
+
+
+def update_payment_title(user_id: int, payment_id: int, title: str):
+    return _update_payment_field(user_id, payment_id, "title", title)
+
+
+def update_payment_amount(user_id: int, payment_id: int, amount: Decimal):
+    return _update_payment_field(user_id, payment_id, "amount_minor", to_minor(amount))
+
+
+def update_payment_day(user_id: int, payment_id: int, day_of_month: int):
+    """
+    Меняет число месяца и пересчитывает ближайшую дату; у еженедельных
+    платежей числа месяца нет — для них None.
+    """
+    conn = get_connection()
+    with conn:
+        row = conn.execute(
+            """
+            UPDATE payments SET day_of_month = ?
+            WHERE id = ? AND user_id = ? AND active = 1 AND recurrence != 'weekly'
+            RETURNING *
+            """,
+            (day_of_month, payment_id, user_id),
+        ).fetchone()
+        if row is None:
+            return None
+        next_due = recurrence.next_due(schedule_of(row), user_today(user_id))
+        row = conn.execute(
+            "UPDATE payments SET next_due_date = ? WHERE id = ? RETURNING *",
+            (next_due.isoformat(), payment_id),
+        ).fetchone()
+    invalidate_payment_summary(user_id)
+    return row
+
+
+# --- Платежи по месяцам: оплачен / не оплачен ---
+
+
+def month_key(day: date) -> str:
+    return f"{day:%Y-%m}"
+
+
+# Неоплаченный платёж месяца month повторяет текущий шаблон платежа;
+# оплаченный больше не меняется, даже если шаблон отредактировали.
+# Попадёт ли платёж в месяц, решает само правило, а не next_due_date
+# (её сдвигает рассылка): квартальные — в месяцы с тем же остатком от
+# деления на 3, что у опорного, годовые — в месяц опорной даты; число
+# переносится на последний день короткого месяца, как в recurrence.next_due.
+# Еженедельные (несколько раз в месяц) по месяцам не отмечаются.
+_MATERIALIZE_SQL = """
+    INSERT INTO payment_instances (payment_id, user_id, month, due_date, title, amount_minor)
+    SELECT
+        id, user_id, :month, printf('%s-%02d', :month, min(day_of_month, :days)),
+        title, amount_minor
+    FROM payments
+    WHERE active = 1 AND {condition}
+        AND (
+            recurrence = 'monthly'
+            OR recurrence = 'quarterly' AND (:month_number - CAST(substr(anchor_date, 6, 2) AS INTEGER)) % 3 = 0
+            OR recurrence = 'yearly' AND CAST(substr(anchor_date, 6, 2) AS INTEGER) = :month_number
+        )
+    ON CONFLICT (payment_id, month) DO UPDATE SET
+        due_date = excluded.due_date,
+        title = excluded.title,
+        amount_minor = excluded.amount_minor
+    WHERE paid_at IS NULL
+        AND (due_date, title, amount_minor) IS NOT (excluded.due_date, excluded.title, excluded.amount_minor)
+"""
+
+
+def _month_params(today: date) -> dict:
+    return {"month": month_key(today), "month_number": today.month, "days": days_in_month(today)}
+
+
+def materialize_month(user_id: int, today: date):
+    """
+    Заводит платежи пользователя за месяц today в payment_instances
+    (и обновляет неоплаченные после правок). Пока платежи не менялись,
+    повторный вызов за тот же месяц в БД не ходит.
+    """
+    month = month_key(today)
+    if _multiprocess:
+        sync_with_other_processes()
+    if _materialized_months.get(user_id) == month:
+        return
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            _MATERIALIZE_SQL.format(condition="user_id = :user_id"),
+            {**_month_params(today), "user_id": user_id},
+        )
+    _materialized_months.set(user_id, month)
+
+
+def materialize_month_batch(
+    today: date, zones: list[str], after_user_id: int, batch_size: int = 500
+) -> int | None:
+    """
+    То же для пользователей из часовых поясов zones (у них сейчас today),
+    порциями: пользователи с id > after_user_id, не больше batch_size id за раз.
+    Возвращает id последнего обработанного пользователя или None, если всё.
+    """
+    conn = get_connection()
+    last = conn.execute(
+        "SELECT max(id) FROM (SELECT id FROM users WHERE id > ? ORDER BY id LIMIT ?)",
+        (after_user_id, batch_size),
+    ).fetchone()[0]
+    if last is None:
+        return None
+    marks = ", ".join(f":tz{number}" for number in range(len(zones)))
+    condition = (
+        "user_id IN (SELECT id FROM users WHERE id > :after AND id <= :last"
+        f" AND tz IN ({marks}))"
     )
+    with conn:
+        conn.execute(
+            _MATERIALIZE_SQL.format(condition=condition),
+            {
+                **_month_params(today),
+                **{f"tz{number}": tz for number, tz in enumerate(zones)},
+                "after": after_user_id,
+                "last": last,
+            },
+        )
+    return last
+
+
+def get_month_summary(user_id: int, month: str):
+    """
+    Итоги месяца из monthly_summary (None, если платежей в месяце не было).
+    """
+    return get_connection().execute(
+        "SELECT * FROM monthly_summary WHERE user_id = ? AND month = ?",
+        (user_id, month),
+    ).fetchone()
+
+
+def get_unpaid_instances(user_id: int, month: str, limit: int):
+    return get_connection().execute(
+        """
+        SELECT * FROM payment_instances
+        WHERE user_id = ? AND month = ? AND paid_at IS NULL
+        ORDER BY due_date, id
+        LIMIT ?
+        """,
+        (user_id, month, limit),
+    ).fetchall()
+
+
+def get_weekly_totals(user_id: int):
+    """
+    Число еженедельных платежей и их сумма за неделю: по месяцам они
+    не отмечаются, и экран остатка только сообщает о них.
+    """
+    return get_connection().execute(
+        """
+        SELECT count(*) AS payments_count, coalesce(sum(amount_minor), 0) AS total_minor
+        FROM payments
+        WHERE user_id = ? AND active = 1 AND recurrence = 'weekly'
+        """,
+        (user_id,),
+    ).fetchone()
+
+
+def get_month_totals(user_id: int):
+    """
+    Итоги месяца без списка неоплаченных — для сводки: заводит платежи месяца
+    (месяц — по часовому поясу пользователя) и возвращает
+    (сегодня, итоги месяца или None, итоги еженедельных).
+    """
+    today = user_today(user_id)
+    materialize_month(user_id, today)
+    return today, get_month_summary(user_id, month_key(today)), get_weekly_totals(user_id)
+
+
+def get_month_view(user_id: int, limit: int):
+    """
+    Всё для экрана остатка за один заход в поток БД: то же, что
+    get_month_totals, и до limit неоплаченных платежей месяца —
+    (сегодня, итоги месяца или None, неоплаченные, итоги еженедельных).
+    """
+    today, summary, weekly = get_month_totals(user_id)
+    return today, summary, get_unpaid_instances(user_id, month_key(today), limit), weekly
+
+
+def mark_instance_paid(user_id: int, instance_id: int, paid_at: int):
+    """
+    Отмечает платёж месяца оплаченным; None — если не найден или уже оплачен.
+    """
+    conn = get_connection()
+    row = conn.execute(
+        """
+        UPDATE payment_instances SET paid_at = ?
+        WHERE id = ? AND user_id = ? AND paid_at IS NULL
+        RETURNING *
+        """,
+        (paid_at, instance_id, user_id),
+    ).fetchone()
     conn.commit()
-    updated = cur.rowcount > 0
-    conn.close()
-    return updated
+    return row
 
-def cleanup_inactive_payments() -> int:
+
+def get_month_history(user_id: int, limit: int = 12):
     """
-    Удаляет из таблицы payments все записи с active = 0.
-    Возвращает количество удалённых записей.
+    Итоги последних limit месяцев, начиная с последнего.
+    """
+    return get_connection().execute(
+        """
+        SELECT * FROM monthly_summary
+        WHERE user_id = ? AND payments_count > 0
+        ORDER BY month DESC
+        LIMIT ?
+        """,
+        (user_id, limit),
+    ).fetchall()
+
+
+# Сколько страниц файла возвращать за один PRAGMA incremental_vacuum
+VACUUM_PAGES = 200
+
+
+def _incremental_vacuum(conn: sqlite3.Connection):
+    # PRAGMA возвращает строку на каждую освобождённую страницу, их нужно дочитать
+    conn.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES})").fetchall()
+
+
+def compact_deleted_payments(before: int, batch_size: int = 500) -> int:
+    """
+    Физически удаляет не больше batch_size платежей, удалённых раньше before,
+    и возвращает ОС часть освободившихся страниц.
+    Одна порция — одна короткая транзакция; повторять, пока возвращается batch_size.
+    В кэше только активные платежи, поэтому он не затрагивается.
     """
     conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
+    cur = conn.execute(
         """
         DELETE FROM payments
-        WHERE active = 0
+        WHERE id IN (
+            SELECT id FROM payments
+            WHERE active = 0 AND deleted_at < ?
+            LIMIT ?
+        )
+        """,
+        (before, batch_size),
+    )
+    conn.commit()
+    _incremental_vacuum(conn)
+    return cur.rowcount
+
+
+def purge_reminder_outbox(before: int, batch_size: int = 500) -> int:
+    """
+    Удаляет не больше batch_size отправленных или брошенных напоминаний,
+    созданных раньше before. Повторять, пока возвращается batch_size.
+    """
+    conn = get_connection()
+    cur = conn.execute(
         """
+        DELETE FROM reminder_outbox
+        WHERE id IN (
+            SELECT id FROM reminder_outbox
+            WHERE status != 'pending' AND created_at < ?
+            LIMIT ?
+        )
+        """,
+        (before, batch_size),
     )
     conn.commit()
-    deleted = cur.rowcount
-    conn.close()
-    return deleted
+    _incremental_vacuum(conn)
+    return cur.rowcount
@@ -0,0 +1,190 @@
+# db_async.py
+"""
+Асинхронная обёртка над db.py.
+
+Все обращения к SQLite выполняются в одном выделенном потоке (очередь задач
+ThreadPoolExecutor), поэтому обработчики aiogram не блокируют event loop,
+пока идёт запись на диск.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+
+import db
+from money import from_minor
+from recurrence import Schedule
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+
+
+async def run_in_db_thread(func, *args, **kwargs):
+    """
+    Выполняет синхронную функцию из db.py в потоке БД и ждёт результат.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+async def shutdown_db():
+    """
+    Дожидается завершения уже поставленных в очередь запросов,
+    останавливает поток БД и закрывает соединения.
+    """
+    await asyncio.get_running_loop().run_in_executor(None, _executor.shutdown, True)
+    db.close_connections()
+
+
+async def init_db():
+    await run_in_db_thread(db.init_db)
+
+
+async def get_or_create_user(tg_id: int) -> int:
+    # при попадании в кэш не уходим в поток БД вовсе
+    user_id = db.get_cached_user_id(tg_id)
+    if user_id is not None:
+        return user_id
+    return await run_in_db_thread(db.upsert_user, tg_id)
+
+
+async def get_user_settings(user_id: int):
+    return await run_in_db_thread(db.get_user_settings, user_id)
+
+
+async def user_today(user_id: int) -> date:
+    return await run_in_db_thread(db.user_today, user_id)
+
+
+async def set_user_timezone(user_id: int, tz: str):
+    await run_in_db_thread(db.set_user_timezone, user_id, tz)
+
+
+async def set_user_remind_hour(user_id: int, hour: int):
+    await run_in_db_thread(db.set_user_remind_hour, user_id, hour)
+
+
+async def get_reminder_slices() -> list[tuple[str, int]]:
+    return await run_in_db_thread(db.get_reminder_slices)
+
+
+async def add_payment(user_id: int, title: str, amount: Decimal, schedule: Schedule):
+    await run_in_db_thread(db.add_payment, user_id, title, amount, schedule)
+
+
+async def add_payments(user_id: int, payments) -> int:
+    return await run_in_db_thread(db.add_payments, user_id, payments)
+
+
+async def get_payment_summary(user_id: int) -> db.PaymentSummary:
+    if db.is_multiprocess_mode():
+        # кэш надо сверить с базой, а это запрос на соединении потока БД
+        return await run_in_db_thread(db.get_payment_summary, user_id)
+    # сводка из кэша читается прямо в event loop, в поток БД идём только за промахом
+    summary = db.get_cached_payment_summary(user_id)
+    if summary is None:
+        summary = await run_in_db_thread(db.load_payment_summary, user_id)
+    return summary
+
+
+async def get_payments_page(user_id: int, offset: int, limit: int):
+    return await run_in_db_thread(db.get_payments_page, user_id, offset, limit)
+
+
+async def get_total_minor(user_id: int, from_day: int = 1) -> int:
+    if not db.is_multiprocess_mode():
+        summary = db.get_cached_payment_summary(user_id)
+        if summary is not None:
+            return summary.remaining_from(from_day)
+    return await run_in_db_thread(db.get_total_minor, user_id, from_day)
+
+
+async def get_month_total_for_user(user_id: int) -> Decimal:
+    return from_minor(await get_total_minor(user_id))
+
+
+async def claim_outbox_batch(
+    now: int,
+    limit: int,
+    lease_seconds: int,
+    partition: tuple[int, int] = (0, 1),
+):
+    return await run_in_db_thread(db.claim_outbox_batch, now, limit, lease_seconds, partition)
+
+
+async def try_acquire_lease(name: str, owner: str, now: int, ttl: int) -> bool:
+    return await run_in_db_thread(db.try_acquire_lease, name, owner, now, ttl)
+
+
+async def release_lease(name: str, owner: str):
+    await run_in_db_thread(db.release_lease, name, owner)
+
+
+async def mark_outbox_sent(outbox_id: int, now: int):
+    await run_in_db_thread(db.mark_outbox_sent, outbox_id, now)
+
+
+async def mark_outbox_failed(outbox_id: int, error: str, next_retry_at: int | None):
+    await run_in_db_thread(db.mark_outbox_failed, outbox_id, error, next_retry_at)
+
+
+async def fsm_load(key: str, not_before: int):
+    return await run_in_db_thread(db.fsm_load, key, not_before)
+
+
+async def fsm_save(entries, now: int):
+    await run_in_db_thread(db.fsm_save, entries, now)
+
+
+async def purge_fsm_storage(before: int) -> int:
+    return await run_in_db_thread(db.purge_fsm_storage, before)
+
+
+async def get_payment_by_id(user_id: int, payment_id: int):
+    return await run_in_db_thread(db.get_payment_by_id, user_id, payment_id)
+
+
+async def delete_payment(user_id: int, payment_id: int) -> bool:
+    return await run_in_db_thread(db.delete_payment, user_id, payment_id)
+
+
+async def update_payment_title(user_id: int, payment_id: int, title: str):
+    return await run_in_db_thread(db.update_payment_title, user_id, payment_id, title)
+
+
+async def update_payment_amount(user_id: int, payment_id: int, amount: Decimal):
+    return await run_in_db_thread(db.update_payment_amount, user_id, payment_id, amount)
+
+
+async def update_payment_day(user_id: int, payment_id: int, day_of_month: int):
+    return await run_in_db_thread(db.update_payment_day, user_id, payment_id, day_of_month)
+
+
+async def materialize_month_batch(
+    today: date, zones: list[str], after_user_id: int, batch_size: int = 500
+) -> int | None:
+    return await run_in_db_thread(db.materialize_month_batch, today, zones, after_user_id, batch_size)
+
+
+async def get_month_totals(user_id: int):
+    return await run_in_db_thread(db.get_month_totals, user_id)
+
+
+async def get_month_view(user_id: int, limit: int):
+    return await run_in_db_thread(db.get_month_view, user_id, limit)
+
+
+async def mark_instance_paid(user_id: int, instance_id: int, paid_at: int):
+    return await run_in_db_thread(db.mark_instance_paid, user_id, instance_id, paid_at)
+
+
+async def get_month_history(user_id: int, limit: int = 12):
+    return await run_in_db_thread(db.get_month_history, user_id, limit)
+
+
+async def compact_deleted_payments(before: int, batch_size: int = 500) -> int:
+    return await run_in_db_thread(db.compact_deleted_payments, before, batch_size)
+
+
+async def purge_reminder_outbox(before: int, batch_size: int = 500) -> int:
+    return await run_in_db_thread(db.purge_reminder_outbox, before, batch_size)
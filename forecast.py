@@ -0,0 +1,63 @@
+# forecast.py
+"""
+Прогноз расходов на несколько месяцев вперёд по сводке платежей.
+Для каждой длины месяца (28–31 день) суммы ежемесячных платежей по дням
+берутся из PaymentSummary.daily_outflow, так что прогноз — это склейка
+готовых массивов и накопленная сумма по ним, без перебора платежей по дням;
+еженедельные, квартальные и годовые добавляются по своим датам.
+"""
+from datetime import date, timedelta
+from itertools import accumulate
+
+from db import PaymentSummary, days_in_month
+from recurrence import occurrences, schedule_of
+
+MAX_FORECAST_MONTHS = 12
+
+
+def add_months(day: date, months: int) -> date:
+    """
+    Та же дата через months месяцев; 29–31 в коротком месяце — последний день.
+    """
+    year, month = divmod(day.month - 1 + months, 12)
+    target = date(day.year + year, month + 1, 1)
+    return target.replace(day=min(day.day, days_in_month(target)))
+
+
+def project(summary: PaymentSummary, start: date, months: int) -> list[int]:
+    """
+    Расходы нарастающим итогом по дням с start (включительно) на months
+    месяцев вперёд (до той же даты, не включая её): элемент i — сумма
+    в копейках к концу дня start + i.
+    """
+    end = add_months(start, months)
+    daily = []
+    day = start
+    while day < end:
+        length = days_in_month(day)
+        last = end.day - 1 if (day.year, day.month) == (end.year, end.month) else length
+        daily.extend(summary.daily_outflow(length)[day.day - 1:last])
+        day = day.replace(day=length) + timedelta(days=1)
+    # неежемесячных платежей немного: их даты просто раскладываются по дням
+    for row in summary.others:
+        for due in occurrences(schedule_of(row), start, end):
+            daily[(due - start).days] += row["amount_minor"]
+    return list(accumulate(daily))
+
+
+def split_by_month(start: date, cumulative: list[int]) -> list[tuple[date, int, int]]:
+    """
+    Итоги прогноза по календарным месяцам:
+    (первый день месяца в прогнозе, расходы за месяц, нарастающий итог на конец).
+    """
+    result = []
+    day = start
+    i = 0
+    previous = 0
+    while i < len(cumulative):
+        i = min(i + days_in_month(day) - day.day + 1, len(cumulative))
+        result.append((day, cumulative[i - 1] - previous, cumulative[i - 1]))
+        previous = cumulative[i - 1]
+        day = day.replace(day=1) + timedelta(days=32)
+        day = day.replace(day=1)
+    return result
@@ -0,0 +1,109 @@
+# fsm_storage.py
+"""
+Хранилище состояний FSM в той же SQLite-базе вместо MemoryStorage:
+незавершённые диалоги переживают перезапуск и доступны всем процессам бота.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from db_async import fsm_load, fsm_save, purge_fsm_storage
+
+# Через сколько секунд без изменений состояние считается брошенным
+STATE_TTL = 24 * 60 * 60
+# Сколько секунд копить изменения перед записью в БД
+FLUSH_DELAY = 0.05
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Изменения сначала копятся в памяти и через flush_delay секунд пишутся
+    в БД одной транзакцией: set_state + update_data одного обработчика
+    превращаются в одну запись. Пока изменение не записано, чтения этого
+    ключа отдаются из памяти, всё остальное читается из БД, поэтому
+    несколько процессов видят общие состояния.
+    flush_delay=0 — писать сразу, без накопления.
+    """
+
+    def __init__(self, ttl: int = STATE_TTL, flush_delay: float = FLUSH_DELAY):
+        self.ttl = ttl
+        self.flush_delay = flush_delay
+        self._pending: dict[str, dict[str, Any]] = {}
+        self._flush_task: asyncio.Task | None = None
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ":".join(
+            str(part)
+            for part in (
+                key.bot_id,
+                key.chat_id,
+                key.user_id,
+                key.thread_id,
+                getattr(key, "business_connection_id", None),
+                key.destiny,
+            )
+        )
+
+    async def _write(self, key: StorageKey, field: str, value):
+        self._pending.setdefault(self._key(key), {})[field] = value
+        if self.flush_delay <= 0:
+            await self.flush()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _read(self, key: StorageKey, field: str):
+        pending = self._pending.get(self._key(key))
+        if pending is not None and field in pending:
+            return pending[field]
+        row = await fsm_load(self._key(key), int(time.time()) - self.ttl)
+        if row is None:
+            return None if field == "state" else "{}"
+        return row[field]
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_delay)
+        self._flush_task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logging.error(f"Ошибка записи состояний FSM: {e}")
+
+    async def flush(self):
+        if not self._pending:
+            return
+        # новые изменения, пришедшие во время записи, попадут в следующую порцию;
+        # чтения идут через тот же поток БД после этой записи, так что не устаревают
+        entries, self._pending = list(self._pending.items()), {}
+        await fsm_save(entries, int(time.time()))
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        if isinstance(state, State):
+            state = state.state
+        await self._write(key, "state", state)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return await self._read(key, "state")
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        await self._write(key, "data", json.dumps(data, ensure_ascii=False))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return json.loads(await self._read(key, "data"))
+
+    async def purge_expired(self) -> int:
+        """
+        Удаляет брошенные состояния. Вызывается по расписанию.
+        """
+        return await purge_fsm_storage(int(time.time()) - self.ttl)
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
@@ -1,18 +1,28 @@
 # main.py
+import argparse
 import asyncio
 import logging
+import multiprocessing
 import os
-from datetime import datetime, date
+import signal
+import socket
+import time
+from datetime import datetime, date, timedelta, timezone
+from decimal import Decimal
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 from aiogram import Bot, Dispatcher, F, Router
 from aiogram.filters import CommandStart, Command
 from aiogram.types import Message
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
-from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import CallbackQuery, FSInputFile
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 
 
 
@@ -20,19 +30,63 @@ from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardBut
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
-from db import (
+from db_async import (
     init_db,
     get_or_create_user,
     add_payment,
-    get_payments_for_user,
+    add_payments,
+    get_payment_summary,
+    get_payments_page,
     get_month_total_for_user,
-    get_remaining_total_for_user,
-    get_payments_for_day,
+    get_month_totals,
+    get_month_view,
+    mark_instance_paid,
+    get_month_history,
+    materialize_month_batch,
     get_payment_by_id,
     delete_payment,
-    update_payment,
-    cleanup_inactive_payments,  # <-- добавили
+    update_payment_title,
+    update_payment_amount,
+    update_payment_day,
+    compact_deleted_payments,
+    purge_reminder_outbox,
+    get_user_settings,
+    user_today,
+    set_user_timezone,
+    set_user_remind_hour,
+    get_reminder_slices,
+    try_acquire_lease,
+    release_lease,
+    shutdown_db,
 )
+from db import enable_multiprocess_mode, prepare_database
+
+from callbacks import Action, PaymentCb, decode_callback
+from money import format_amount, to_minor
+from recurrence import WEEKLY, schedule_of
+from validators import parse_amount, parse_day, parse_schedule, parse_title
+from render import (
+    NO_PAYMENTS_TEXT,
+    build_back_to_list_kb,
+    build_confirm_delete_kb,
+    build_dashboard_parts,
+    build_dashboard_text,
+    build_edit_page_kb,
+    build_edit_page_text,
+    build_list_edit_kb,
+    build_list_text,
+    build_payment_inline_kb,
+    build_payment_text,
+    build_schedule_text,
+    build_rest_kb,
+    build_rest_text,
+    build_history_text,
+    build_forecast_text,
+)
+from forecast import MAX_FORECAST_MONTHS, add_months, project, split_by_month
+from fsm_storage import FLUSH_DELAY, SQLiteStorage
+from payments_io import MAX_IMPORT_BYTES, MAX_REPORTED_ERRORS, export_payments, parse_import
+from reminders import GLOBAL_RATE, ReminderDispatcher, drain_outbox, due_reminder_slots, fill_outbox
 
 from dotenv import load_dotenv
 from html import escape
@@ -41,6 +95,47 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+# Свой сервер Bot API (например, локальный telegram-bot-api); по умолчанию api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+# Режим webhook (BOT_MODE=webhook или --mode webhook)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # публичный адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SHUTDOWN_TIMEOUT = 30
+
+# Аренда ведущего процесса: только он ставит рассылку в очередь и чистит FSM
+LEADER_LEASE = "scheduler"
+LEADER_LEASE_SECONDS = 180
+
+# Платежей на одной странице редактора
+EDIT_PAGE_SIZE = 8
+
+# Шаг планировщика напоминаний, минут
+REMINDER_SLICE_MINUTES = 15
+
+# На сколько месяцев /forecast без аргумента
+DEFAULT_FORECAST_MONTHS = 3
+
+# Сколько неоплаченных платежей показывать в /rest (по кнопке на каждый)
+# и сколько месяцев в /history
+REST_MAX_UNPAID = 20
+HISTORY_MONTHS = 12
+
+# Telegram id через запятую: кому доступна /cleanup
+ADMIN_IDS = {int(tg_id) for tg_id in os.getenv("ADMIN_IDS", "").split(",") if tg_id.strip()}
+
+# Очистка базы: сколько дней хранить удалённые платежи и отработанные
+# напоминания, во сколько (UTC) запускаться, размер порции и пауза между ними
+PAYMENT_RETENTION_DAYS = 30
+OUTBOX_RETENTION_DAYS = 14
+COMPACT_HOUR_UTC = 3
+COMPACT_BATCH = 500
+COMPACT_PAUSE = 0.2
+# Пользователей за одну порцию при заведении платежей месяца
+MATERIALIZE_BATCH = 500
 
 main_kb = ReplyKeyboardMarkup(
     keyboard=[
@@ -53,6 +148,7 @@ main_kb = ReplyKeyboardMarkup(
         ],
         [
             KeyboardButton(text="💰 Остаток"),
+            KeyboardButton(text="📊 Сводка"),
         ],
     ],
     resize_keyboard=True,  # чтобы клавиатура была компактной
@@ -72,225 +168,388 @@ class EditPaymentForm(StatesGroup):
 
 async def cmd_cleanup(message: Message):
     """
-    Удаляет все неактивные платежи (active = 0) из БД.
+    Сразу удаляет из БД все мягко удалённые платежи (только для админов).
+    Обычно это делает ночная очистка compact_database.
     """
-    # По-хорошему, имеет смысл ограничить команду только админом/тобой.
-    # Пока сделаем для всех, кто её вызвал.
-    deleted = cleanup_inactive_payments()
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("Команда доступна только администратору.")
+        return
+
+    deleted = await compact_payments(int(time.time()))
     if deleted == 0:
-        await message.answer("Не найдено неактивных платежей для очистки.")
+        await message.answer("Не найдено удалённых платежей для очистки.")
     else:
-        await message.answer(f"Удалено неактивных платежей: {deleted}")
+        await message.answer(f"Удалено из базы платежей: {deleted}")
 
 
 async def cmd_start(message: Message):
-    get_or_create_user(message.from_user.id)
+    await get_or_create_user(message.from_user.id)
     text = (
         "Привет! Я бот для управления регулярными платежами.\n\n"
         "Можешь пользоваться кнопками внизу или командами:\n"
         "/add — добавить платеж\n"
         "/list — список платежей\n"
         "/month — общая сумма в месяц\n"
-        "/rest — сумма оставшихся платежей в этом месяце\n"
+        "/rest — что осталось оплатить в этом месяце; отметить оплаченное\n"
+        "/history — оплаты по месяцам\n"
+        "/forecast N — прогноз платежей на N месяцев вперёд\n"
+        "/dashboard — всё сразу: список, суммы и ближайший платёж\n"
+        "/tz — часовой пояс для напоминаний\n"
+        "/remind — час, в который приходят напоминания\n"
+        "/import, /export — загрузить или выгрузить платежи файлом\n"
     )
     await message.answer(text, reply_markup=main_kb)
 
 
 
 async def cmd_add(message: Message, state: FSMContext):
-    user_id = get_or_create_user(message.from_user.id)
+    user_id = await get_or_create_user(message.from_user.id)
     await state.update_data(user_id=user_id)
     await message.answer("Введите название платежа (например: Аренда, Интернет):")
     await state.set_state(AddPaymentForm.title)
 
 
 async def add_title(message: Message, state: FSMContext):
-    await state.update_data(title=message.text.strip())
+    try:
+        title = parse_title(message.text)
+    except ValueError as e:
+        await message.answer(f"{e} Введите ещё раз:")
+        return
+
+    await state.update_data(title=title)
     await message.answer("Введите сумму (например: 15000.50):")
     await state.set_state(AddPaymentForm.amount)
 
 
 async def add_amount(message: Message, state: FSMContext):
-    text = message.text.replace(",", ".").strip()
     try:
-        amount = float(text)
-    except ValueError:
-        await message.answer("Не получилось распознать сумму. Попробуйте ещё раз (пример: 15000.50)")
-        return
-
-    if amount <= 0:
-        await message.answer("Сумма должна быть больше нуля. Введите ещё раз:")
+        amount = parse_amount(message.text)
+    except ValueError as e:
+        await message.answer(f"{e} Введите ещё раз:")
         return
 
-    await state.update_data(amount=amount)
-    await message.answer("Введите число месяца, когда нужно платить (1–31):")
+    # в состоянии FSM только JSON-типы: сумму храним строкой
+    await state.update_data(amount=str(amount))
+    await message.answer(
+        "Введите число месяца, когда нужно платить (1–31).\n"
+        "Если в месяце меньше дней, напомню в последний день месяца.\n\n"
+        "Для другой периодичности: «еженедельно пн», «ежеквартально 15.03», «ежегодно 15.03»:"
+    )
     await state.set_state(AddPaymentForm.day)
 
 
 async def add_day(message: Message, state: FSMContext):
     try:
-        day = int(message.text.strip())
-    except ValueError:
-        await message.answer("Нужно число от 1 до 31. Попробуйте ещё раз:")
-        return
-
-    if not 1 <= day <= 31:
-        await message.answer("Число месяца должно быть от 1 до 31. Попробуйте ещё раз:")
+        schedule = parse_schedule(message.text)
+    except ValueError as e:
+        await message.answer(f"{e} Попробуйте ещё раз:")
         return
 
     data = await state.get_data()
     user_id = data["user_id"]
     title = data["title"]
-    amount = data["amount"]
+    amount = Decimal(str(data["amount"]))
 
-    add_payment(user_id, title, amount, day)
-    await message.answer(f"Платёж добавлен:\n\n{title}: {amount:.2f} ₽, каждый месяц {day}-го числа")
+    await add_payment(user_id, title, amount, schedule)
+    await message.answer(
+        f"Платёж добавлен:\n\n{escape(title)}: {format_amount(to_minor(amount))} ₽, {build_schedule_text(schedule)}"
+    )
     await state.clear()
 
-def build_confirm_delete_kb(payment_id: int) -> InlineKeyboardMarkup:
-    """
-    Клавиатура подтверждения удаления: Да / Нет.
-    """
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(
-                    text="✅ Да",
-                    callback_data=f"confirm_del_yes:{payment_id}",
-                ),
-                InlineKeyboardButton(
-                    text="❌ Нет",
-                    callback_data=f"confirm_del_no:{payment_id}",
-                ),
-            ]
-        ]
+
+async def cmd_import(message: Message):
+    await message.answer(
+        "Пришлите файл с платежами, чтобы добавить их разом.\n\n"
+        "CSV — первая строка с колонками title, amount, day:\n"
+        "title,amount,day\nАренда,30000,5\nИнтернет,650.50,20\n\n"
+        "Или JSON — массив объектов либо по объекту на строку:\n"
+        '{"title": "Аренда", "amount": 30000, "day": 5}\n\n'
+        "Вместо числа в day можно указать период, как при добавлении: «ежегодно 15.03».\n"
+        "Файл в том же формате выдаёт /export."
     )
 
-def build_payment_text(p) -> str:
-    """
-    Текст сообщения для платежа.
-    p — это row из БД (sqlite3.Row).
-    """
-    return f"{p['title']} — {p['amount']:.2f} ₽, {p['day_of_month']}-го числа"
-
-
-def build_payment_inline_kb(payment_id: int) -> InlineKeyboardMarkup:
-    """
-    Клавиатура под платежом: редактировать по полям / удалить.
-    """
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(
-                    text="✏️ Название",
-                    callback_data=f"edit_title:{payment_id}",
-                ),
-                InlineKeyboardButton(
-                    text="💸 Сумма",
-                    callback_data=f"edit_amount:{payment_id}",
-                ),
-            ],
-            [
-                InlineKeyboardButton(
-                    text="📅 Дата",
-                    callback_data=f"edit_day:{payment_id}",
-                ),
-                InlineKeyboardButton(
-                    text="🗑 Удалить",
-                    callback_data=f"del:{payment_id}",
-                ),
-            ],
-        ]
+
+async def import_document(message: Message, bot: Bot):
+    """
+    Загруженный файл: разбираем, проверяем все строки и добавляем всё одной
+    транзакцией. Если хоть одна строка с ошибкой — не добавляем ничего.
+    """
+    document = message.document
+    if document.file_size and document.file_size > MAX_IMPORT_BYTES:
+        await message.answer(f"Файл слишком большой: не больше {MAX_IMPORT_BYTES // 1024} КБ.")
+        return
+
+    user_id = await get_or_create_user(message.from_user.id)
+    stream = await bot.download(document)
+    payments, errors = parse_import(stream, document.file_name or "")
+    if errors:
+        shown = "\n".join(errors[:MAX_REPORTED_ERRORS])
+        more = len(errors) - MAX_REPORTED_ERRORS
+        if more > 0:
+            shown += f"\n… и ещё ошибок: {more}"
+        await message.answer(f"Файл не импортирован, исправьте ошибки:\n\n{shown}")
+        return
+    if not payments:
+        await message.answer("В файле не нашлось ни одного платежа. Формат — /import")
+        return
+
+    added = await add_payments(user_id, payments)
+    await message.answer(f"Добавлено платежей: {added}")
+
+
+async def cmd_export(message: Message):
+    user_id = await get_or_create_user(message.from_user.id)
+    path, count = await export_payments(user_id)
+    try:
+        if count == 0:
+            await message.answer(NO_PAYMENTS_TEXT)
+            return
+        await message.answer_document(
+            FSInputFile(path, filename="payments.csv"),
+            caption=f"Платежей: {count}",
+        )
+    finally:
+        os.unlink(path)
+
+
+async def cmd_list(message: Message):
+    user_id = await get_or_create_user(message.from_user.id)
+    summary = await get_payment_summary(user_id)
+    if not summary.rows:
+        await message.answer(NO_PAYMENTS_TEXT)
+        return
+
+    text = summary.rendered.get("list")
+    if text is None:
+        text = summary.rendered["list"] = build_list_text(summary.rows)
+    await message.answer(text, reply_markup=build_list_edit_kb())
+
+
+
+async def build_edit_page(user_id: int, page: int):
+    """
+    Страница редактора: текст со списком и клавиатура с кнопкой на каждый платёж
+    и навигацией. Из БД читается только эта страница.
+    Возвращает (text, kb) или None, если платежей нет совсем.
+    """
+    # одна лишняя строка — чтобы узнать, есть ли следующая страница
+    rows = await get_payments_page(user_id, page * EDIT_PAGE_SIZE, EDIT_PAGE_SIZE + 1)
+    if not rows and page > 0:
+        # платежи с этой страницы удалили — показываем первую
+        page = 0
+        rows = await get_payments_page(user_id, 0, EDIT_PAGE_SIZE + 1)
+    if not rows:
+        return None
+
+    has_next = len(rows) > EDIT_PAGE_SIZE
+    rows = rows[:EDIT_PAGE_SIZE]
+    first = page * EDIT_PAGE_SIZE + 1
+    return (
+        build_edit_page_text(rows, page, first),
+        build_edit_page_kb(rows, page, first, has_next),
     )
 
-def parse_payment_id_from_cb(callback: CallbackQuery) -> int | None:
-    data = callback.data or ""
+
+async def show_edit_page(callback: CallbackQuery, user_id: int, page: int):
+    """
+    Показывает страницу редактора в том же сообщении, откуда пришло нажатие.
+    """
+    built = await build_edit_page(user_id, page)
+    if built is None:
+        text = NO_PAYMENTS_TEXT
+        kb = None
+    else:
+        text, kb = built
+
     try:
-        _prefix, pid_str = data.split(":", 1)
-        return int(pid_str)
+        await callback.message.edit_text(text, reply_markup=kb)
     except Exception:
-        return None
+        # например, сообщение слишком старое для редактирования
+        await callback.message.answer(text, reply_markup=kb)
 
 
-def build_list_edit_kb() -> InlineKeyboardMarkup:
+async def cb_open_edit_list(callback: CallbackQuery, cb: PaymentCb, state: FSMContext):
     """
-    Клавиатура под сводным списком: одна кнопка для входа в режим редактирования.
+    Нажата кнопка '✏️ Редактировать / удалять' под сводным списком.
+    Сводное сообщение превращается в постраничный редактор.
     """
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(
-                    text="✏️ Редактировать / удалять",
-                    callback_data="open_edit_list",
-                )
-            ]
-        ]
-    )
+    user_id = await get_or_create_user(callback.from_user.id)
+    await show_edit_page(callback, user_id, 0)
+    await callback.answer()
 
 
-async def cmd_list(message: Message):
-    user_id = get_or_create_user(message.from_user.id)
-    payments = get_payments_for_user(user_id)
-    if not payments:
-        await message.answer("У вас пока нет регулярных платежей. Используйте /add, чтобы добавить.")
+async def cb_edit_page(callback: CallbackQuery, cb: PaymentCb, state: FSMContext):
+    """
+    Листание редактора и возврат к списку.
+    """
+    if cb.pg < 0:
+        await callback.answer("Некорректные данные.", show_alert=True)
         return
 
-    lines = []
-    for p in payments:
-        lines.append(build_payment_text(p))
+    user_id = await get_or_create_user(callback.from_user.id)
+    await show_edit_page(callback, user_id, cb.pg)
+    await callback.answer()
+
 
-    text = "Ваши регулярные платежи:\n\n" + "\n".join(lines)
-    kb = build_list_edit_kb()
+async def cb_open_payment(callback: CallbackQuery, cb: PaymentCb, state: FSMContext):
+    """
+    Выбран платёж в редакторе: показываем его с кнопками действий в том же сообщении.
+    """
+    user_id = await get_or_create_user(callback.from_user.id)
+    payment = await get_payment_by_id(user_id, cb.id)
+    if not payment:
+        await callback.answer("Платёж не найден или уже удалён.", show_alert=True)
+        await show_edit_page(callback, user_id, cb.pg)
+        return
+
+    try:
+        await callback.message.edit_text(
+            build_payment_text(payment),
+            reply_markup=build_payment_inline_kb(cb.id, cb.pg),
+        )
+    except Exception:
+        pass
+    await callback.answer()
+
+
+async def cmd_month(message: Message):
+    user_id = await get_or_create_user(message.from_user.id)
+    total = await get_month_total_for_user(user_id)
+    await message.answer(f"Общая сумма ваших ежемесячных платежей: {total:.2f} ₽")
+
+
+async def build_rest(user_id: int):
+    today, summary, unpaid, weekly = await get_month_view(user_id, REST_MAX_UNPAID)
+    more = summary["payments_count"] - summary["paid_count"] - len(unpaid) if summary else 0
+    return build_rest_text(summary, unpaid, today, more, weekly), build_rest_kb(unpaid)
+
+
+async def cmd_rest(message: Message):
+    user_id = await get_or_create_user(message.from_user.id)
+    text, kb = await build_rest(user_id)
     await message.answer(text, reply_markup=kb)
 
 
+async def cmd_history(message: Message):
+    user_id = await get_or_create_user(message.from_user.id)
+    rows = await get_month_history(user_id, HISTORY_MONTHS)
+    await message.answer(build_history_text(rows))
+
 
-async def send_payments_as_messages(message: Message, user_id: int):
+async def cb_mark_paid(callback: CallbackQuery, cb: PaymentCb, state: FSMContext):
     """
-    Отправляет платежи по одному сообщению (как сейчас).
+    Нажата кнопка «✅ …» под остатком: отмечаем платёж месяца оплаченным
+    и обновляем сообщение с остатком.
     """
-    payments = get_payments_for_user(user_id)
-    if not payments:
-        await message.answer("У вас пока нет регулярных платежей. Используйте /add, чтобы добавить.")
+    user_id = await get_or_create_user(callback.from_user.id)
+    instance = await mark_instance_paid(user_id, cb.id, int(time.time()))
+    if instance is None:
+        await callback.answer("Платёж уже отмечен оплаченным.")
+    else:
+        await callback.answer(f"Оплачено: {instance['title']}")
+
+    text, kb = await build_rest(user_id)
+    try:
+        await callback.message.edit_text(text, reply_markup=kb)
+    except Exception:
+        pass
+
+
+async def cmd_dashboard(message: Message):
+    user_id = await get_or_create_user(message.from_user.id)
+    summary = await get_payment_summary(user_id)
+    if not summary.rows:
+        await message.answer(NO_PAYMENTS_TEXT)
         return
 
-    await message.answer("Ваши регулярные платежи для редактирования:")
+    # остаток — по monthly_summary, как в /rest, поэтому видны и отметки об оплате;
+    # его итоги читаются при каждом нажатии
+    today, month_summary, weekly = await get_month_totals(user_id)
+    # список и ближайший платёж кэшируются в самой сводке: повторные нажатия
+    # их не пересчитывают, пока платежи не изменятся (тогда сводка сбрасывается целиком)
+    rendered = summary.rendered_for(today)
+    parts = rendered.get("dashboard")
+    if parts is None:
+        parts = rendered["dashboard"] = build_dashboard_parts(summary, today)
+    await message.answer(build_dashboard_text(parts, month_summary, weekly), reply_markup=build_list_edit_kb())
 
-    for p in payments:
-        text = build_payment_text(p)
-        kb = build_payment_inline_kb(p["id"])
-        await message.answer(text, reply_markup=kb)
 
-async def cb_open_edit_list(callback: CallbackQuery):
+async def cmd_forecast(message: Message):
     """
-    Нажата кнопка '✏️ Редактировать / удалять' под сводным списком.
-    Отправляем платежи по одному сообщению, каждый с собственными кнопками.
+    /forecast [N] — сколько придётся заплатить за N месяцев начиная с сегодня.
     """
-    user_id = get_or_create_user(callback.from_user.id)
+    parts = message.text.split()
+    months = DEFAULT_FORECAST_MONTHS
+    if len(parts) > 1:
+        if not parts[1].isdigit() or not 1 <= int(parts[1]) <= MAX_FORECAST_MONTHS:
+            await message.answer(f"Использование: /forecast N, где N — число месяцев от 1 до {MAX_FORECAST_MONTHS}")
+            return
+        months = int(parts[1])
+
+    user_id = await get_or_create_user(message.from_user.id)
+    today = await user_today(user_id)
+    summary = await get_payment_summary(user_id)
+    if not summary.rows:
+        await message.answer(NO_PAYMENTS_TEXT)
+        return
 
-    # Можно не трогать исходное сводное сообщение, просто дополнительно отправить детальный список
-    await send_payments_as_messages(callback.message, user_id)
+    # как и сводка, прогноз кэшируется в самой сводке до изменения платежей
+    rendered = summary.rendered_for(today)
+    text = rendered.get(("forecast", months))
+    if text is None:
+        by_month = split_by_month(today, project(summary, today, months))
+        last_day = add_months(today, months) - timedelta(days=1)
+        text = rendered[("forecast", months)] = build_forecast_text(today, last_day, by_month)
+    await message.answer(text)
 
-    await callback.answer()
 
+async def cmd_tz(message: Message):
+    user_id = await get_or_create_user(message.from_user.id)
 
-async def cmd_month(message: Message):
-    user_id = get_or_create_user(message.from_user.id)
-    total = get_month_total_for_user(user_id)
-    await message.answer(f"Общая сумма ваших регулярных платежей в месяц: {total:.2f} ₽")
+    parts = message.text.strip().split()
+    if len(parts) != 2:
+        settings = await get_user_settings(user_id)
+        await message.answer(
+            f"Ваш часовой пояс: {settings['tz']}\n"
+            "Изменить: /tz Область/Город\nНапример: /tz Asia/Yekaterinburg"
+        )
+        return
 
+    tz = parts[1]
+    try:
+        ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        await message.answer("Не знаю такого часового пояса. Пример: /tz Europe/Moscow")
+        return
+
+    await set_user_timezone(user_id, tz)
+    await message.answer(f"Часовой пояс изменён на: {tz}")
+
+
+async def cmd_remind(message: Message):
+    user_id = await get_or_create_user(message.from_user.id)
+
+    parts = message.text.strip().split()
+    if len(parts) != 2:
+        settings = await get_user_settings(user_id)
+        await message.answer(
+            f"Напоминания приходят в {settings['remind_hour']}:00 по вашему времени.\n"
+            "Изменить: /remind ЧАС\nНапример: /remind 8"
+        )
+        return
+
+    if not parts[1].isdigit() or not 0 <= int(parts[1]) <= 23:
+        await message.answer("Час должен быть числом от 0 до 23. Например: /remind 8")
+        return
+
+    hour = int(parts[1])
+    await set_user_remind_hour(user_id, hour)
+    await message.answer(f"Теперь напоминания будут приходить в {hour}:00.")
 
-async def cmd_rest(message: Message):
-    user_id = get_or_create_user(message.from_user.id)
-    today = date.today()
-    remaining = get_remaining_total_for_user(user_id, today=today)
-    await message.answer(
-        f"Сумма оставшихся платежей до конца месяца (включая сегодня): {remaining:.2f} ₽"
-    )
 
 async def cmd_del(message: Message):
     user_tg_id = message.from_user.id
-    user_id = get_or_create_user(user_tg_id)
+    user_id = await get_or_create_user(user_tg_id)
 
     parts = message.text.strip().split()
     if len(parts) != 2 or not parts[1].isdigit():
@@ -298,37 +557,29 @@ async def cmd_del(message: Message):
         return
 
     payment_id = int(parts[1])
-    ok = delete_payment(user_id, payment_id)
+    ok = await delete_payment(user_id, payment_id)
     if ok:
         await message.answer(f"Платёж с ID #{payment_id} удалён (деактивирован).")
     else:
         await message.answer("Платёж не найден или уже удалён.")
 
-async def cb_delete_payment(callback: CallbackQuery):
+async def cb_delete_payment(callback: CallbackQuery, cb: PaymentCb, state: FSMContext):
     """
     Первый шаг: нажали '🗑 Удалить' – спрашиваем подтверждение.
-    callback_data: del:<id>
     """
-    user_id = get_or_create_user(callback.from_user.id)
-
-    data = callback.data or ""
-    try:
-        _prefix, pid_str = data.split(":", 1)
-        payment_id = int(pid_str)
-    except Exception:
-        await callback.answer("Некорректные данные.", show_alert=True)
-        return
+    user_id = await get_or_create_user(callback.from_user.id)
+    payment_id = cb.id
 
-    payment = get_payment_by_id(user_id, payment_id)
+    payment = await get_payment_by_id(user_id, payment_id)
     if not payment:
         await callback.answer("Платёж не найден или уже удалён.", show_alert=True)
         return
 
     text = (
         f"Удалить платёж #{payment_id}?\n"
-        f"{payment['title']} — {payment['amount']:.2f} ₽, {payment['day_of_month']}-го числа."
+        f"{escape(payment['title'])} — {format_amount(payment['amount_minor'])} ₽, {build_schedule_text(schedule_of(payment))}."
     )
-    kb = build_confirm_delete_kb(payment_id)
+    kb = build_confirm_delete_kb(payment_id, cb.pg)
 
     try:
         # редактируем исходное сообщение с платежом
@@ -339,28 +590,20 @@ async def cb_delete_payment(callback: CallbackQuery):
 
     await callback.answer()
 
-async def cb_confirm_delete_yes(callback: CallbackQuery):
+async def cb_confirm_delete_yes(callback: CallbackQuery, cb: PaymentCb, state: FSMContext):
     """
     Подтверждение удаления: Да.
-    callback_data: confirm_del_yes:<id>
     """
-    user_id = get_or_create_user(callback.from_user.id)
+    user_id = await get_or_create_user(callback.from_user.id)
+    payment_id = cb.id
 
-    data = callback.data or ""
-    try:
-        _prefix, pid_str = data.split(":", 1)
-        payment_id = int(pid_str)
-    except Exception:
-        await callback.answer("Некорректные данные.", show_alert=True)
-        return
-
-    ok = delete_payment(user_id, payment_id)
+    ok = await delete_payment(user_id, payment_id)
     if ok:
         await callback.answer("Платёж удалён.")
         try:
             await callback.message.edit_text(
                 f"Платёж #{payment_id} удалён.",
-                reply_markup=None,
+                reply_markup=build_back_to_list_kb(cb.pg),
             )
         except Exception:
             pass
@@ -372,22 +615,14 @@ async def cb_confirm_delete_yes(callback: CallbackQuery):
             pass
 
 
-async def cb_confirm_delete_no(callback: CallbackQuery):
+async def cb_confirm_delete_no(callback: CallbackQuery, cb: PaymentCb, state: FSMContext):
     """
     Отмена удаления: Нет.
-    callback_data: confirm_del_no:<id>
     """
-    user_id = get_or_create_user(callback.from_user.id)
+    user_id = await get_or_create_user(callback.from_user.id)
+    payment_id = cb.id
 
-    data = callback.data or ""
-    try:
-        _prefix, pid_str = data.split(":", 1)
-        payment_id = int(pid_str)
-    except Exception:
-        await callback.answer("Некорректные данные.", show_alert=True)
-        return
-
-    payment = get_payment_by_id(user_id, payment_id)
+    payment = await get_payment_by_id(user_id, payment_id)
     if not payment:
         # Платёж уже удалён или недоступен — просто убираем клавиатуру подтверждения
         try:
@@ -399,7 +634,7 @@ async def cb_confirm_delete_no(callback: CallbackQuery):
 
     # Восстанавливаем исходный вид: текст + клавиатура «Редактировать / Удалить»
     text = build_payment_text(payment)
-    kb = build_payment_inline_kb(payment_id)
+    kb = build_payment_inline_kb(payment_id, cb.pg)
 
     try:
         await callback.message.edit_text(text, reply_markup=kb)
@@ -411,9 +646,12 @@ async def cb_confirm_delete_no(callback: CallbackQuery):
 
 
 
-async def cmd_edit(message: Message, state: FSMContext):
+async def cmd_edit(message: Message):
+    """
+    /edit ID — платёж с кнопками правки по полям, как в редакторе.
+    """
     user_tg_id = message.from_user.id
-    user_id = get_or_create_user(user_tg_id)
+    user_id = await get_or_create_user(user_tg_id)
 
     parts = message.text.strip().split()
     if len(parts) != 2 or not parts[1].isdigit():
@@ -421,137 +659,107 @@ async def cmd_edit(message: Message, state: FSMContext):
         return
 
     payment_id = int(parts[1])
-    payment = get_payment_by_id(user_id, payment_id)
+    payment = await get_payment_by_id(user_id, payment_id)
     if not payment:
         await message.answer("Платёж с таким ID не найден.")
         return
 
-    # Сохраняем в состояние, что редактируем
-    await state.update_data(
-        edit_payment_id=payment_id,
-        edit_title=payment["title"],
-        edit_amount=payment["amount"],
-        edit_day=payment["day_of_month"],
-    )
-
-    text = (
-        f"Редактирование платежа #{payment_id}:\n"
-        f"{payment['title']} — {payment['amount']:.2f} ₽, {payment['day_of_month']}-го числа.\n\n"
-        "Что хотите изменить?\n"
-        "Напишите: название / сумма / дата\n"
-        "Или: всё — чтобы изменить всё по шагам."
+    await message.answer(
+        f"Редактирование платежа #{payment_id}:\n{build_payment_text(payment)}\n\nЧто хотите изменить?",
+        reply_markup=build_payment_inline_kb(payment_id),
     )
-    await message.answer(text)
-    await state.set_state(EditPaymentForm.waiting_for_field)
 
-async def cb_edit_payment(callback: CallbackQuery, state: FSMContext):
-    """
-    Обработка нажатия 'Редактировать'.
-    callback_data: edit:<id>
-    """
-    user_id = get_or_create_user(callback.from_user.id)
 
-    data = callback.data or ""
-    try:
-        _prefix, pid_str = data.split(":", 1)
-        payment_id = int(pid_str)
-    except Exception:
-        await callback.answer("Некорректные данные.", show_alert=True)
-        return
+async def cb_edit_title(callback: CallbackQuery, cb: PaymentCb, state: FSMContext):
+    user_id = await get_or_create_user(callback.from_user.id)
+    payment_id = cb.id
 
-    payment = get_payment_by_id(user_id, payment_id)
-    if not payment:
-        await callback.answer("Платёж не найден.", show_alert=True)
-        return
-
-async def cb_edit_title(callback: CallbackQuery, state: FSMContext):
-    user_id = get_or_create_user(callback.from_user.id)
-    payment_id = parse_payment_id_from_cb(callback)
-    if payment_id is None:
-        await callback.answer("Некорректные данные.", show_alert=True)
-        return
-
-    payment = get_payment_by_id(user_id, payment_id)
+    payment = await get_payment_by_id(user_id, payment_id)
     if not payment:
         await callback.answer("Платёж не найден.", show_alert=True)
         return
 
     await state.update_data(edit_payment_id=payment_id)
     await callback.message.answer(
-        f"Текущее название: {payment['title']}\n"
+        f"Текущее название: {escape(payment['title'])}\n"
         "Введите новое название:"
     )
     await callback.answer()
     await state.set_state(EditPaymentForm.new_title)
 
 
-async def cb_edit_amount(callback: CallbackQuery, state: FSMContext):
-    user_id = get_or_create_user(callback.from_user.id)
-    payment_id = parse_payment_id_from_cb(callback)
-    if payment_id is None:
-        await callback.answer("Некорректные данные.", show_alert=True)
-        return
+async def cb_edit_amount(callback: CallbackQuery, cb: PaymentCb, state: FSMContext):
+    user_id = await get_or_create_user(callback.from_user.id)
+    payment_id = cb.id
 
-    payment = get_payment_by_id(user_id, payment_id)
+    payment = await get_payment_by_id(user_id, payment_id)
     if not payment:
         await callback.answer("Платёж не найден.", show_alert=True)
         return
 
     await state.update_data(edit_payment_id=payment_id)
     await callback.message.answer(
-        f"Текущая сумма: {payment['amount']:.2f} ₽\n"
+        f"Текущая сумма: {format_amount(payment['amount_minor'])} ₽\n"
         "Введите новую сумму (например: 1500.50):"
     )
     await callback.answer()
     await state.set_state(EditPaymentForm.new_amount)
 
 
-async def cb_edit_day(callback: CallbackQuery, state: FSMContext):
-    user_id = get_or_create_user(callback.from_user.id)
-    payment_id = parse_payment_id_from_cb(callback)
-    if payment_id is None:
-        await callback.answer("Некорректные данные.", show_alert=True)
-        return
+async def cb_edit_day(callback: CallbackQuery, cb: PaymentCb, state: FSMContext):
+    user_id = await get_or_create_user(callback.from_user.id)
+    payment_id = cb.id
 
-    payment = get_payment_by_id(user_id, payment_id)
+    payment = await get_payment_by_id(user_id, payment_id)
     if not payment:
         await callback.answer("Платёж не найден.", show_alert=True)
         return
 
+    if payment["recurrence"] == WEEKLY:
+        await callback.answer(
+            "У еженедельного платежа нет числа месяца. Удалите его и добавьте заново с другим днём недели.",
+            show_alert=True,
+        )
+        return
+
     await state.update_data(edit_payment_id=payment_id)
     await callback.message.answer(
-        f"Текущая дата: {payment['day_of_month']}-го числа.\n"
+        f"Текущая дата: {build_schedule_text(schedule_of(payment))}.\n"
         "Введите новое число месяца (1–31):"
     )
     await callback.answer()
     await state.set_state(EditPaymentForm.new_day)
 
 
-
-    # Сохраняем в состояние
-    await state.update_data(
-        edit_payment_id=payment_id,
-        edit_title=payment["title"],
-        edit_amount=payment["amount"],
-        edit_day=payment["day_of_month"],
-    )
-
-    text = (
-        f"Редактирование платежа #{payment_id}:\n"
-        f"{payment['title']} — {payment['amount']:.2f} ₽, {payment['day_of_month']}-го числа.\n\n"
-        "Что хотите изменить?\n"
-        "Напишите: название / сумма / дата\n"
-        "Или: всё — чтобы изменить всё по шагам."
-    )
-    await callback.message.answer(text)
-    await callback.answer()  # закрыть "часики" на кнопке
-    await state.set_state(EditPaymentForm.waiting_for_field)
+# Все инлайн-кнопки идут через один обработчик: код действия -> функция
+CALLBACK_HANDLERS = {
+    Action.OPEN_LIST: cb_open_edit_list,
+    Action.PAGE: cb_edit_page,
+    Action.VIEW: cb_open_payment,
+    Action.EDIT_TITLE: cb_edit_title,
+    Action.EDIT_AMOUNT: cb_edit_amount,
+    Action.EDIT_DAY: cb_edit_day,
+    Action.DELETE: cb_delete_payment,
+    Action.DELETE_YES: cb_confirm_delete_yes,
+    Action.DELETE_NO: cb_confirm_delete_no,
+    Action.PAY: cb_mark_paid,
+}
+
+
+async def cb_router(callback: CallbackQuery, state: FSMContext):
+    cb = decode_callback(callback.data)
+    handler = CALLBACK_HANDLERS.get(cb.a) if cb is not None else None
+    if handler is None:
+        await callback.answer("Кнопка устарела или некорректна.", show_alert=True)
+        return
+    await handler(callback, cb, state)
 
 
 async def edit_set_title(message: Message, state: FSMContext):
-    new_title = message.text.strip()
-    if not new_title:
-        await message.answer("Название не может быть пустым. Введите ещё раз:")
+    try:
+        new_title = parse_title(message.text)
+    except ValueError as e:
+        await message.answer(f"{e} Введите ещё раз:")
         return
 
     data = await state.get_data()
@@ -561,38 +769,21 @@ async def edit_set_title(message: Message, state: FSMContext):
         await state.clear()
         return
 
-    user_id = get_or_create_user(message.from_user.id)
-    payment = get_payment_by_id(user_id, payment_id)
-    if not payment:
-        await message.answer("Платёж не найден или уже удалён.")
-        await state.clear()
-        return
-
-    ok = update_payment(
-        user_id=user_id,
-        payment_id=payment_id,
-        title=new_title,
-        amount=payment["amount"],
-        day_of_month=payment["day_of_month"],
-    )
-    if ok:
-        await message.answer(f"Название платежа #{payment_id} обновлено на: {new_title}")
+    user_id = await get_or_create_user(message.from_user.id)
+    payment = await update_payment_title(user_id, payment_id, new_title)
+    if payment:
+        await message.answer(f"Название платежа #{payment_id} обновлено на: {escape(payment['title'])}")
     else:
-        await message.answer("Не удалось обновить платёж.")
+        await message.answer("Платёж не найден или уже удалён.")
 
     await state.clear()
 
 
 async def edit_set_amount(message: Message, state: FSMContext):
-    text = message.text.replace(",", ".").strip()
     try:
-        new_amount = float(text)
-    except ValueError:
-        await message.answer("Не получилось распознать сумму. Попробуйте ещё раз (пример: 1500.50)")
-        return
-
-    if new_amount <= 0:
-        await message.answer("Сумма должна быть больше нуля. Введите ещё раз:")
+        new_amount = parse_amount(message.text)
+    except ValueError as e:
+        await message.answer(f"{e} Введите ещё раз:")
         return
 
     data = await state.get_data()
@@ -602,37 +793,21 @@ async def edit_set_amount(message: Message, state: FSMContext):
         await state.clear()
         return
 
-    user_id = get_or_create_user(message.from_user.id)
-    payment = get_payment_by_id(user_id, payment_id)
-    if not payment:
-        await message.answer("Платёж не найден или уже удалён.")
-        await state.clear()
-        return
-
-    ok = update_payment(
-        user_id=user_id,
-        payment_id=payment_id,
-        title=payment["title"],
-        amount=new_amount,
-        day_of_month=payment["day_of_month"],
-    )
-    if ok:
-        await message.answer(f"Сумма платежа #{payment_id} обновлена на: {new_amount:.2f} ₽")
+    user_id = await get_or_create_user(message.from_user.id)
+    payment = await update_payment_amount(user_id, payment_id, new_amount)
+    if payment:
+        await message.answer(f"Сумма платежа #{payment_id} обновлена на: {format_amount(payment['amount_minor'])} ₽")
     else:
-        await message.answer("Не удалось обновить платёж.")
+        await message.answer("Платёж не найден или уже удалён.")
 
     await state.clear()
 
 
 async def edit_set_day(message: Message, state: FSMContext):
     try:
-        new_day = int(message.text.strip())
-    except ValueError:
-        await message.answer("Нужно число от 1 до 31. Попробуйте ещё раз:")
-        return
-
-    if not 1 <= new_day <= 31:
-        await message.answer("Число месяца должно быть от 1 до 31. Попробуйте ещё раз:")
+        new_day = parse_day(message.text)
+    except ValueError as e:
+        await message.answer(f"{e} Попробуйте ещё раз:")
         return
 
     data = await state.get_data()
@@ -642,24 +817,14 @@ async def edit_set_day(message: Message, state: FSMContext):
         await state.clear()
         return
 
-    user_id = get_or_create_user(message.from_user.id)
-    payment = get_payment_by_id(user_id, payment_id)
-    if not payment:
-        await message.answer("Платёж не найден или уже удалён.")
-        await state.clear()
-        return
-
-    ok = update_payment(
-        user_id=user_id,
-        payment_id=payment_id,
-        title=payment["title"],
-        amount=payment["amount"],
-        day_of_month=new_day,
-    )
-    if ok:
-        await message.answer(f"Дата платежа #{payment_id} обновлена на: {new_day}-е число")
+    user_id = await get_or_create_user(message.from_user.id)
+    payment = await update_payment_day(user_id, payment_id, new_day)
+    if payment:
+        await message.answer(
+            f"Дата платежа #{payment_id} обновлена: {build_schedule_text(schedule_of(payment))}"
+        )
     else:
-        await message.answer("Не удалось обновить платёж.")
+        await message.answer("Платёж не найден или уже удалён.")
 
     await state.clear()
 
@@ -668,25 +833,63 @@ async def edit_set_day(message: Message, state: FSMContext):
 # --- Планировщик напоминаний ---
 
 
-async def send_daily_reminders(bot: Bot):
-    today = date.today()
-    day = today.day
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
 
-    rows = get_payments_for_day(day)
-    if not rows:
+
+async def is_leader() -> bool:
+    """
+    Берёт или продлевает аренду ведущего процесса. Планировщик есть в каждом
+    процессе, но рассылку ставит в очередь только ведущий; если он пропадёт,
+    после истечения аренды её подхватит другой.
+    """
+    return await try_acquire_lease(LEADER_LEASE, worker_name(), int(time.time()), LEADER_LEASE_SECONDS)
+
+
+async def send_scheduled_reminders(bot: Bot, partition: tuple[int, int]):
+    """
+    Запускается каждые REMINDER_SLICE_MINUTES минут и обрабатывает только тех
+    пользователей, у кого в их часовом поясе сейчас час напоминаний.
+    Так рассылка размазывается по суткам, а не идёт одним всплеском.
+    Слоты, чей час сегодня уже прошёл, но рассылка не закончена (нет записи
+    в reminder_runs), дозаполняются: так после перезапуска или простоя
+    процесса рассылка продолжается с того места, где остановилась.
+    """
+    if not await is_leader():
+        await send_outbox_reminders(bot, partition)
         return
 
-    for row in rows:
-        tg_id = row["tg_id"]
-        title = row["title"]
-        amount = row["amount"]
-        try:
-            await bot.send_message(
-                chat_id=tg_id,
-                text=f"Напоминание о платеже:\n\n{title} — {amount:.2f} ₽ сегодня.",
-            )
-        except Exception as e:
-            logging.error(f"Ошибка отправки напоминания {tg_id}: {e}")
+    now = datetime.now(timezone.utc)
+    # отправка идёт параллельно с заполнением и забирает записи по мере
+    # появления, пока заполнение не закончится
+    filled = asyncio.Event()
+    sending = asyncio.create_task(send_outbox_reminders(bot, partition, filled))
+
+    try:
+        for tz, remind_hour, today in due_reminder_slots(await get_reminder_slices(), now):
+            added = await fill_outbox(today, tz, remind_hour)
+            if added:
+                logging.info(f"Напоминания за {today} ({tz}, {remind_hour}:00): в очереди {added}")
+    finally:
+        filled.set()
+        await sending
+    # выгрузку мог вести ежеминутный запуск, не дождавшийся заполнения, — добираем остаток
+    await send_outbox_reminders(bot, partition)
+
+
+async def send_outbox_reminders(bot: Bot, partition: tuple[int, int], filled: asyncio.Event | None = None):
+    """
+    Выгрузка outbox. Кроме основной рассылки запускается раз в минуту:
+    подбирает повторы после ошибок и то, что не успел отправить упавший процесс.
+    Каждый процесс отправляет своих пользователей (partition); общий лимит
+    скорости бота делится между процессами. filled — см. drain_outbox.
+    """
+    await is_leader()  # заодно продлеваем аренду ведущего
+    _worker_id, workers = partition
+    dispatcher = ReminderDispatcher(bot, global_rate=GLOBAL_RATE / workers)
+    stats = await drain_outbox(dispatcher, partition, filled)
+    if stats is not None and (stats.sent or stats.failed):
+        logging.info(f"Напоминания: {stats}")
 
 # --- Обработчики кнопок меню ---
 
@@ -708,23 +911,30 @@ async def btn_rest(message: Message):
     await cmd_rest(message)
 
 
-async def main():
-    init_db()
+async def btn_dashboard(message: Message):
+    await cmd_dashboard(message)
 
-    bot = Bot(
-        BOT_TOKEN,
-        default=DefaultBotProperties(parse_mode="HTML")
-    )
-    dp = Dispatcher(storage=MemoryStorage())
 
+def register_handlers(dp: Dispatcher):
+    """
+    Регистрация всех обработчиков; общая для long polling и webhook.
+    """
     dp.message.register(cmd_start, CommandStart())
     dp.message.register(cmd_add, Command("add"))
     dp.message.register(cmd_list, Command("list"))
     dp.message.register(cmd_month, Command("month"))
     dp.message.register(cmd_rest, Command("rest"))
+    dp.message.register(cmd_history, Command("history"))
+    dp.message.register(cmd_dashboard, Command("dashboard"))
+    dp.message.register(cmd_forecast, Command("forecast"))
+    dp.message.register(cmd_tz, Command("tz"))
+    dp.message.register(cmd_remind, Command("remind"))
     dp.message.register(cmd_del, Command("del"))
     dp.message.register(cmd_edit, Command("edit"))
-    dp.message.register(cmd_cleanup, Command("cleanup"))  # <-- добавили
+    dp.message.register(cmd_cleanup, Command("cleanup"))
+    dp.message.register(cmd_import, Command("import"))
+    dp.message.register(cmd_export, Command("export"))
+    dp.message.register(import_document, F.document)
 
 
     # обработчики кнопок меню (по тексту)
@@ -732,16 +942,10 @@ async def main():
     dp.message.register(btn_list, F.text == "📋 Список")
     dp.message.register(btn_month, F.text == "📆 Сумма в месяц")
     dp.message.register(btn_rest, F.text == "💰 Остаток")
+    dp.message.register(btn_dashboard, F.text == "📊 Сводка")
 
-    # callback-и под платежами
-    dp.callback_query.register(cb_delete_payment, F.data.startswith("del:"))
-    dp.callback_query.register(cb_edit_payment, F.data.startswith("edit:"))
-    dp.callback_query.register(cb_confirm_delete_yes, F.data.startswith("confirm_del_yes:"))
-    dp.callback_query.register(cb_confirm_delete_no, F.data.startswith("confirm_del_no:"))
-    dp.callback_query.register(cb_edit_title, F.data.startswith("edit_title:"))
-    dp.callback_query.register(cb_edit_amount, F.data.startswith("edit_amount:"))
-    dp.callback_query.register(cb_edit_day, F.data.startswith("edit_day:"))
-    dp.callback_query.register(cb_open_edit_list, F.data == "open_edit_list")
+    # все инлайн-кнопки: разбор callback_data и выбор обработчика в cb_router
+    dp.callback_query.register(cb_router)
 
 
     # FSM-обработчики
@@ -755,27 +959,271 @@ async def main():
     dp.message.register(edit_set_day, EditPaymentForm.new_day)
 
 
-    # FSM-обработчики добавления
-    dp.message.register(add_title, AddPaymentForm.title)
-    dp.message.register(add_amount, AddPaymentForm.amount)
-    dp.message.register(add_day, AddPaymentForm.day)
+async def purge_fsm_states(storage: SQLiteStorage):
+    if await is_leader():
+        await storage.purge_expired()
+
+
+async def materialize_current_month():
+    """
+    Раз в сутки (только ведущий процесс) заводит платежи текущего месяца всем
+    пользователям, чтобы история была полной и у тех, кто не открывал /rest.
+    Месяц — по часовому поясу пользователя: пояса с одной местной датой
+    проходят вместе, таких групп не больше трёх.
+    """
+    if not await is_leader():
+        return
+
+    now = datetime.now(timezone.utc)
+    zones_by_day: dict[date, list[str]] = {}
+    for tz in dict.fromkeys(tz for tz, _remind_hour in await get_reminder_slices()):
+        zones_by_day.setdefault(now.astimezone(ZoneInfo(tz)).date(), []).append(tz)
+    for today, zones in zones_by_day.items():
+        after = 0
+        while True:
+            after = await materialize_month_batch(today, zones, after, MATERIALIZE_BATCH)
+            if after is None:
+                break
+            await asyncio.sleep(COMPACT_PAUSE)
+
+
+async def compact_payments(before: int) -> int:
+    """
+    Удаляет платежи, удалённые раньше before, порциями по COMPACT_BATCH.
+    Между порциями поток БД свободен для запросов пользователей,
+    а блокировка записи — для других процессов.
+    """
+    total = 0
+    while True:
+        deleted = await compact_deleted_payments(before, COMPACT_BATCH)
+        total += deleted
+        if deleted < COMPACT_BATCH:
+            return total
+        await asyncio.sleep(COMPACT_PAUSE)
+
 
+async def compact_database():
+    """
+    Ночная очистка (только ведущий процесс): удалённые платежи старше
+    PAYMENT_RETENTION_DAYS и отработанные напоминания старше OUTBOX_RETENTION_DAYS.
+    """
+    if not await is_leader():
+        return
 
+    now = int(time.time())
+    payments = await compact_payments(now - PAYMENT_RETENTION_DAYS * 24 * 60 * 60)
+    outbox = 0
+    while True:
+        deleted = await purge_reminder_outbox(now - OUTBOX_RETENTION_DAYS * 24 * 60 * 60, COMPACT_BATCH)
+        outbox += deleted
+        if deleted < COMPACT_BATCH:
+            break
+        await asyncio.sleep(COMPACT_PAUSE)
+    if payments or outbox:
+        logging.info(f"Очистка базы: платежей {payments}, напоминаний {outbox}")
 
+
+def setup_scheduler(bot: Bot, storage: SQLiteStorage, partition: tuple[int, int]) -> AsyncIOScheduler:
     # Планировщик
-    scheduler = AsyncIOScheduler(timezone="Europe/Moscow")  # поменяйте под свой часовой пояс
-    # Каждый день в 09:00 отправляем напоминания
+    scheduler = AsyncIOScheduler(timezone="UTC")
+    # Каждые 15 минут рассылаем напоминания тем, у кого сейчас местный час напоминаний
+    # (шаг в 15 минут покрывает и пояса со смещением :30 / :45)
     scheduler.add_job(
-        send_daily_reminders,
-        trigger=CronTrigger(hour=9, minute=0),
-        args=(bot,),
-        id="daily_reminders",
+        send_scheduled_reminders,
+        trigger=CronTrigger(minute=f"*/{REMINDER_SLICE_MINUTES}"),
+        args=(bot, partition),
+        id="reminders",
         replace_existing=True,
     )
-    scheduler.start()
+    # Повторы и досылка после перезапуска; первый запуск — сразу при старте
+    scheduler.add_job(
+        send_outbox_reminders,
+        trigger="interval",
+        minutes=1,
+        next_run_time=datetime.now(timezone.utc),
+        args=(bot, partition),
+        id="reminder_outbox",
+        replace_existing=True,
+    )
+    # Брошенные на полпути диалоги добавления/редактирования
+    scheduler.add_job(
+        purge_fsm_states,
+        trigger="interval",
+        hours=1,
+        args=(storage,),
+        id="fsm_purge",
+        replace_existing=True,
+    )
+    # Платежи нового месяца — сразу после полуночи
+    scheduler.add_job(
+        materialize_current_month,
+        trigger=CronTrigger(hour=0, minute=5),
+        id="materialize",
+        replace_existing=True,
+    )
+    # Удалённые платежи и старые напоминания — ночью, когда нагрузка минимальна
+    scheduler.add_job(
+        compact_database,
+        trigger=CronTrigger(hour=COMPACT_HOUR_UTC, minute=30),
+        id="compact",
+        replace_existing=True,
+    )
+    return scheduler
 
+
+async def run_polling(bot: Bot, dp: Dispatcher):
+    # getUpdates не работает, пока у бота установлен webhook
+    await bot.delete_webhook()
     await dp.start_polling(bot)
 
 
+async def healthz(request: web.Request) -> web.Response:
+    return web.json_response({"status": "ok"})
+
+
+def build_webhook_app(bot: Bot, dp: Dispatcher, secret_token: str | None) -> web.Application:
+    """
+    aiohttp-приложение: обновления на WEBHOOK_PATH и проверка живости на /healthz.
+    """
+    app = web.Application()
+    # обработка прямо в запросе: при остановке aiohttp дождётся начатых обновлений
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret_token,
+        handle_in_background=False,
+    ).register(app, path=WEBHOOK_PATH)
+    app.router.add_get("/healthz", healthz)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher, worker_id: int = 0, workers: int = 1):
+    """
+    aiohttp-сервер для webhook. Запросы без правильного секрета
+    (заголовок X-Telegram-Bot-Api-Secret-Token) отклоняются.
+    По SIGINT/SIGTERM сервер перестаёт принимать запросы и ждёт
+    завершения уже начатых.
+    Несколько процессов слушают один порт (SO_REUSEPORT), и ядро
+    распределяет входящие запросы между ними.
+    """
+    app = build_webhook_app(bot, dp, WEBHOOK_SECRET)
+    runner = web.AppRunner(app, shutdown_timeout=WEBHOOK_SHUTDOWN_TIMEOUT)
+    await runner.setup()
+    site = web.TCPSite(runner, host=WEBHOOK_HOST, port=WEBHOOK_PORT, reuse_port=workers > 1)
+    await site.start()
+    if worker_id == 0:
+        await bot.set_webhook(
+            f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+        )
+    logging.info(
+        f"Webhook-сервер {worker_id + 1}/{workers} запущен на {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}"
+    )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Бот для регулярных платежей")
+    parser.add_argument(
+        "--mode",
+        choices=("polling", "webhook"),
+        default=os.getenv("BOT_MODE", "polling"),
+        help="способ получения обновлений (по умолчанию BOT_MODE или polling)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("WORKERS", "1")),
+        help="число процессов бота, только для webhook (по умолчанию WORKERS или 1)",
+    )
+    return parser.parse_args()
+
+
+async def run_bot(args, worker_id: int = 0):
+    partition = (worker_id, args.workers)
+    if args.workers > 1:
+        enable_multiprocess_mode()
+
+    await init_db()
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+    bot = Bot(
+        BOT_TOKEN,
+        session=session,
+        default=DefaultBotProperties(parse_mode="HTML")
+    )
+    # с несколькими процессами следующее обновление пользователя может прийти
+    # в соседний процесс, поэтому состояния пишем сразу, без накопления
+    storage = SQLiteStorage(flush_delay=0 if args.workers > 1 else FLUSH_DELAY)
+    dp = Dispatcher(storage=storage)
+    register_handlers(dp)
+
+    scheduler = setup_scheduler(bot, storage, partition)
+    scheduler.start()
+
+    try:
+        if args.mode == "webhook":
+            await run_webhook(bot, dp, worker_id, args.workers)
+        else:
+            await run_polling(bot, dp)
+    finally:
+        scheduler.shutdown(wait=False)
+        await storage.close()
+        await release_lease(LEADER_LEASE, worker_name())
+        # дожидаемся записей, которые ещё стоят в очереди потока БД
+        await shutdown_db()
+
+
+def run_worker(args, worker_id: int):
+    asyncio.run(run_bot(args, worker_id))
+
+
+def run_workers(args):
+    """
+    Запускает args.workers процессов бота и ждёт их завершения.
+    SIGTERM/SIGINT пересылаются процессам, те останавливаются штатно.
+    """
+    prepare_database()
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(args, worker_id), name=f"bot-worker-{worker_id}")
+        for worker_id in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+
+    def stop(_signum, _frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for process in processes:
+        process.join()
+
+
+def main():
+    args = parse_args()
+    if args.mode == "webhook" and not (WEBHOOK_URL and WEBHOOK_SECRET):
+        raise SystemExit("Для webhook нужны переменные WEBHOOK_URL и WEBHOOK_SECRET")
+    if args.workers > 1 and args.mode != "webhook":
+        # getUpdates может вызывать только один процесс
+        raise SystemExit("Несколько процессов поддерживаются только в режиме webhook")
+
+    if args.workers > 1:
+        run_workers(args)
+    else:
+        asyncio.run(run_bot(args))
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
@@ -0,0 +1,29 @@
+# money.py
+"""
+Суммы хранятся в БД целым числом копеек (amount_minor), снаружи — Decimal.
+Так суммы по платежам складываются точно, без ошибок округления float.
+"""
+from decimal import Decimal
+
+MINOR_UNITS = 100
+# Больше не бывает: так сумма любого числа платежей помещается в INTEGER SQLite
+MAX_AMOUNT = Decimal("1000000000")
+
+
+def to_minor(amount: Decimal) -> int:
+    """
+    Decimal с не более чем двумя знаками после запятой -> копейки.
+    """
+    return int(amount * MINOR_UNITS)
+
+
+def from_minor(minor: int) -> Decimal:
+    return Decimal(minor).scaleb(-2)
+
+
+def format_amount(minor: int) -> str:
+    """
+    Копейки -> «1500.50», как раньше давал формат :.2f.
+    """
+    rubles, kopecks = divmod(minor, MINOR_UNITS)
+    return f"{rubles}.{kopecks:02d}"
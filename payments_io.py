@@ -0,0 +1,147 @@
+# payments_io.py
+"""
+Импорт и экспорт платежей файлом.
+
+Импорт: CSV (колонки title, amount, day; разделитель «,» или «;») или JSON —
+массив объектов либо JSON Lines (объект на строку) с теми же ключами.
+В day — число месяца или расписание, как при добавлении: «ежегодно 15.03».
+Файл читается построчно, каждая строка проверяется теми же правилами,
+что и при добавлении через диалог.
+Экспорт пишет CSV того же формата во временный файл по мере чтения из БД.
+"""
+import codecs
+import csv
+import io
+import json
+import os
+import tempfile
+from decimal import Decimal
+from itertools import chain
+
+import db
+from db_async import run_in_db_thread
+from money import format_amount
+from recurrence import Schedule, format_schedule, schedule_of
+from validators import parse_amount, parse_schedule, parse_title
+
+# Ограничения на загружаемый файл
+MAX_IMPORT_BYTES = 1024 * 1024
+MAX_IMPORT_ROWS = 1000
+# Сколько ошибок показывать пользователю
+MAX_REPORTED_ERRORS = 10
+
+FIELDS = ("title", "amount", "day")
+
+_TOO_DEEP = "некорректный JSON: слишком глубокая вложенность."
+
+
+def _parse_record(record) -> tuple[str, Decimal, Schedule]:
+    if not isinstance(record, dict):
+        raise ValueError("ожидается объект с полями title, amount, day.")
+    missing = [field for field in FIELDS if record.get(field) in (None, "")]
+    if missing:
+        raise ValueError(f"не заполнено: {', '.join(missing)}.")
+    return (
+        parse_title(str(record["title"])),
+        parse_amount(str(record["amount"])),
+        parse_schedule(str(record["day"])),
+    )
+
+
+def _iter_csv(lines):
+    first = next(lines, "")
+    try:
+        dialect = csv.Sniffer().sniff(first, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(chain([first], lines), dialect=dialect)
+    try:
+        if reader.fieldnames is None or not set(FIELDS) <= {name.strip().lower() for name in reader.fieldnames}:
+            raise ValueError(f"в первой строке должны быть колонки: {', '.join(FIELDS)}.")
+        for record in reader:
+            yield reader.line_num, {key.strip().lower(): value for key, value in record.items() if key}
+    except csv.Error:
+        # слишком длинное поле, NUL-байт и т. п.: дальше файл не читается
+        raise ValueError(f"строка {reader.line_num + 1}: не получилось прочитать CSV.") from None
+
+
+def _iter_json(lines):
+    first = next(lines, "")
+    if first.lstrip().startswith("["):
+        # обычный JSON-массив: размер файла ограничен, читаем целиком
+        try:
+            records = json.loads(first + "".join(lines), parse_float=Decimal)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"некорректный JSON: {e.msg}.") from None
+        except RecursionError:
+            raise ValueError(_TOO_DEEP) from None
+        if not isinstance(records, list):
+            raise ValueError("ожидается массив объектов.")
+        yield from enumerate(records, start=1)
+        return
+    for number, line in enumerate(chain([first], lines), start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line, parse_float=Decimal)
+        except json.JSONDecodeError as e:
+            yield number, ValueError(f"некорректный JSON: {e.msg}.")
+        except RecursionError:
+            yield number, ValueError(_TOO_DEEP)
+
+
+def parse_import(stream: io.BufferedIOBase, filename: str):
+    """
+    Разбирает загруженный файл. Возвращает (платежи, ошибки), где ошибки —
+    список строк «номер строки: что не так». Формат определяется по расширению.
+    """
+    lines = iter(codecs.getreader("utf-8-sig")(stream, errors="replace"))
+    if filename.lower().endswith((".json", ".jsonl")):
+        records = _iter_json(lines)
+    else:
+        records = _iter_csv(lines)
+
+    payments = []
+    errors = []
+    try:
+        for number, record in records:
+            if len(payments) + len(errors) >= MAX_IMPORT_ROWS:
+                errors.append(f"больше {MAX_IMPORT_ROWS} платежей в одном файле.")
+                break
+            try:
+                if isinstance(record, ValueError):
+                    raise record
+                payments.append(_parse_record(record))
+            except ValueError as e:
+                errors.append(f"строка {number}: {e}")
+    except ValueError as e:
+        errors.append(str(e))
+    return payments, errors
+
+
+def _write_export(user_id: int, path: str) -> int:
+    """
+    Выполняется в потоке БД: пишет платежи в CSV по мере чтения страниц.
+    """
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+        for row in db.iter_user_payments(user_id):
+            writer.writerow((row["title"], format_amount(row["amount_minor"]), format_schedule(schedule_of(row))))
+            count += 1
+    return count
+
+
+async def export_payments(user_id: int) -> tuple[str, int]:
+    """
+    Выгружает платежи пользователя во временный CSV-файл.
+    Возвращает (путь, число платежей); файл удаляет вызывающий.
+    """
+    fd, path = tempfile.mkstemp(prefix="payments-", suffix=".csv")
+    os.close(fd)
+    try:
+        return path, await run_in_db_thread(_write_export, user_id, path)
+    except Exception:
+        os.unlink(path)
+        raise
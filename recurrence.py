@@ -0,0 +1,107 @@
+# recurrence.py
+"""
+Периодичность платежей и вычисление дат.
+
+Правило платежа задаётся тремя полями payments:
+- recurrence — weekly / monthly / quarterly / yearly;
+- day_of_month — число месяца (для weekly не используется);
+- anchor_date — опорная дата: её день недели для weekly,
+  её месяц для quarterly и yearly; для monthly не нужна.
+Числа 29–31 в коротких месяцах переносятся на последний день месяца.
+
+Ближайшая дата хранится в payments.next_due_date и сдвигается после
+напоминания, поэтому ежедневная рассылка не разбирает правила всех платежей.
+"""
+import calendar
+from datetime import date, timedelta
+from typing import NamedTuple
+
+WEEKLY = "weekly"
+MONTHLY = "monthly"
+QUARTERLY = "quarterly"
+YEARLY = "yearly"
+
+# Шаг в месяцах для правил по числу месяца
+MONTH_STEPS = {MONTHLY: 1, QUARTERLY: 3, YEARLY: 12}
+
+WEEKDAYS = ("пн", "вт", "ср", "чт", "пт", "сб", "вс")
+
+# Ключевые слова в записи расписания (см. format_schedule и validators.parse_schedule)
+KEYWORDS = {
+    WEEKLY: "еженедельно",
+    QUARTERLY: "ежеквартально",
+    YEARLY: "ежегодно",
+}
+
+# Год опорных дат: високосный, чтобы 29.02 тоже было допустимой датой
+ANCHOR_YEAR = 2000
+
+
+class Schedule(NamedTuple):
+    recurrence: str
+    day_of_month: int
+    anchor_date: date | None = None
+
+
+def weekly_anchor(weekday: int) -> date:
+    # 3 января 2000 — понедельник
+    return date(ANCHOR_YEAR, 1, 3) + timedelta(days=weekday)
+
+
+def _clamped(month_index: int, day_of_month: int) -> date:
+    year, month = divmod(month_index, 12)
+    return date(year, month + 1, min(day_of_month, calendar.monthrange(year, month + 1)[1]))
+
+
+def next_due(schedule: Schedule, today: date) -> date:
+    """
+    Первая дата платежа не раньше today.
+    """
+    recurrence, day_of_month, anchor = schedule
+    if recurrence == WEEKLY:
+        return today + timedelta(days=(anchor.weekday() - today.weekday()) % 7)
+
+    step = MONTH_STEPS[recurrence]
+    month_index = today.year * 12 + today.month - 1
+    if step > 1:
+        # ближайший месяц с тем же остатком от деления на шаг, что и у опорного
+        month_index += (anchor.month - 1 - month_index) % step
+    due = _clamped(month_index, day_of_month)
+    if due < today:
+        due = _clamped(month_index + step, day_of_month)
+    return due
+
+
+def occurrences(schedule: Schedule, start: date, end: date):
+    """
+    Все даты платежа с start (включительно) до end (не включая).
+    """
+    due = next_due(schedule, start)
+    while due < end:
+        yield due
+        due = next_due(schedule, due + timedelta(days=1))
+
+
+def schedule_of(row) -> Schedule:
+    """
+    Правило платежа из строки payments.
+    """
+    anchor = row["anchor_date"]
+    return Schedule(
+        row["recurrence"],
+        row["day_of_month"],
+        date.fromisoformat(anchor) if anchor is not None else None,
+    )
+
+
+def format_schedule(schedule: Schedule) -> str:
+    """
+    Расписание в том же виде, в котором его вводят: «15», «еженедельно пн»,
+    «ежеквартально 15.03», «ежегодно 15.03».
+    """
+    recurrence, day_of_month, anchor = schedule
+    if recurrence == MONTHLY:
+        return str(day_of_month)
+    if recurrence == WEEKLY:
+        return f"{KEYWORDS[WEEKLY]} {WEEKDAYS[anchor.weekday()]}"
+    return f"{KEYWORDS[recurrence]} {day_of_month:02d}.{anchor.month:02d}"
@@ -0,0 +1,341 @@
+# reminders.py
+"""
+Рассылка напоминаний: пул воркеров с ограничением скорости
+(общий лимит бота и лимит на один чат) и повторами после RetryAfter.
+"""
+import asyncio
+import logging
+import time
+from datetime import date, datetime, timedelta
+from itertools import groupby
+from zoneinfo import ZoneInfo
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+import db
+from recurrence import next_due, schedule_of
+from render import build_reminder_text
+from db_async import (
+    run_in_db_thread,
+    claim_outbox_batch,
+    mark_outbox_sent,
+    mark_outbox_failed,
+)
+
+# Лимиты Telegram: ~30 сообщений в секунду на бота и ~1 в секунду в один чат.
+# Берём с запасом.
+GLOBAL_RATE = 25
+PER_CHAT_RATE = 1
+CONCURRENCY = 16
+MAX_ATTEMPTS = 5
+
+# Outbox: сколько записей забирать за раз, на сколько секунд, и сколько
+# всего попыток (с учётом повторных проходов) даётся одному напоминанию
+OUTBOX_BATCH = 200
+OUTBOX_LEASE_SECONDS = 300
+OUTBOX_MAX_ATTEMPTS = 6
+# Пока outbox заполняется, пустой ответ не значит конец: выгрузка ждёт
+# новых записей столько секунд и забирает снова
+OUTBOX_POLL_SECONDS = 0.2
+
+
+class TokenBucket:
+    """
+    Ведро токенов: rate токенов в секунду, не больше capacity за раз.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class DispatchStats:
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.finished_at: float | None = None
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.max_lag = 0.0
+        self._lag_total = 0.0
+
+    def record_sent(self, enqueued_at: float):
+        lag = time.monotonic() - enqueued_at
+        self.sent += 1
+        self._lag_total += lag
+        self.max_lag = max(self.max_lag, lag)
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        return self.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def avg_lag(self) -> float:
+        return self._lag_total / self.sent if self.sent else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"отправлено {self.sent}, ошибок {self.failed}, повторов {self.retried}, "
+            f"{self.elapsed:.1f} с, {self.throughput:.1f} сообщ./с, "
+            f"задержка средняя {self.avg_lag:.1f} с, максимальная {self.max_lag:.1f} с"
+        )
+
+
+class ReminderDispatcher:
+    """
+    Отправляет сообщения пулом из concurrency воркеров.
+    Общий лимит и лимит на чат соблюдаются токен-бакетами, после RetryAfter
+    все воркеры ждут указанное Telegram время.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        concurrency: int = CONCURRENCY,
+        global_rate: float = GLOBAL_RATE,
+        per_chat_rate: float = PER_CHAT_RATE,
+        max_attempts: int = MAX_ATTEMPTS,
+    ):
+        self.bot = bot
+        self.concurrency = concurrency
+        self.per_chat_rate = per_chat_rate
+        self.max_attempts = max_attempts
+        self._global_bucket = TokenBucket(global_rate)
+        self._chat_buckets: dict[int, TokenBucket] = {}
+        self._paused_until = 0.0
+
+    async def run(self, messages, on_sent=None, on_failed=None) -> DispatchStats:
+        """
+        messages — итерируемый (в том числе асинхронно) набор (chat_id, text, ref).
+        Очередь ограничена, поэтому источник читается не быстрее, чем идёт отправка.
+        После отправки вызывается await on_sent(ref), после окончательной
+        неудачи — await on_failed(ref, error).
+        Возвращает статистику рассылки.
+        """
+        stats = DispatchStats()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        workers = [
+            asyncio.create_task(self._worker(queue, stats, on_sent, on_failed))
+            for _ in range(self.concurrency)
+        ]
+        try:
+            if hasattr(messages, "__aiter__"):
+                async for chat_id, text, ref in messages:
+                    await queue.put((chat_id, text, ref, time.monotonic()))
+            else:
+                for chat_id, text, ref in messages:
+                    await queue.put((chat_id, text, ref, time.monotonic()))
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            self._chat_buckets.clear()
+            stats.finished_at = time.monotonic()
+        return stats
+
+    async def _worker(self, queue: asyncio.Queue, stats: DispatchStats, on_sent, on_failed):
+        while True:
+            chat_id, text, ref, enqueued_at = await queue.get()
+            try:
+                try:
+                    await self._send(chat_id, text, enqueued_at, stats)
+                except Exception as e:
+                    stats.failed += 1
+                    logging.error(f"Ошибка отправки напоминания {chat_id}: {e}")
+                    if on_failed is not None:
+                        await on_failed(ref, e)
+                else:
+                    if on_sent is not None:
+                        await on_sent(ref)
+            except Exception as e:
+                logging.error(f"Ошибка обработки результата напоминания {chat_id}: {e}")
+            finally:
+                queue.task_done()
+
+    async def _send(self, chat_id: int, text: str, enqueued_at: float, stats: DispatchStats):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate)
+
+        for attempt in range(1, self.max_attempts + 1):
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            await bucket.acquire()
+            await self._global_bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text)
+            except TelegramRetryAfter as e:
+                # флуд-лимит касается всего бота: притормаживаем все воркеры
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            except (TelegramNetworkError, TelegramServerError):
+                if attempt == self.max_attempts:
+                    raise
+                await asyncio.sleep(min(2 ** attempt, 60))
+            else:
+                stats.record_sent(enqueued_at)
+                return
+            if attempt < self.max_attempts:
+                stats.retried += 1
+        raise RuntimeError(f"не удалось отправить за {self.max_attempts} попыток")
+
+
+# --- Формирование и отправка напоминаний через outbox ---
+
+
+def due_reminder_slots(slices, now: datetime) -> list[tuple[str, int, date]]:
+    """
+    Слоты (tz, remind_hour, местная дата), которые пора заполнять: час
+    напоминаний сегодня уже наступил. Прошедшие часы тоже входят — так
+    прерванная рассылка или пропущенная, пока процесс не работал, продолжится
+    при следующем запуске до конца дня; законченные fill_outbox пропустит
+    по reminder_runs.
+    """
+    slots = []
+    for tz, remind_hour in slices:
+        local_now = now.astimezone(ZoneInfo(tz))
+        if local_now.hour >= remind_hour:
+            slots.append((tz, remind_hour, local_now.date()))
+    return slots
+
+
+def _fill_outbox_page(today: date, tz: str, remind_hour: int, after: tuple[int, int]):
+    """
+    Выполняется в потоке БД: читает платежи, начиная после after, и кладёт
+    в outbox по одному дайджесту на пользователя, пока не наберётся около
+    OUTBOX_BATCH платежей. Строки упорядочены по пользователю, поэтому groupby
+    собирает дайджест за один проход, а пользователь не делится между порциями.
+    Вместе с дайджестом (в одной транзакции) next_due_date платежей переносится
+    на следующую дату, так что прерванное заполнение продолжится с того же места.
+    Платежи, чья дата уже прошла, попадают в дайджест как просроченные, если
+    рассылка слота в тот день не закончилась (процесс упал или не работал).
+    Если закончилась — платёж добавлен после неё, и он только переносится.
+    Возвращает (добавлено записей, after для следующей порции или None в конце).
+    """
+    due_date = today.isoformat()
+    tomorrow = today + timedelta(days=1)
+    finished_runs: dict[str, bool] = {}
+
+    def is_missed(row) -> bool:
+        day = row["next_due_date"]
+        if day not in finished_runs:
+            finished_runs[day] = db.is_reminder_run_finished(tz, remind_hour, day)
+        return not finished_runs[day]
+
+    batch = []
+    advances = []
+    rows = db.iter_payments_due(today, tz, remind_hour, after)
+    for user_id, user_rows in groupby(rows, key=lambda row: row["user_id"]):
+        user_rows = list(user_rows)
+        due_rows = [row for row in user_rows if row["next_due_date"] == due_date]
+        overdue_rows = [row for row in user_rows if row["next_due_date"] < due_date and is_missed(row)]
+        if due_rows or overdue_rows:
+            text = build_reminder_text(due_rows, overdue_rows)
+            batch.append((user_id, user_rows[0]["tg_id"], due_date, text))
+        advances.extend(
+            (next_due(schedule_of(row), tomorrow).isoformat(), row["id"]) for row in user_rows
+        )
+        if len(advances) >= OUTBOX_BATCH:
+            return db.enqueue_reminders(batch, advances), (user_id, user_rows[-1]["id"])
+    added = db.enqueue_reminders(batch, advances) if advances else 0
+    db.mark_reminder_run_finished(tz, remind_hour, due_date, int(time.time()))
+    return added, None
+
+
+async def fill_outbox(today: date, tz: str, remind_hour: int) -> int:
+    """
+    Ставит в outbox напоминания на today для пользователей слота (tz, remind_hour).
+    Каждая порция — отдельный вызов в потоке БД, так что между ними поток
+    обслуживает другие запросы, а drain_outbox уже отправляет поставленное.
+    Повторный вызов для того же дня ничего не дублирует.
+    """
+    if await run_in_db_thread(db.is_reminder_run_finished, tz, remind_hour, today.isoformat()):
+        return 0
+    added = 0
+    after = (0, 0)
+    while after is not None:
+        page_added, after = await run_in_db_thread(_fill_outbox_page, today, tz, remind_hour, after)
+        added += page_added
+    return added
+
+
+async def _iter_outbox(partition: tuple[int, int], filled: asyncio.Event | None = None):
+    while True:
+        rows = await claim_outbox_batch(int(time.time()), OUTBOX_BATCH, OUTBOX_LEASE_SECONDS, partition)
+        if not rows:
+            if filled is None or filled.is_set():
+                return
+            try:
+                await asyncio.wait_for(filled.wait(), OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        for row in rows:
+            yield row["tg_id"], row["text"], (row["id"], row["attempts"])
+
+
+async def _on_outbox_sent(ref):
+    outbox_id, _attempts = ref
+    await mark_outbox_sent(outbox_id, int(time.time()))
+
+
+async def _on_outbox_failed(ref, error: Exception):
+    outbox_id, attempts = ref
+    if isinstance(error, (TelegramForbiddenError, TelegramBadRequest)) or attempts >= OUTBOX_MAX_ATTEMPTS:
+        # бот заблокирован, чат не найден или попытки кончились — повторять бессмысленно
+        next_retry_at = None
+    else:
+        next_retry_at = int(time.time()) + min(60 * 2 ** attempts, 3600)
+    await mark_outbox_failed(outbox_id, str(error), next_retry_at)
+
+
+_drain_lock = asyncio.Lock()
+
+
+async def drain_outbox(
+    dispatcher: ReminderDispatcher,
+    partition: tuple[int, int] = (0, 1),
+    filled: asyncio.Event | None = None,
+) -> DispatchStats | None:
+    """
+    Отправляет всё, что в outbox уже пора отправить: новые записи, повторы после
+    ошибок и записи, оставшиеся от упавшего процесса.
+    partition = (номер процесса, всего процессов) — см. db.claim_outbox_batch.
+    filled — событие конца заполнения outbox: пока оно не наступило, выгрузка
+    не заканчивается на пустом outbox, а ждёт следующих порций.
+    Если выгрузка уже идёт, новая не запускается: текущая подхватит и новые записи.
+    """
+    if _drain_lock.locked():
+        return None
+    async with _drain_lock:
+        return await dispatcher.run(
+            _iter_outbox(partition, filled),
+            on_sent=_on_outbox_sent,
+            on_failed=_on_outbox_failed,
+        )
@@ -0,0 +1,373 @@
+# render.py
+"""
+Тексты и клавиатуры сообщений о платежах.
+
+Клавиатуры — неизменяемые объекты aiogram, поэтому одинаковые
+(тот же платёж, тот же набор кнопок) строятся один раз и берутся из кэша.
+Списки собираются одним join, без промежуточных конкатенаций.
+Бот шлёт сообщения с parse_mode="HTML", поэтому названия платежей в текстах
+экранируются; в подписях кнопок разметка не разбирается — там они как есть.
+"""
+from datetime import date
+from functools import lru_cache
+from itertools import islice
+from html import escape
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from callbacks import Action, pack
+from money import format_amount
+from recurrence import MONTHLY, QUARTERLY, WEEKDAYS, WEEKLY, Schedule, schedule_of
+
+# Сколько клавиатур каждого вида держать в кэше
+KB_CACHE_SIZE = 4096
+
+# Список в /list, в сводке и в напоминании: не больше стольких платежей и символов, чтобы
+# сообщение уместилось в лимит Telegram (4096), остальные — в редакторе
+MAX_LISTED_PAYMENTS = 30
+MAX_LIST_CHARS = 3000
+# Длиннее название в строке «Ближайший» и в напоминаниях обрезается
+MAX_TITLE_PREVIEW = 100
+
+NO_PAYMENTS_TEXT = "У вас пока нет регулярных платежей. Используйте /add, чтобы добавить."
+
+
+def build_schedule_text(schedule: Schedule) -> str:
+    """
+    Когда платить: «15-го числа», «еженедельно (пт)», «ежегодно 15.03»,
+    «ежеквартально (15.03, 15.06, 15.09, 15.12)».
+    """
+    recurrence, day_of_month, anchor = schedule
+    if recurrence == MONTHLY:
+        return f"{day_of_month}-го числа"
+    if recurrence == WEEKLY:
+        return f"еженедельно ({WEEKDAYS[anchor.weekday()]})"
+    if recurrence == QUARTERLY:
+        first = (anchor.month - 1) % 3 + 1
+        dates = ", ".join(f"{day_of_month:02d}.{month:02d}" for month in range(first, 13, 3))
+        return f"ежеквартально ({dates})"
+    return f"ежегодно {day_of_month:02d}.{anchor.month:02d}"
+
+
+def build_payment_text(p) -> str:
+    """
+    Текст сообщения для платежа.
+    p — это row из БД (sqlite3.Row).
+    """
+    return f"{escape(p['title'])} — {format_amount(p['amount_minor'])} ₽, {build_schedule_text(schedule_of(p))}"
+
+
+def build_payment_lines(rows, first: int | None = None) -> str:
+    """
+    Платежи по одному в строке; first — номер первой строки, если нужна нумерация.
+    """
+    if first is None:
+        return "\n".join(map(build_payment_text, rows))
+    return "\n".join(
+        f"{number}. {build_payment_text(p)}" for number, p in enumerate(rows, start=first)
+    )
+
+
+def _take_lines(lines, count: int, chars: int) -> tuple[list[str], int]:
+    """
+    Первые строки, пока их не больше count и вместе с переводами строк
+    не больше chars символов. Возвращает (строки, сколько символов осталось).
+    """
+    taken = []
+    for line in islice(lines, max(count, 0)):
+        if len(line) + 1 > chars:
+            break
+        chars -= len(line) + 1
+        taken.append(line)
+    return taken, chars
+
+
+def build_capped_payment_lines(rows) -> str:
+    """
+    Платежи по одному в строке, но не больше MAX_LISTED_PAYMENTS строк
+    и MAX_LIST_CHARS символов; об остальных — «… и ещё N» со ссылкой на редактор.
+    """
+    lines, _chars = _take_lines(map(build_payment_text, rows), MAX_LISTED_PAYMENTS, MAX_LIST_CHARS)
+    more = len(rows) - len(lines)
+    if more > 0:
+        lines.append(f"… и ещё {more} — все платежи в редакторе, кнопка «✏️ Редактировать / удалять»")
+    return "\n".join(lines)
+
+
+def build_list_text(rows) -> str:
+    return "Ваши регулярные платежи:\n\n" + build_capped_payment_lines(rows)
+
+
+def build_dashboard_parts(summary, today: date) -> tuple[str, str]:
+    """
+    Части сводки, которые зависят только от платежей и даты: список с суммой
+    в месяц и ближайший платёж. Между ними build_dashboard_text вставляет
+    остаток — он меняется и от отметок об оплате.
+    """
+    row, due_date = summary.next_due(today)
+    days_left = (due_date - today).days
+    when = "сегодня" if days_left == 0 else f"{due_date:%d.%m} (через {days_left} дн.)"
+    head = (
+        f"📊 Сводка на {today:%d.%m.%Y}\n\n"
+        f"{build_capped_payment_lines(summary.rows)}\n\n"
+        f"Ежемесячные платежи: {format_amount(summary.month_total())} ₽ в месяц"
+    )
+    nearest = f"Ближайший: {_title_preview(row)} — {format_amount(row['amount_minor'])} ₽, {when}"
+    return head, nearest
+
+
+def build_dashboard_text(parts: tuple[str, str], month_summary, weekly) -> str:
+    """
+    Сводка из build_dashboard_parts и остатка месяца по monthly_summary —
+    того же, что в /rest; weekly — итоги еженедельных (db.get_weekly_totals).
+    """
+    head, nearest = parts
+    remaining = month_summary["total_minor"] - month_summary["paid_minor"] if month_summary else 0
+    note = " (без еженедельных)" if weekly["payments_count"] else ""
+    return f"{head}\nОсталось оплатить в этом месяце{note}: {format_amount(remaining)} ₽\n{nearest}"
+
+
+def _title_preview(row) -> str:
+    title = row["title"] if len(row["title"]) <= MAX_TITLE_PREVIEW else row["title"][:MAX_TITLE_PREVIEW - 1] + "…"
+    return escape(title)
+
+
+def _reminder_line(row) -> str:
+    return f"{_title_preview(row)} — {format_amount(row['amount_minor'])} ₽"
+
+
+def _overdue_line(row) -> str:
+    return f"{_reminder_line(row)}, срок {row['next_due_date'][8:]}.{row['next_due_date'][5:7]}"
+
+
+def build_reminder_text(rows, overdue=()) -> str:
+    """
+    Одно напоминание на все платежи пользователя за день.
+    overdue — платежи, о которых не напомнили в их день; они идут
+    отдельным списком «Просрочены» с датой платежа (next_due_date).
+    Строк вместе не больше MAX_LISTED_PAYMENTS и MAX_LIST_CHARS символов,
+    об остальных — «… и ещё N»; «Итого» считается по всем платежам.
+    """
+    if len(rows) == 1 and not overdue:
+        return f"Напоминание о платеже:\n\n{_reminder_line(rows[0])} сегодня."
+
+    today_lines, chars = _take_lines(map(_reminder_line, rows), MAX_LISTED_PAYMENTS, MAX_LIST_CHARS)
+    overdue_lines, _chars = _take_lines(
+        map(_overdue_line, overdue), MAX_LISTED_PAYMENTS - len(today_lines), chars
+    )
+    more = len(rows) + len(overdue) - len(today_lines) - len(overdue_lines)
+    total = sum(row["amount_minor"] for row in rows) + sum(row["amount_minor"] for row in overdue)
+
+    if not overdue:
+        head = "Напоминание о платежах сегодня:"
+        parts = ["\n".join(today_lines)]
+    else:
+        head = "Напоминание о платежах:"
+        parts = []
+        if today_lines:
+            parts.append("Сегодня:\n" + "\n".join(today_lines))
+        if overdue_lines:
+            parts.append("Просрочены:\n" + "\n".join(overdue_lines))
+    if more > 0:
+        parts.append(f"… и ещё {more} — все платежи в /list")
+    return f"{head}\n\n" + "\n\n".join(parts) + f"\n\nИтого: {format_amount(total)} ₽"
+
+
+def build_edit_page_text(rows, page: int, first: int) -> str:
+    return (
+        f"Выберите платёж для редактирования (стр. {page + 1}):\n\n"
+        + build_payment_lines(rows, first)
+    )
+
+
+def build_edit_page_kb(rows, page: int, first: int, has_next: bool) -> InlineKeyboardMarkup:
+    """
+    Кнопка на каждый платёж страницы и навигация по страницам.
+    """
+    keyboard = [
+        [build_open_payment_button(p["id"], page, number, p["title"])]
+        for number, p in enumerate(rows, start=first)
+    ]
+    nav = []
+    if page > 0:
+        nav.append(build_page_button("◀️", page - 1))
+    if has_next:
+        nav.append(build_page_button("▶️", page + 1))
+    if nav:
+        keyboard.append(nav)
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+@lru_cache(maxsize=KB_CACHE_SIZE)
+def build_open_payment_button(payment_id: int, page: int, number: int, title: str) -> InlineKeyboardButton:
+    return InlineKeyboardButton(text=f"{number}. {title}", callback_data=pack(Action.VIEW, payment_id, page))
+
+
+@lru_cache(maxsize=64)
+def build_page_button(text: str, page: int) -> InlineKeyboardButton:
+    return InlineKeyboardButton(text=text, callback_data=pack(Action.PAGE, page=page))
+
+
+def build_back_to_list_button(page: int = 0) -> InlineKeyboardButton:
+    return build_page_button("⬅️ К списку", page)
+
+
+@lru_cache(maxsize=64)
+def build_back_to_list_kb(page: int = 0) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[[build_back_to_list_button(page)]])
+
+
+@lru_cache(maxsize=KB_CACHE_SIZE)
+def build_payment_inline_kb(payment_id: int, page: int | None = None) -> InlineKeyboardMarkup:
+    """
+    Клавиатура под платежом: редактировать по полям / удалить.
+    page — страница редактора, на которую ведёт кнопка «К списку».
+    """
+    rows = [
+        [
+            InlineKeyboardButton(
+                text="✏️ Название",
+                callback_data=pack(Action.EDIT_TITLE, payment_id, page or 0),
+            ),
+            InlineKeyboardButton(
+                text="💸 Сумма",
+                callback_data=pack(Action.EDIT_AMOUNT, payment_id, page or 0),
+            ),
+        ],
+        [
+            InlineKeyboardButton(
+                text="📅 Дата",
+                callback_data=pack(Action.EDIT_DAY, payment_id, page or 0),
+            ),
+            InlineKeyboardButton(
+                text="🗑 Удалить",
+                callback_data=pack(Action.DELETE, payment_id, page or 0),
+            ),
+        ],
+    ]
+    if page is not None:
+        rows.append([build_back_to_list_button(page)])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+@lru_cache(maxsize=KB_CACHE_SIZE)
+def build_confirm_delete_kb(payment_id: int, page: int = 0) -> InlineKeyboardMarkup:
+    """
+    Клавиатура подтверждения удаления: Да / Нет.
+    page — страница редактора, куда вернуться после ответа.
+    """
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(
+                    text="✅ Да",
+                    callback_data=pack(Action.DELETE_YES, payment_id, page),
+                ),
+                InlineKeyboardButton(
+                    text="❌ Нет",
+                    callback_data=pack(Action.DELETE_NO, payment_id, page),
+                ),
+            ]
+        ]
+    )
+
+
+@lru_cache(maxsize=1)
+def build_list_edit_kb() -> InlineKeyboardMarkup:
+    """
+    Клавиатура под сводным списком: одна кнопка для входа в режим редактирования.
+    """
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(
+                    text="✏️ Редактировать / удалять",
+                    callback_data=pack(Action.OPEN_LIST),
+                )
+            ]
+        ]
+    )
+
+
+def _weekly_note(weekly) -> str:
+    return (
+        f"Еженедельные платежи ({weekly['payments_count']} на {format_amount(weekly['total_minor'])} ₽ "
+        "в неделю) по месяцам не отмечаются и сюда не входят — они есть в /forecast."
+    )
+
+
+def build_rest_text(summary, unpaid, month: date, more: int, weekly=None) -> str:
+    """
+    Остаток месяца по итогам из monthly_summary и список неоплаченных.
+    more — сколько неоплаченных не поместилось в список;
+    weekly — итоги еженедельных платежей (db.get_weekly_totals), о них — отдельной строкой.
+    """
+    has_weekly = weekly is not None and weekly["payments_count"] > 0
+    if summary is None or summary["payments_count"] == 0:
+        if has_weekly:
+            return f"Платежей с отметкой об оплате за {month:%m.%Y} нет.\n\n{_weekly_note(weekly)}"
+        return NO_PAYMENTS_TEXT
+
+    text = (
+        f"Платежи за {month:%m.%Y}:\n"
+        f"Оплачено: {format_amount(summary['paid_minor'])} из {format_amount(summary['total_minor'])} ₽ "
+        f"({summary['paid_count']} из {summary['payments_count']})\n"
+        f"Осталось оплатить: {format_amount(summary['total_minor'] - summary['paid_minor'])} ₽"
+    )
+    if not unpaid:
+        text += "\n\nВсё оплачено 🎉"
+    else:
+        lines = "\n".join(
+            f"{row['due_date'][8:]}.{row['due_date'][5:7]} {escape(row['title'])} — {format_amount(row['amount_minor'])} ₽"
+            for row in unpaid
+        )
+        if more > 0:
+            lines += f"\n… и ещё {more}"
+        text += f"\n\nНе оплачено:\n{lines}"
+    if has_weekly:
+        text += f"\n\n{_weekly_note(weekly)}"
+    return text
+
+
+def build_rest_kb(unpaid) -> InlineKeyboardMarkup | None:
+    if not unpaid:
+        return None
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [build_pay_button(row["id"], row["title"], row["amount_minor"])] for row in unpaid
+        ]
+    )
+
+
+@lru_cache(maxsize=KB_CACHE_SIZE)
+def build_pay_button(instance_id: int, title: str, amount_minor: int) -> InlineKeyboardButton:
+    return InlineKeyboardButton(
+        text=f"✅ {title} — {format_amount(amount_minor)} ₽",
+        callback_data=pack(Action.PAY, instance_id),
+    )
+
+
+def build_history_text(rows) -> str:
+    if not rows:
+        return "История пока пуста: она появится после первого месяца с платежами."
+    lines = "\n".join(
+        f"{row['month'][5:]}.{row['month'][:4]}: оплачено {format_amount(row['paid_minor'])} "
+        f"из {format_amount(row['total_minor'])} ₽ ({row['paid_count']}/{row['payments_count']})"
+        for row in rows
+    )
+    return "История по месяцам:\n\n" + lines
+
+
+def build_forecast_text(start: date, last_day: date, by_month) -> str:
+    """
+    Прогноз с start по last_day включительно; by_month — итоги forecast.split_by_month.
+    """
+    lines = "\n".join(
+        f"{first:%m.%Y}: {format_amount(outflow)} ₽ (нарастающим итогом {format_amount(total)} ₽)"
+        for first, outflow, total in by_month
+    )
+    return (
+        f"Прогноз платежей с {start:%d.%m.%Y} по {last_day:%d.%m.%Y}:\n\n"
+        f"{lines}\n\n"
+        f"Итого: {format_amount(by_month[-1][2])} ₽"
+    )
@@ -0,0 +1,48 @@
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmark",
+        action="store_true",
+        help="запустить и замеры производительности (benchmark), они долгие",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: замер производительности, запускается с --benchmark")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmark"):
+        return
+    skip = pytest.mark.skip(reason="замер производительности: pytest --benchmark -s")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    """
+    Соединение с чистой базой во временном каталоге, схема — через db.migrate.
+    Соединения потоков и кэши db на время теста свои.
+    """
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "payments.db")
+    monkeypatch.setattr(db, "_local", threading.local())
+    monkeypatch.setattr(db, "_connections", [])
+    monkeypatch.setattr(db, "_multiprocess", False)
+    for cache in (db._user_id_cache, db._summary_cache, db._materialized_months):
+        cache.clear()
+    connection = db.get_connection()
+    db.migrate(connection)
+    yield connection
+    db.close_connections()
@@ -0,0 +1,102 @@
+"""
+Поддельный Telegram Bot API для тестов: aiohttp-сервер на 127.0.0.1.
+getUpdates отдаёт обновления из очереди (с ожиданием, как long polling),
+sendMessage запоминается, на остальные вызовы бота отвечает «ok».
+"""
+import asyncio
+import json
+import time
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp import web
+
+TOKEN = "42:TEST"
+BOT_USER = {"id": 42, "is_bot": True, "first_name": "Платежи", "username": "payments_test_bot"}
+
+
+class FakeTelegramAPI:
+    def __init__(self):
+        # очередь для getUpdates и отправленные сообщения: (время, chat_id, текст)
+        self.updates: list[dict] = []
+        self.sent: list[tuple[float, int, str]] = []
+        self.calls: dict[str, int] = {}
+        self.url = ""
+        self._next_update_id = 1
+        self._changed: asyncio.Condition | None = None
+        self._runner: web.AppRunner | None = None
+
+    async def start(self):
+        self._changed = asyncio.Condition()
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    def bot(self) -> Bot:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(self.url))
+        return Bot(TOKEN, session=session, default=DefaultBotProperties(parse_mode="HTML"))
+
+    async def push_updates(self, updates: list[dict]):
+        """
+        Ставит обновления в очередь getUpdates, update_id назначаются по порядку.
+        """
+        for update in updates:
+            self.updates.append({**update, "update_id": self._next_update_id})
+            self._next_update_id += 1
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def wait_sent(self, count: int, timeout: float = 30):
+        async with self._changed:
+            await asyncio.wait_for(self._changed.wait_for(lambda: len(self.sent) >= count), timeout)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        self.calls[method] = self.calls.get(method, 0) + 1
+        params = dict(await request.post())
+        if method == "getme":
+            return self._ok(BOT_USER)
+        if method == "getupdates":
+            return self._ok(await self._get_updates(params))
+        if method == "sendmessage":
+            return self._ok(await self._send_message(params))
+        return self._ok(True)
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        offset = int(params.get("offset", 0))
+        timeout = min(float(params.get("timeout", 0)), 1.0)
+        self.updates = [update for update in self.updates if update["update_id"] >= offset]
+        if not self.updates and timeout > 0:
+            async with self._changed:
+                try:
+                    await asyncio.wait_for(self._changed.wait_for(lambda: bool(self.updates)), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        return self.updates[:100]
+
+    async def _send_message(self, params: dict) -> dict:
+        chat_id = int(params["chat_id"])
+        self.sent.append((time.monotonic(), chat_id, params["text"]))
+        async with self._changed:
+            self._changed.notify_all()
+        return {
+            "message_id": len(self.sent),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": params["text"],
+        }
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.Response(text=json.dumps({"ok": True, "result": result}), content_type="application/json")
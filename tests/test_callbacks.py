@@ -0,0 +1,38 @@
+"""
+callback_data кнопок: упаковка и разбор PaymentCb, старый формат
+и испорченные данные.
+"""
+import pytest
+
+from callbacks import _LEGACY_ACTIONS, Action, PaymentCb, decode_callback, pack
+
+
+@pytest.mark.parametrize(
+    "action, payment_id, page",
+    [(Action.OPEN_LIST, 0, 0), (Action.PAGE, 0, 3), (Action.VIEW, 42, 1), (Action.PAY, 123456789, 0)],
+)
+def test_pack_round_trip(action, payment_id, page):
+    data = pack(action, payment_id, page)
+    assert data.startswith("p1:") and len(data.encode()) <= 64
+    assert decode_callback(data) == PaymentCb(a=action, id=payment_id, pg=page)
+
+
+@pytest.mark.parametrize("prefix, action", sorted(_LEGACY_ACTIONS.items()))
+def test_legacy_buttons_are_decoded(prefix, action):
+    if action == Action.PAGE:
+        assert decode_callback(f"{prefix}:2") == PaymentCb(a=action, pg=2)
+    else:
+        assert decode_callback(f"{prefix}:42") == PaymentCb(a=action, id=42)
+        assert decode_callback(f"{prefix}:42:3") == PaymentCb(a=action, id=42, pg=3)
+
+
+def test_open_edit_list():
+    assert decode_callback("open_edit_list") == PaymentCb(a=Action.OPEN_LIST)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [None, "", "p1", "p1:t", "p1:t:42", "p1:t:42:0:5", "p1:t:x:0", "edit_title:", "edit_title:x", "p2:t:42:0", "unknown:1"],
+)
+def test_malformed_data_is_not_decoded(data):
+    assert decode_callback(data) is None
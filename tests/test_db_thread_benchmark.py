@@ -0,0 +1,114 @@
+"""
+Нагрузочный замер задержки обработчиков: вызовы db.py прямо в event loop
+против потока БД (db_async). Обновления приходят с постоянным шагом;
+каждое десятое пишет платёж (коммит), остальные отвечают из кэшей
+(пользователь и сводка), как /list и /dashboard при повторных нажатиях.
+Медленный диск изображается задержкой COMMIT_DELAY на каждый COMMIT.
+Задержка обработчика — от плановой отметки прихода до конца обработки.
+Запуск: pytest --benchmark -s.
+"""
+import asyncio
+import statistics
+import time
+from decimal import Decimal
+
+import pytest
+
+import db
+import db_async
+from recurrence import MONTHLY, Schedule
+
+pytestmark = pytest.mark.benchmark
+
+UPDATES = 2000
+INTERVAL = 0.001
+WRITE_EVERY = 10
+READERS = 100
+WRITER_TG_ID = 1
+# «fsync» медленного диска
+COMMIT_DELAY = 0.005
+
+
+def _slow_commits(sql: str):
+    if sql.lstrip().upper().startswith("COMMIT"):
+        time.sleep(COMMIT_DELAY)
+
+
+def _direct_write(user_id: int):
+    db.add_payment(user_id, "Платёж", Decimal("100"), Schedule(MONTHLY, 5))
+
+
+def _direct_read(tg_id: int):
+    db.get_payment_summary(db.get_cached_user_id(tg_id))
+
+
+async def _direct(kind: str, arg: int):
+    if kind == "write":
+        _direct_write(arg)
+    else:
+        _direct_read(arg)
+
+
+async def _threaded(kind: str, arg: int):
+    if kind == "write":
+        await db_async.add_payment(arg, "Платёж", Decimal("100"), Schedule(MONTHLY, 5))
+    else:
+        await db_async.get_payment_summary(await db_async.get_or_create_user(arg))
+
+
+async def _replay(handle, writer_id: int) -> dict[str, list[float]]:
+    loop = asyncio.get_running_loop()
+    latencies = {"write": [], "read": []}
+
+    async def run(kind: str, arg: int, arrived: float):
+        await handle(kind, arg)
+        latencies[kind].append(loop.time() - arrived)
+
+    tasks = []
+    start = loop.time()
+    for i in range(UPDATES):
+        arrived = start + i * INTERVAL
+        await asyncio.sleep(max(0.0, arrived - loop.time()))
+        if i % WRITE_EVERY == 0:
+            task = run("write", writer_id, arrived)
+        else:
+            task = run("read", 100 + i % READERS, arrived)
+        tasks.append(asyncio.create_task(task))
+    await asyncio.gather(*tasks)
+    return latencies
+
+
+def _p(values: list[float], q: int) -> float:
+    return statistics.quantiles(values, n=100)[q - 1] * 1000
+
+
+def test_handler_latency_with_and_without_db_thread(conn, monkeypatch):
+    open_connection = db._open_connection
+
+    def open_slow_connection():
+        connection = open_connection()
+        connection.set_trace_callback(_slow_commits)
+        return connection
+
+    monkeypatch.setattr(db, "_open_connection", open_slow_connection)
+    conn.set_trace_callback(_slow_commits)
+
+    writer_id = db.upsert_user(WRITER_TG_ID)
+    for tg_id in range(100, 100 + READERS):
+        user_id = db.upsert_user(tg_id)
+        db.add_payment(user_id, "Аренда", Decimal("30000"), Schedule(MONTHLY, 5))
+        db.get_payment_summary(user_id)
+
+    results = {}
+    for name, handle in (("напрямую", _direct), ("поток БД", _threaded)):
+        # сводки пользователей в кэше у обоих вариантов, поток БД прогрет
+        asyncio.run(_replay(handle, writer_id))
+        results[name] = asyncio.run(_replay(handle, writer_id))
+
+    for name, latencies in results.items():
+        print(
+            f"\n{name}: чтение p50 {_p(latencies['read'], 50):.2f} мс, p99 {_p(latencies['read'], 99):.2f} мс; "
+            f"запись p50 {_p(latencies['write'], 50):.2f} мс, p99 {_p(latencies['write'], 99):.2f} мс"
+        )
+    # ответы из кэша не ждут коммитов чужих обновлений
+    assert _p(results["поток БД"]["read"], 99) < _p(results["напрямую"]["read"], 99)
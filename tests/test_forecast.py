@@ -0,0 +1,92 @@
+"""
+Прогноз /forecast: project и split_by_month сверяются с перебором дней
+по recurrence.next_due.
+"""
+from datetime import date, timedelta
+
+import pytest
+
+import db
+from forecast import add_months, project, split_by_month
+from recurrence import ANCHOR_YEAR, MONTHLY, QUARTERLY, WEEKLY, YEARLY, Schedule, next_due, weekly_anchor
+
+SCHEDULES = [
+    (Schedule(MONTHLY, 1), 100_000),
+    (Schedule(MONTHLY, 15), 20_000),
+    (Schedule(MONTHLY, 29), 3_000),
+    (Schedule(MONTHLY, 30), 400),
+    (Schedule(MONTHLY, 31), 50),
+    (Schedule(WEEKLY, 0, weekly_anchor(4)), 6),
+    (Schedule(QUARTERLY, 31, date(ANCHOR_YEAR, 11, 1)), 700_000),
+    (Schedule(YEARLY, 29, date(ANCHOR_YEAR, 2, 29)), 8_000_000),
+    (Schedule(YEARLY, 31, date(ANCHOR_YEAR, 12, 31)), 90_000_000),
+]
+
+
+def _summary(schedules=SCHEDULES) -> db.PaymentSummary:
+    rows = [
+        {
+            "id": number,
+            "title": f"Платёж {number}",
+            "amount_minor": amount,
+            "day_of_month": schedule.day_of_month,
+            "recurrence": schedule.recurrence,
+            "anchor_date": schedule.anchor_date.isoformat() if schedule.anchor_date else None,
+        }
+        for number, (schedule, amount) in enumerate(schedules, start=1)
+    ]
+    rows.sort(key=lambda row: row["day_of_month"])
+    return db.PaymentSummary(rows)
+
+
+def _by_day(start: date, end: date) -> list[int]:
+    daily = []
+    day = start
+    while day < end:
+        daily.append(sum(amount for schedule, amount in SCHEDULES if next_due(schedule, day) == day))
+        day += timedelta(days=1)
+    return daily
+
+
+def test_add_months_clamps_to_short_months():
+    assert add_months(date(2027, 1, 31), 1) == date(2027, 2, 28)
+    assert add_months(date(2028, 1, 31), 1) == date(2028, 2, 29)
+    assert add_months(date(2026, 10, 16), 12) == date(2027, 10, 16)
+    assert add_months(date(2026, 12, 31), 2) == date(2027, 2, 28)
+
+
+@pytest.mark.parametrize(
+    "start, months",
+    [
+        (date(2027, 1, 31), 2),  # с 31-го через февраль обычного года
+        (date(2028, 1, 29), 2),  # февраль високосного
+        (date(2028, 2, 29), 1),
+        (date(2026, 10, 16), 12),  # через границу года
+        (date(2027, 12, 1), 12),
+    ],
+)
+def test_project_matches_next_due(start, months):
+    end = add_months(start, months)
+    daily = _by_day(start, end)
+    cumulative = project(_summary(), start, months)
+    assert len(cumulative) == (end - start).days
+    assert [b - a for a, b in zip([0, *cumulative], cumulative)] == daily
+
+    expected = []
+    day = start
+    while day < end:
+        month_end = min((day.replace(day=28) + timedelta(days=4)).replace(day=1), end)
+        spent = sum(daily[(day - start).days:(month_end - start).days])
+        expected.append((day, spent, (expected[-1][2] if expected else 0) + spent))
+        day = month_end
+    assert split_by_month(start, cumulative) == expected
+
+
+def test_days_29_31_fall_on_the_last_day_of_february():
+    summary = _summary(SCHEDULES[2:5])
+    # 29, 30 и 31 числа — все в последний день февраля: 28-го, а в високосный год 29-го
+    for start, last_day in ((date(2027, 2, 1), 28), (date(2028, 2, 1), 29)):
+        cumulative = project(summary, start, 1)
+        assert len(cumulative) == last_day
+        assert cumulative[last_day - 2] == 0 and cumulative[last_day - 1] == 3_450
+        assert split_by_month(start, cumulative) == [(start, 3_450, 3_450)]
@@ -0,0 +1,131 @@
+"""
+SQLiteStorage: накопление записей, чтение ещё не записанного из памяти,
+истечение по TTL и удаление пустых состояний.
+"""
+import asyncio
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+
+import fsm_storage
+from fsm_storage import SQLiteStorage
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+OTHER_KEY = StorageKey(bot_id=1, chat_id=20, user_id=20)
+
+
+def _rows(conn):
+    return conn.execute("SELECT key, state, data FROM fsm_storage ORDER BY key").fetchall()
+
+
+def _record_saves(monkeypatch) -> list:
+    calls = []
+    save = fsm_storage.fsm_save
+
+    async def recording_save(entries, now):
+        calls.append(dict(entries))
+        await save(entries, now)
+
+    monkeypatch.setattr(fsm_storage, "fsm_save", recording_save)
+    return calls
+
+
+def test_changes_of_one_handler_are_written_once(conn, monkeypatch):
+    saves = _record_saves(monkeypatch)
+
+    async def scenario():
+        storage = SQLiteStorage(flush_delay=0.01)
+        await storage.set_state(KEY, "AddPaymentForm:amount")
+        await storage.update_data(KEY, {"title": "Аренда"})
+        await storage.set_state(OTHER_KEY, "AddPaymentForm:title")
+        await asyncio.sleep(0.05)
+        await storage.close()
+
+    asyncio.run(scenario())
+    assert saves == [
+        {
+            SQLiteStorage._key(KEY): {"state": "AddPaymentForm:amount", "data": '{"title": "Аренда"}'},
+            SQLiteStorage._key(OTHER_KEY): {"state": "AddPaymentForm:title"},
+        }
+    ]
+    assert [(row["state"], row["data"]) for row in _rows(conn)] == [
+        ("AddPaymentForm:amount", '{"title": "Аренда"}'),
+        ("AddPaymentForm:title", "{}"),
+    ]
+
+
+def test_pending_changes_are_read_from_memory(conn):
+    async def scenario():
+        storage = SQLiteStorage(flush_delay=60)
+        await storage.set_state(KEY, "AddPaymentForm:day")
+        await storage.update_data(KEY, {"amount": "100"})
+        state, data = await storage.get_state(KEY), await storage.get_data(KEY)
+        assert _rows(conn) == []
+        await storage.close()
+        return state, data
+
+    assert asyncio.run(scenario()) == ("AddPaymentForm:day", {"amount": "100"})
+    assert len(_rows(conn)) == 1
+
+
+def test_without_delay_other_storages_see_the_change(conn):
+    # два хранилища — как два процесса бота с одной базой
+    async def scenario():
+        first, second = SQLiteStorage(flush_delay=0), SQLiteStorage(flush_delay=0)
+        await first.set_state(KEY, "EditPaymentForm:new_title")
+        await first.update_data(KEY, {"edit_payment_id": 7})
+        result = await second.get_state(KEY), await second.get_data(KEY)
+        await first.close()
+        await second.close()
+        return result
+
+    assert asyncio.run(scenario()) == ("EditPaymentForm:new_title", {"edit_payment_id": 7})
+
+
+def test_expired_states_are_ignored_and_purged(conn):
+    async def scenario():
+        storage = SQLiteStorage(ttl=3600, flush_delay=0)
+        await storage.set_state(KEY, "AddPaymentForm:title")
+        await storage.set_state(OTHER_KEY, "AddPaymentForm:title")
+        conn.execute(
+            "UPDATE fsm_storage SET updated_at = ? WHERE key = ?",
+            (int(time.time()) - 3601, SQLiteStorage._key(KEY)),
+        )
+        conn.commit()
+        result = await storage.get_state(KEY), await storage.get_data(KEY), await storage.purge_expired()
+        await storage.close()
+        return result
+
+    assert asyncio.run(scenario()) == (None, {}, 1)
+    assert [row["key"] for row in _rows(conn)] == [SQLiteStorage._key(OTHER_KEY)]
+
+
+def test_cleared_state_row_is_deleted(conn):
+    async def scenario():
+        storage = SQLiteStorage(flush_delay=0)
+        await storage.set_state(KEY, "AddPaymentForm:amount")
+        await storage.update_data(KEY, {"title": "Аренда"})
+        await storage.set_state(OTHER_KEY, "AddPaymentForm:amount")
+        await storage.update_data(OTHER_KEY, {"title": "Связь"})
+
+        # state.clear(): состояние None и пустые данные — строки не остаётся
+        await storage.set_state(KEY, None)
+        await storage.set_data(KEY, {})
+        # без состояния, но с данными — строка остаётся
+        await storage.set_state(OTHER_KEY, None)
+        await storage.close()
+
+    asyncio.run(scenario())
+    assert [(row["key"], row["state"], row["data"]) for row in _rows(conn)] == [
+        (SQLiteStorage._key(OTHER_KEY), None, '{"title": "Связь"}'),
+    ]
+
+
+def test_close_writes_pending_changes(conn):
+    async def scenario():
+        storage = SQLiteStorage(flush_delay=60)
+        await storage.set_state(KEY, "AddPaymentForm:title")
+        await storage.close()
+
+    asyncio.run(scenario())
+    assert [row["state"] for row in _rows(conn)] == ["AddPaymentForm:title"]
@@ -0,0 +1,52 @@
+"""
+SQLiteStorage против MemoryStorage: шаги диалога добавления платежа
+(get_state, update_data, set_state — как в обработчике) для 1000
+пользователей по очереди. Запуск: pytest --benchmark -s.
+"""
+import asyncio
+import time
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from fsm_storage import FLUSH_DELAY, SQLiteStorage
+
+pytestmark = pytest.mark.benchmark
+
+USERS = 1000
+STEPS = ("AddPaymentForm:title", "AddPaymentForm:amount", "AddPaymentForm:day")
+
+
+async def _dialog_steps(storage) -> float:
+    keys = [StorageKey(bot_id=1, chat_id=user_id, user_id=user_id) for user_id in range(1, USERS + 1)]
+    started = time.perf_counter()
+    for step, state in enumerate(STEPS):
+        # пользователи отвечают вперемешку, каждый обработчик — отдельная задача
+        await asyncio.gather(*(_handle(storage, key, step, state) for key in keys))
+    elapsed = time.perf_counter() - started
+    await storage.close()
+    return elapsed
+
+
+async def _handle(storage, key: StorageKey, step: int, state: str):
+    await storage.get_state(key)
+    await storage.update_data(key, {f"field_{step}": "значение"})
+    await storage.set_state(key, state)
+
+
+def test_fsm_storage_against_memory_storage(conn):
+    updates = USERS * len(STEPS)
+    results = {}
+    for name, storage in (
+        ("MemoryStorage", MemoryStorage()),
+        (f"SQLiteStorage, накопление {FLUSH_DELAY} с", SQLiteStorage()),
+        ("SQLiteStorage, без накопления", SQLiteStorage(flush_delay=0)),
+    ):
+        conn.execute("DELETE FROM fsm_storage")
+        conn.commit()
+        results[name] = asyncio.run(_dialog_steps(storage))
+
+    for name, elapsed in results.items():
+        print(f"\n{name}: {updates / elapsed:.0f} обновлений/с ({elapsed * 1000 / updates:.3f} мс на обновление)")
+    assert conn.execute("SELECT count(*) FROM fsm_storage").fetchone()[0] == USERS
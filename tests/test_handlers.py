@@ -0,0 +1,64 @@
+"""
+Обработчики команд с поддельным сообщением: ответы запоминаются,
+база — временная из conftest.
+"""
+import asyncio
+from decimal import Decimal
+from types import SimpleNamespace
+
+import db
+import main
+from recurrence import MONTHLY, Schedule
+
+TG_ID = 1001
+
+
+class FakeMessage:
+    def __init__(self, text: str, tg_id: int = TG_ID):
+        self.text = text
+        self.from_user = SimpleNamespace(id=tg_id)
+        self.answers: list[tuple[str, object]] = []
+
+    async def answer(self, text: str, reply_markup=None, **kwargs):
+        self.answers.append((text, reply_markup))
+
+
+def _callbacks(markup) -> list[str]:
+    return [button.callback_data for row in markup.inline_keyboard for button in row]
+
+
+def test_edit_command_shows_field_buttons(conn):
+    user_id = db.upsert_user(TG_ID)
+    db.add_payment(user_id, "Аренда", Decimal("30000"), Schedule(MONTHLY, 5))
+    payment_id = conn.execute("SELECT id FROM payments").fetchone()[0]
+
+    message = FakeMessage(f"/edit {payment_id}")
+    asyncio.run(main.cmd_edit(message))
+
+    [(text, markup)] = message.answers
+    assert text.startswith(f"Редактирование платежа #{payment_id}:\nАренда — ")
+    assert _callbacks(markup) == _callbacks(main.build_payment_inline_kb(payment_id))
+
+
+def test_edit_command_with_unknown_id(conn):
+    message = FakeMessage("/edit 42")
+    asyncio.run(main.cmd_edit(message))
+    assert message.answers == [("Платёж с таким ID не найден.", None)]
+
+
+def test_dashboard_reads_month_totals_only_with_payments(conn, monkeypatch):
+    calls = []
+    user_today = db.user_today
+    monkeypatch.setattr(db, "user_today", lambda user_id: calls.append("today") or user_today(user_id))
+    monkeypatch.setattr(db, "get_unpaid_instances", lambda *args: calls.append("unpaid"))
+
+    message = FakeMessage("/dashboard")
+    asyncio.run(main.cmd_dashboard(message))
+    assert message.answers == [(main.NO_PAYMENTS_TEXT, None)]
+    assert calls == []
+
+    db.add_payment(db.upsert_user(TG_ID), "Аренда", Decimal("30000"), Schedule(MONTHLY, 5))
+    asyncio.run(main.cmd_dashboard(message))
+    asyncio.run(main.cmd_dashboard(message))
+    assert "Осталось оплатить в этом месяце: 30000.00 ₽" in message.answers[-1][0]
+    assert "unpaid" not in calls
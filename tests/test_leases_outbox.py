@@ -0,0 +1,96 @@
+"""
+Аренды (leader lock) и забор записей outbox несколькими процессами.
+"""
+import db
+
+NOW = 1_800_000_000
+
+
+def _enqueue(*users):
+    # next_retry_at новых записей — текущее время, поэтому забираем «из будущего»
+    db.enqueue_reminders([(user_id, 1000 + user_id, "2026-10-16", f"текст {user_id}") for user_id in users])
+
+
+def _set_retry_at(next_retry_at: int):
+    conn = db.get_connection()
+    conn.execute("UPDATE reminder_outbox SET next_retry_at = ?", (next_retry_at,))
+    conn.commit()
+
+
+def test_lease_is_renewed_by_its_owner(conn):
+    assert db.try_acquire_lease("leader", "a", NOW, 30)
+    assert db.try_acquire_lease("leader", "a", NOW + 20, 30)
+    expires_at = conn.execute("SELECT expires_at FROM leases WHERE name = 'leader'").fetchone()[0]
+    assert expires_at == NOW + 50
+
+
+def test_lease_rejects_second_owner_until_expiry(conn):
+    assert db.try_acquire_lease("leader", "a", NOW, 30)
+    assert not db.try_acquire_lease("leader", "b", NOW + 29, 30)
+    owner = conn.execute("SELECT owner FROM leases WHERE name = 'leader'").fetchone()[0]
+    assert owner == "a"
+
+
+def test_expired_lease_is_taken_over(conn):
+    assert db.try_acquire_lease("leader", "a", NOW, 30)
+    assert db.try_acquire_lease("leader", "b", NOW + 31, 30)
+    assert not db.try_acquire_lease("leader", "a", NOW + 32, 30)
+
+
+def test_released_lease_is_free(conn):
+    assert db.try_acquire_lease("leader", "a", NOW, 30)
+    db.release_lease("leader", "b")  # чужая аренда не снимается
+    assert not db.try_acquire_lease("leader", "b", NOW + 1, 30)
+    db.release_lease("leader", "a")
+    assert db.try_acquire_lease("leader", "b", NOW + 1, 30)
+
+
+def test_claim_respects_partition(conn):
+    _enqueue(1, 2, 3, 4, 5, 6)
+    _set_retry_at(NOW)
+
+    even = db.claim_outbox_batch(NOW, 10, 300, (0, 2))
+    odd = db.claim_outbox_batch(NOW, 10, 300, (1, 2))
+
+    assert sorted(row["user_id"] for row in even) == [2, 4, 6]
+    assert sorted(row["user_id"] for row in odd) == [1, 3, 5]
+
+
+def test_claimed_rows_are_leased(conn):
+    _enqueue(1, 2)
+    _set_retry_at(NOW)
+
+    rows = db.claim_outbox_batch(NOW, 10, 300)
+
+    assert len(rows) == 2
+    assert all(row["attempts"] == 1 and row["next_retry_at"] == NOW + 300 for row in rows)
+    assert db.claim_outbox_batch(NOW + 299, 10, 300) == []
+    # аренда истекла, а отправка не отмечена — запись берётся снова
+    again = db.claim_outbox_batch(NOW + 300, 10, 300)
+    assert [row["attempts"] for row in again] == [2, 2]
+
+
+def test_stale_rows_of_other_partition_are_taken_over(conn):
+    _enqueue(1, 2)
+    _set_retry_at(NOW)
+
+    # записи пользователя 1 ждут меньше takeover_after — чужой процесс их не трогает
+    fresh = db.claim_outbox_batch(NOW + 299, 10, 60, (0, 2), takeover_after=300)
+    assert [row["user_id"] for row in fresh] == [2]
+
+    # ждут дольше takeover_after — их процесс, видимо, остановлен
+    stale = db.claim_outbox_batch(NOW + 300, 10, 60, (0, 2), takeover_after=300)
+    assert [row["user_id"] for row in stale] == [1]
+
+
+def test_sent_and_failed_rows_are_not_claimed(conn):
+    _enqueue(1, 2, 3)
+    _set_retry_at(NOW)
+    first, second, third = db.claim_outbox_batch(NOW, 10, 300)
+
+    db.mark_outbox_sent(first["id"], NOW + 1)
+    db.mark_outbox_failed(second["id"], "Forbidden: bot was blocked by the user", None)
+    db.mark_outbox_failed(third["id"], "timeout", NOW + 10)
+
+    rows = db.claim_outbox_batch(NOW + 10, 10, 300)
+    assert [row["id"] for row in rows] == [third["id"]]
@@ -0,0 +1,64 @@
+"""
+Суммы в копейках: перевод Decimal <-> копейки, разбор ввода
+и перевод REAL-сумм старой базы в amount_minor миграцией 9.
+"""
+import sqlite3
+from decimal import Decimal
+
+import pytest
+
+import db
+from money import MAX_AMOUNT, format_amount, from_minor, to_minor
+from validators import parse_amount
+
+
+@pytest.mark.parametrize(
+    "amount, minor",
+    [
+        ("0.29", 29),
+        ("0.01", 1),
+        ("19.99", 1999),
+        ("15000.5", 1_500_050),
+        ("30000", 3_000_000),
+        (str(MAX_AMOUNT), 100_000_000_000),
+    ],
+)
+def test_to_minor_and_back(amount, minor):
+    assert to_minor(Decimal(amount)) == minor
+    assert from_minor(minor) == Decimal(amount)
+
+
+@pytest.mark.parametrize("minor, text", [(0, "0.00"), (5, "0.05"), (29, "0.29"), (1_500_050, "15000.50")])
+def test_format_amount(minor, text):
+    assert format_amount(minor) == text
+
+
+@pytest.mark.parametrize("text, amount", [("1500,50", "1500.50"), (" 0.29 ", "0.29"), ("100", "100"), ("1e3", "1000")])
+def test_parse_amount(text, amount):
+    assert parse_amount(text) == Decimal(amount)
+
+
+@pytest.mark.parametrize("text", ["0.001", "1.005", "19.999", "0", "-5", "abc", "", "nan", "inf", "1000000000.01"])
+def test_parse_amount_rejects(text):
+    with pytest.raises(ValueError):
+        parse_amount(text)
+
+
+def test_migration_9_converts_real_amounts_to_kopecks():
+    # база исходной схемы (без user_version), суммы записаны как float
+    conn = sqlite3.connect(":memory:")
+    for statement in db._split_sql(db.MIGRATIONS[0]):
+        conn.execute(statement)
+    conn.execute("INSERT INTO users (tg_id) VALUES (1001)")
+    amounts = [0.29, 0.1 + 0.2, 19.99, 1500.5, 1234567.89, 1e9]
+    conn.executemany(
+        "INSERT INTO payments (user_id, title, amount, day_of_month) VALUES (1, ?, ?, 5)",
+        [(f"Платёж {amount}", amount) for amount in amounts],
+    )
+    conn.commit()
+
+    db.migrate(conn)
+
+    rows = conn.execute("SELECT amount_minor FROM payments ORDER BY id").fetchall()
+    assert [minor for (minor,) in rows] == [29, 30, 1999, 150_050, 123_456_789, 100_000_000_000]
+    assert "amount" not in [column[1] for column in conn.execute("PRAGMA table_info(payments)")]
@@ -0,0 +1,103 @@
+"""
+Платежи по месяцам (payment_instances) и итоги monthly_summary, которые
+ведут триггеры: отметка об оплате, правка суммы, удаление платежа и история.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+import db
+from recurrence import MONTHLY, Schedule
+
+
+def _user_with_payments(*amounts: str) -> int:
+    user_id = db.upsert_user(1001)
+    for number, amount in enumerate(amounts, start=1):
+        db.add_payment(user_id, f"Платёж {number}", Decimal(amount), Schedule(MONTHLY, number))
+    return user_id
+
+
+def _totals(user_id: int, month: str):
+    row = db.get_month_summary(user_id, month)
+    return row["total_minor"], row["paid_minor"], row["payments_count"], row["paid_count"]
+
+
+def _instances(conn, payment_id: int):
+    rows = conn.execute(
+        "SELECT month, amount_minor, paid_at FROM payment_instances WHERE payment_id = ? ORDER BY month",
+        (payment_id,),
+    ).fetchall()
+    return [tuple(row) for row in rows]
+
+
+def test_mark_paid_updates_the_month_once(conn):
+    user_id = _user_with_payments("30000", "500")
+    today, _summary, unpaid, _weekly = db.get_month_view(user_id, 10)
+    month = db.month_key(today)
+    assert _totals(user_id, month) == (3_050_000, 0, 2, 0)
+
+    row = db.mark_instance_paid(user_id, unpaid[0]["id"], 100)
+    assert row["paid_at"] == 100
+    assert _totals(user_id, month) == (3_050_000, 3_000_000, 2, 1)
+    assert db.mark_instance_paid(user_id, unpaid[0]["id"], 200) is None
+    # чужой платёж не отмечается
+    assert db.mark_instance_paid(db.upsert_user(1002), unpaid[1]["id"], 200) is None
+    assert _totals(user_id, month) == (3_050_000, 3_000_000, 2, 1)
+
+
+def test_amount_edit_changes_unpaid_and_keeps_paid(conn):
+    user_id = _user_with_payments("30000", "500")
+    today, _summary, unpaid, _weekly = db.get_month_view(user_id, 10)
+    paid, other = unpaid
+    db.mark_instance_paid(user_id, paid["id"], 100)
+
+    db.update_payment_amount(user_id, paid["payment_id"], Decimal("31000"))
+    db.update_payment_amount(user_id, other["payment_id"], Decimal("650"))
+    db.materialize_month(user_id, today)
+
+    month = db.month_key(today)
+    assert _totals(user_id, month) == (3_065_000, 3_000_000, 2, 1)
+    assert _instances(conn, paid["payment_id"]) == [(month, 3_000_000, 100)]
+    assert _instances(conn, other["payment_id"]) == [(month, 65_000, None)]
+
+
+def test_delete_removes_unpaid_rows_from_this_month_on(conn):
+    user_id = _user_with_payments("30000", "500")
+    today = db.user_today(user_id)
+    this_month = today.replace(day=1)
+    last_month = (this_month - timedelta(days=1)).replace(day=1)
+    next_month = (this_month + timedelta(days=31)).replace(day=1)
+    for day in (last_month, this_month, next_month):
+        db.materialize_month(user_id, day)
+    deleted_id, kept_id = [row["id"] for row in conn.execute("SELECT id FROM payments ORDER BY id")]
+    [this_instance] = conn.execute(
+        "SELECT id FROM payment_instances WHERE payment_id = ? AND month = ?",
+        (deleted_id, db.month_key(this_month)),
+    ).fetchall()
+    db.mark_instance_paid(user_id, this_instance["id"], 100)
+
+    assert db.delete_payment(user_id, deleted_id)
+    # прошлый месяц и уже оплаченное остаются, неоплаченное с этого месяца — нет
+    assert _instances(conn, deleted_id) == [
+        (db.month_key(last_month), 3_000_000, None),
+        (db.month_key(this_month), 3_000_000, 100),
+    ]
+    assert len(_instances(conn, kept_id)) == 3
+    assert _totals(user_id, db.month_key(this_month)) == (3_050_000, 3_000_000, 2, 1)
+    assert _totals(user_id, db.month_key(next_month)) == (50_000, 0, 1, 0)
+
+
+def test_history_skips_months_without_payments(conn):
+    user_id = _user_with_payments("30000")
+    today = db.user_today(user_id)
+    next_month = (today.replace(day=1) + timedelta(days=31)).replace(day=1)
+    db.materialize_month(user_id, today)
+    db.materialize_month(user_id, next_month)
+    assert [row["month"] for row in db.get_month_history(user_id)] == [
+        db.month_key(next_month), db.month_key(today)
+    ]
+
+    payment_id = conn.execute("SELECT id FROM payments").fetchone()[0]
+    db.delete_payment(user_id, payment_id)
+    # строки monthly_summary остались, но платежей в них нет
+    assert _totals(user_id, db.month_key(next_month)) == (0, 0, 0, 0)
+    assert db.get_month_history(user_id) == []
@@ -0,0 +1,146 @@
+"""
+Несколько процессов бота с одной базой: сброс кэшей только по изменениям
+платежей и настоящий запуск main.py --workers 3 в режиме webhook
+с поддельным Bot API.
+"""
+import asyncio
+import json
+import os
+import signal
+import socket
+import sqlite3
+import sys
+from collections import Counter
+from decimal import Decimal
+from pathlib import Path
+
+from aiohttp import ClientSession
+
+import db
+import main
+from fake_telegram import TOKEN, FakeTelegramAPI
+from recurrence import MONTHLY, Schedule
+
+ROOT = Path(__file__).resolve().parent.parent
+RECORDED = json.loads((Path(__file__).parent / "data" / "updates.json").read_text(encoding="utf-8"))
+WORKERS = 3
+SECRET = "s3cret"
+
+
+def test_only_payment_changes_reset_cached_summaries(conn, monkeypatch):
+    monkeypatch.setattr(db, "_multiprocess", True)
+    user_id = db.upsert_user(1001)
+    db.add_payment(user_id, "Аренда", Decimal("30000"), Schedule(MONTHLY, 5))
+    summary = db.get_payment_summary(user_id)
+
+    # соединение другого процесса: состояния FSM, аренда, напоминания
+    other = sqlite3.connect(db.DB_PATH)
+    other.execute("INSERT INTO fsm_storage (key, state, updated_at) VALUES ('1:1', 'Add:title', 1)")
+    other.execute("INSERT INTO leases (name, owner, expires_at) VALUES ('scheduler', 'b', 1)")
+    other.execute("UPDATE payments SET next_due_date = '2027-01-05'")
+    other.commit()
+    assert db.get_payment_summary(user_id) is summary
+
+    other.execute("UPDATE payments SET amount_minor = 100")
+    other.commit()
+    reloaded = db.get_payment_summary(user_id)
+    assert reloaded is not summary and reloaded.month_total() == 100
+    other.close()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _updates(users: range) -> list[dict]:
+    updates = []
+    for user_id in users:
+        for update in RECORDED:
+            message = update["message"]
+            updates.append({
+                **update,
+                "update_id": len(updates) + 1,
+                "message": {
+                    **message,
+                    "chat": {**message["chat"], "id": user_id},
+                    "from": {**message["from"], "id": user_id},
+                },
+            })
+    return updates
+
+
+async def _run_workers(tmp_path: Path, reminder_chats: list[int], updates: list[dict]):
+    api = FakeTelegramAPI()
+    await api.start()
+    port = _free_port()
+    env = {
+        **os.environ,
+        "BOT_TOKEN": TOKEN,
+        "TELEGRAM_API_URL": api.url,
+        "WEBHOOK_URL": f"http://127.0.0.1:{port}",
+        "WEBHOOK_SECRET": SECRET,
+        "WEBHOOK_HOST": "127.0.0.1",
+        "WEBHOOK_PORT": str(port),
+    }
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, str(ROOT / "main.py"), "--mode", "webhook", "--workers", str(WORKERS),
+        cwd=tmp_path, env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        async with ClientSession() as session:
+            for _ in range(300):
+                try:
+                    async with session.get(f"{url}/healthz") as response:
+                        if response.status == 200:
+                            break
+                except OSError:
+                    await asyncio.sleep(0.1)
+            headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+            for update in updates:
+                async with session.post(f"{url}{main.WEBHOOK_PATH}", json=update, headers=headers) as response:
+                    assert response.status == 200
+        await api.wait_sent(len(reminder_chats) + len(updates), timeout=60)
+        # лишних отправок (повторов напоминаний) быть не должно
+        await asyncio.sleep(1)
+        check = sqlite3.connect(tmp_path / "payments.db")
+        leases = check.execute("SELECT name, owner FROM leases").fetchall()
+        check.close()
+    finally:
+        process.send_signal(signal.SIGTERM)
+        await asyncio.wait_for(process.wait(), 30)
+        await api.stop()
+    return process.returncode, api.sent, leases
+
+
+def test_workers_share_updates_and_send_each_reminder_once(conn, tmp_path):
+    # main.py в подпроцессе открывает payments.db в своём рабочем каталоге — той же базе, что у conn
+    assert db.DB_PATH == tmp_path / "payments.db"
+    reminder_chats = list(range(5000, 5030))
+    for tg_id in reminder_chats:
+        db.upsert_user(tg_id)
+    users = {row["tg_id"]: row["id"] for row in conn.execute("SELECT id, tg_id FROM users")}
+    db.enqueue_reminders([(users[tg_id], tg_id, "2026-10-16", f"Напоминание {tg_id}") for tg_id in reminder_chats])
+    db.close_connections()
+    updates = _updates(range(7000, 7010))
+
+    returncode, sent, leases = asyncio.run(_run_workers(tmp_path, reminder_chats, updates))
+
+    assert returncode == 0
+    per_chat = Counter(chat_id for _time, chat_id, _text in sent)
+    assert all(per_chat[tg_id] == 1 for tg_id in reminder_chats)
+    assert all(per_chat[user_id] == len(RECORDED) for user_id in range(7000, 7010))
+    assert sum(per_chat.values()) == len(reminder_chats) + len(updates)
+
+    check = sqlite3.connect(db.DB_PATH)
+    statuses = check.execute("SELECT status, count(*) FROM reminder_outbox GROUP BY status").fetchall()
+    leaders = check.execute("SELECT count(*) FROM leases WHERE name = ?", (main.LEADER_LEASE,)).fetchone()[0]
+    check.close()
+    assert statuses == [("sent", len(reminder_chats))]
+    # пока процессы работали, ведущим был один из них (не родительский);
+    # при остановке он снял аренду
+    [(name, owner)] = leases
+    assert name == main.LEADER_LEASE and owner.rsplit(":", 1)[1] != str(os.getpid())
+    assert leaders == 0
@@ -0,0 +1,102 @@
+"""
+Разбор загруженного файла: CSV, JSON-массив и JSON Lines, сообщения
+об ошибках по строкам, предел числа строк и испорченные файлы.
+"""
+import io
+from decimal import Decimal
+
+from payments_io import MAX_IMPORT_ROWS, parse_import
+from recurrence import MONTHLY, YEARLY, Schedule
+
+
+def _parse(text: str | bytes, filename: str):
+    data = text.encode("utf-8") if isinstance(text, str) else text
+    return parse_import(io.BytesIO(data), filename)
+
+
+def test_csv_with_comma_and_semicolon():
+    expected = [
+        ("Аренда", Decimal("30000"), Schedule(MONTHLY, 5)),
+        ("Интернет", Decimal("650.50"), Schedule(MONTHLY, 20)),
+    ]
+    assert _parse("title,amount,day\nАренда,30000,5\nИнтернет,650.50,20\n", "p.csv") == (expected, [])
+    assert _parse("Title;Amount;Day\nАренда;30000;5\nИнтернет;650,50;20\n", "p.csv") == (expected, [])
+
+
+def test_csv_with_bom_and_schedule():
+    payments, errors = _parse("\ufefftitle,amount,day\nСтраховка,12000,ежегодно 15.03\n", "p.csv")
+    assert errors == []
+    [(title, amount, schedule)] = payments
+    assert (title, amount, schedule.recurrence, schedule.day_of_month) == ("Страховка", Decimal("12000"), YEARLY, 15)
+
+
+def test_csv_reports_errors_per_line():
+    payments, errors = _parse("title,amount,day\nАренда,30000,5\n,100,1\nСвязь,-5,1\nВода,100,32\n", "p.csv")
+    assert [p[0] for p in payments] == ["Аренда"]
+    assert errors == [
+        "строка 3: не заполнено: title.",
+        "строка 4: Сумма должна быть больше нуля.",
+        "строка 5: Число месяца должно быть от 1 до 31.",
+    ]
+
+
+def test_csv_without_required_columns():
+    assert _parse("name,sum\nАренда,30000\n", "p.csv") == (
+        [],
+        ["в первой строке должны быть колонки: title, amount, day."],
+    )
+
+
+def test_json_array():
+    text = '[{"title": "Аренда", "amount": 30000, "day": 5}, {"title": "Связь", "amount": 650.5, "day": "20"}]'
+    payments, errors = _parse(text, "p.json")
+    assert errors == []
+    assert [(p[0], p[1]) for p in payments] == [("Аренда", Decimal("30000")), ("Связь", Decimal("650.5"))]
+
+
+def test_json_array_errors():
+    assert _parse('[{"title": "Аренда"', "p.json")[1][0].startswith("некорректный JSON: ")
+    assert _parse('{"title": "Аренда"}', "p.json")[1] == ["строка 1: не заполнено: amount, day."]
+    assert _parse('[1, {"title": "Аренда", "amount": 1, "day": 1}]', "p.json")[1] == [
+        "строка 1: ожидается объект с полями title, amount, day."
+    ]
+
+
+def test_json_lines_report_broken_lines_and_skip_blank_ones():
+    text = '{"title": "Аренда", "amount": 30000, "day": 5}\n\n{"title": \n{"title": "Связь", "amount": 1, "day": 40}\n'
+    payments, errors = _parse(text, "p.jsonl")
+    assert [p[0] for p in payments] == ["Аренда"]
+    assert len(errors) == 2
+    assert errors[0].startswith("строка 3: некорректный JSON: ")
+    assert errors[1] == "строка 4: Число месяца должно быть от 1 до 31."
+
+
+def test_row_limit():
+    rows = "".join(f"Платёж {i},100,5\n" for i in range(MAX_IMPORT_ROWS + 5))
+    payments, errors = _parse("title,amount,day\n" + rows, "p.csv")
+    assert len(payments) == MAX_IMPORT_ROWS
+    assert errors == [f"больше {MAX_IMPORT_ROWS} платежей в одном файле."]
+
+
+def test_csv_field_over_the_limit_is_an_import_error():
+    text = "title,amount,day\nАренда,30000,5\n" + '"' + "x" * 200_000 + '",1,5\n'
+    payments, errors = _parse(text, "p.csv")
+    assert errors == ["строка 3: не получилось прочитать CSV."]
+
+
+def test_csv_header_over_the_limit_is_an_import_error():
+    assert _parse("x" * 200_000 + ",amount,day\n", "p.csv") == ([], ["строка 1: не получилось прочитать CSV."])
+
+
+def test_deeply_nested_json_is_an_import_error():
+    nested = "[" * 100_000 + "]" * 100_000
+    assert _parse(nested, "p.json") == ([], ["некорректный JSON: слишком глубокая вложенность."])
+
+    payments, errors = _parse('{"title": "Аренда", "amount": 1, "day": 5}\n' + nested + "\n", "p.jsonl")
+    assert [p[0] for p in payments] == ["Аренда"]
+    assert errors == ["строка 2: некорректный JSON: слишком глубокая вложенность."]
+
+
+def test_invalid_utf8_does_not_raise():
+    payments, errors = _parse(b"title,amount,day\n\xff\xfe,100,5\n", "p.csv")
+    assert errors == [] and len(payments) == 1
@@ -0,0 +1,128 @@
+"""
+Планы запросов db.py: ни один не должен читать таблицу целиком (SCAN)
+или сортировать во временном B-дереве (USE TEMP B-TREE).
+Запросы не выписываются вручную, а перехватываются trace-колбэком при вызове
+функций db, так что новый запрос без индекса не пройдёт мимо теста.
+"""
+import re
+from datetime import date
+from decimal import Decimal
+
+import db
+from recurrence import MONTHLY, QUARTERLY, WEEKLY, Schedule, weekly_anchor
+
+TODAY = date(2026, 10, 16)
+
+# Запросы, которые обязательно должны попасть в проверку
+REQUIRED = (
+    "CROSS JOIN payments p",  # страница напоминаний
+    "LIMIT 10 OFFSET",  # страница списка платежей
+    "SUM(amount_minor)",  # остаток месяца
+    "SET attempts = attempts + 1",  # забор записей outbox
+    "WITH RECURSIVE",  # слоты напоминаний
+    "recurrence = 'weekly'",  # еженедельные на экране остатка
+)
+
+
+def _exercise():
+    user_id = db.upsert_user(1001)
+    db.get_user_settings(user_id)
+    db.set_user_timezone(user_id, "Europe/Moscow")
+    db.set_user_remind_hour(user_id, 9)
+    db.get_reminder_slices()
+
+    db.add_payment(user_id, "Аренда", Decimal("30000"), Schedule(MONTHLY, 16))
+    db.add_payments(
+        user_id,
+        [
+            ("Связь", Decimal("500"), Schedule(MONTHLY, 31)),
+            ("Страховка", Decimal("12000"), Schedule(QUARTERLY, 20, date(2026, 1, 20))),
+            ("Секция", Decimal("800"), Schedule(WEEKLY, 0, weekly_anchor(4))),
+        ],
+    )
+    db.sync_with_other_processes()
+    db.load_payment_summary(user_id)
+    db.get_payments_page(user_id, 0, 10)
+    list(db.iter_user_payments(user_id))
+    db.invalidate_payment_summary(user_id)
+    db.get_total_minor(user_id, TODAY.day)
+
+    rows = list(db.iter_payments_due(TODAY, "Europe/Moscow", 9))
+    db.enqueue_reminders(
+        [(user_id, 1001, TODAY.isoformat(), "Сегодня платежи")],
+        [("2026-11-16", row["id"]) for row in rows],
+    )
+    db.is_reminder_run_finished("Europe/Moscow", 9, TODAY.isoformat())
+    db.mark_reminder_run_finished("Europe/Moscow", 9, TODAY.isoformat(), 1)
+    claimed = db.claim_outbox_batch(2_000_000_000, 10, 300, (0, 2))
+    outbox_id = claimed[0]["id"] if claimed else 1
+    db.mark_outbox_failed(outbox_id, "timeout", 2_000_000_100)
+    db.mark_outbox_failed(outbox_id, "blocked", None)
+    db.mark_outbox_sent(outbox_id, 2_000_000_200)
+
+    db.try_acquire_lease("leader", "a", 100, 30)
+    db.release_lease("leader", "a")
+
+    db.fsm_save([("1:1", {"state": "Add:title", "data": "{}"}), ("1:2", {"data": "{}"})], 100)
+    db.fsm_load("1:1", 0)
+    db.purge_fsm_storage(200)
+
+    db.get_payment_by_id(user_id, 1)
+    db.update_payment_title(user_id, 1, "Квартира")
+    db.update_payment_amount(user_id, 1, Decimal("31000"))
+    db.update_payment_day(user_id, 1, 15)
+
+    db.materialize_month(user_id, TODAY)
+    db.materialize_month_batch(TODAY, ["Europe/Moscow", "Asia/Tokyo"], 0)
+    _today, _summary, unpaid, _weekly = db.get_month_view(user_id, 10)
+    db.mark_instance_paid(user_id, unpaid[0]["id"], 100)
+    db.get_month_history(user_id)
+
+    db.delete_payment(user_id, 2)
+    db.compact_deleted_payments(2_000_000_000)
+    db.purge_reminder_outbox(2_000_000_000)
+
+
+def _cte_names(sql: str) -> set[str]:
+    return set(re.findall(r"(\w+)\s*\([\w\s,]*\)\s+AS\s*\(", sql))
+
+
+def _bad_plan_lines(conn, sql: str) -> list[str]:
+    # SCAN по самому CTE (рекурсивной очереди из нескольких строк) допустим
+    allowed = _cte_names(sql)
+    bad = []
+    for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}"):
+        detail = row["detail"]
+        if "TEMP B-TREE" in detail:
+            bad.append(detail)
+        elif detail.startswith("SCAN ") and detail.split()[1] not in allowed:
+            bad.append(detail)
+    return bad
+
+
+def _traced_statements(conn) -> list[str]:
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        _exercise()
+    finally:
+        conn.set_trace_callback(None)
+    return list(dict.fromkeys(
+        sql for sql in statements
+        if sql.split(None, 1)[0].upper() in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+    ))
+
+
+def test_required_queries_are_checked(conn):
+    statements = _traced_statements(conn)
+    for fragment in REQUIRED:
+        assert any(fragment in sql for sql in statements), fragment
+
+
+def test_no_full_scans_or_temp_sorts(conn):
+    problems = {}
+    for sql in _traced_statements(conn):
+        bad = _bad_plan_lines(conn, sql)
+        if bad:
+            problems[" ".join(sql.split())] = bad
+    assert problems == {}
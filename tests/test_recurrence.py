@@ -0,0 +1,213 @@
+"""
+Даты платежей по правилам повторения, их совпадение с заполнением
+next_due_date в миграции 11 и с платежами месяца в payment_instances.
+"""
+import sqlite3
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+
+import db
+import reminders
+from recurrence import (
+    ANCHOR_YEAR,
+    MONTHLY,
+    QUARTERLY,
+    WEEKLY,
+    YEARLY,
+    Schedule,
+    next_due,
+    occurrences,
+    weekly_anchor,
+)
+
+
+def test_quarterly_across_year_boundary():
+    schedule = Schedule(QUARTERLY, 15, date(ANCHOR_YEAR, 11, 15))
+    assert next_due(schedule, date(2026, 11, 15)) == date(2026, 11, 15)
+    assert next_due(schedule, date(2026, 11, 16)) == date(2027, 2, 15)
+    assert next_due(schedule, date(2026, 12, 31)) == date(2027, 2, 15)
+    assert list(occurrences(schedule, date(2026, 10, 1), date(2027, 6, 1))) == [
+        date(2026, 11, 15),
+        date(2027, 2, 15),
+        date(2027, 5, 15),
+    ]
+
+
+def test_quarterly_anchor_month_is_a_remainder():
+    # опорный месяц январь: платежи в январе, апреле, июле и октябре
+    schedule = Schedule(QUARTERLY, 10, date(ANCHOR_YEAR, 1, 10))
+    assert next_due(schedule, date(2026, 12, 1)) == date(2027, 1, 10)
+    assert next_due(schedule, date(2026, 8, 1)) == date(2026, 10, 10)
+
+
+def test_yearly_feb_29_in_non_leap_years():
+    schedule = Schedule(YEARLY, 29, date(ANCHOR_YEAR, 2, 29))
+    assert next_due(schedule, date(2026, 1, 10)) == date(2026, 2, 28)
+    assert next_due(schedule, date(2026, 3, 1)) == date(2027, 2, 28)
+    assert next_due(schedule, date(2027, 3, 1)) == date(2028, 2, 29)
+    assert list(occurrences(schedule, date(2026, 1, 1), date(2029, 1, 1))) == [
+        date(2026, 2, 28),
+        date(2027, 2, 28),
+        date(2028, 2, 29),
+    ]
+
+
+@pytest.mark.parametrize(
+    "day_of_month, expected",
+    [
+        (29, [date(2026, 1, 29), date(2026, 2, 28), date(2026, 3, 29), date(2026, 4, 29)]),
+        (30, [date(2026, 1, 30), date(2026, 2, 28), date(2026, 3, 30), date(2026, 4, 30)]),
+        (31, [date(2026, 1, 31), date(2026, 2, 28), date(2026, 3, 31), date(2026, 4, 30)]),
+    ],
+)
+def test_monthly_days_29_31_clamped(day_of_month, expected):
+    schedule = Schedule(MONTHLY, day_of_month)
+    assert list(occurrences(schedule, date(2026, 1, 1), date(2026, 5, 1))) == expected
+
+
+def test_monthly_clamped_day_is_due_today():
+    schedule = Schedule(MONTHLY, 31)
+    assert next_due(schedule, date(2024, 2, 29)) == date(2024, 2, 29)
+    assert next_due(schedule, date(2026, 4, 30)) == date(2026, 4, 30)
+    assert next_due(schedule, date(2026, 5, 1)) == date(2026, 5, 31)
+
+
+def test_weekly():
+    wednesday = Schedule(WEEKLY, 0, weekly_anchor(2))
+    friday = date(2026, 10, 16)
+    assert next_due(wednesday, friday) == date(2026, 10, 21)
+    assert next_due(wednesday, date(2026, 10, 21)) == date(2026, 10, 21)
+    assert list(occurrences(wednesday, friday, date(2026, 11, 12))) == [
+        date(2026, 10, 21),
+        date(2026, 10, 28),
+        date(2026, 11, 4),
+        date(2026, 11, 11),
+    ]
+
+
+def _backfill_sql() -> str:
+    statements = db._split_sql(db.MIGRATIONS[10])
+    (update,) = [sql for sql in statements if sql.startswith("UPDATE payments SET next_due_date")]
+    return update
+
+
+@pytest.mark.parametrize(
+    "today",
+    [
+        date(2026, 1, 1),
+        date(2026, 1, 31),
+        date(2026, 2, 14),
+        date(2026, 2, 28),
+        date(2024, 2, 29),
+        date(2026, 4, 30),
+        date(2026, 12, 15),
+        date(2026, 12, 31),
+    ],
+)
+def test_migration_11_backfill_matches_next_due(today):
+    conn = sqlite3.connect(":memory:")
+    conn.execute(
+        "CREATE TABLE payments (id INTEGER PRIMARY KEY, day_of_month INTEGER, active INTEGER, next_due_date TEXT)"
+    )
+    conn.executemany(
+        "INSERT INTO payments (id, day_of_month, active) VALUES (?, ?, 1)",
+        [(day, day) for day in range(1, 32)],
+    )
+    conn.execute(_backfill_sql().replace("'now'", f"'{today.isoformat()}'"))
+
+    for day, next_due_date in conn.execute("SELECT day_of_month, next_due_date FROM payments"):
+        assert next_due_date == next_due(Schedule(MONTHLY, day), today).isoformat(), day
+
+
+def test_next_due_is_never_before_today():
+    schedules = [
+        Schedule(MONTHLY, 31),
+        Schedule(QUARTERLY, 30, date(ANCHOR_YEAR, 2, 29)),
+        Schedule(YEARLY, 31, date(ANCHOR_YEAR, 12, 31)),
+        Schedule(WEEKLY, 0, weekly_anchor(6)),
+    ]
+    day = date(2026, 1, 1)
+    while day < date(2028, 1, 1):
+        for schedule in schedules:
+            due = next_due(schedule, day)
+            assert day <= due < day + timedelta(days=366)
+        day += timedelta(days=1)
+
+
+def test_weekly_payments_are_reported_apart_from_the_month(conn):
+    user_id = db.upsert_user(1001)
+    db.add_payments(
+        user_id,
+        [
+            ("Секция", Decimal("800"), Schedule(WEEKLY, 0, weekly_anchor(4))),
+            ("Бассейн", Decimal("500"), Schedule(WEEKLY, 0, weekly_anchor(1))),
+        ],
+    )
+    _today, summary, unpaid, weekly = db.get_month_view(user_id, 10)
+    assert summary is None and unpaid == []
+    assert (weekly["payments_count"], weekly["total_minor"]) == (2, 130_000)
+
+
+def test_month_instances_follow_the_rule_not_next_due_date(conn):
+    """
+    Напоминание сдвигает next_due_date годового платежа на следующий год;
+    в месяц своей даты платёж всё равно попадает.
+    """
+    today = date(2026, 10, 16)
+    user_id = db.upsert_user(1001)
+    db.set_user_remind_hour(user_id, 9)
+    db.add_payments(
+        user_id,
+        [
+            ("Аренда", Decimal("30000"), Schedule(MONTHLY, 5)),
+            ("Страховка", Decimal("12000"), Schedule(YEARLY, 16, date(ANCHOR_YEAR, 10, 16))),
+        ],
+    )
+    conn.execute("UPDATE payments SET next_due_date = ? WHERE recurrence = 'yearly'", (today.isoformat(),))
+    conn.commit()
+    reminders._fill_outbox_page(today, "Europe/Moscow", 9, (0, 0))
+    assert conn.execute("SELECT next_due_date FROM payments WHERE recurrence = 'yearly'").fetchone()[0] == "2027-10-16"
+
+    db.materialize_month(user_id, today)
+    summary = db.get_month_summary(user_id, "2026-10")
+    assert (summary["payments_count"], summary["total_minor"]) == (2, 4_200_000)
+
+
+@pytest.mark.parametrize(
+    "schedule",
+    [
+        Schedule(QUARTERLY, 31, date(ANCHOR_YEAR, 2, 1)),
+        Schedule(QUARTERLY, 15, date(ANCHOR_YEAR, 12, 1)),
+        Schedule(YEARLY, 29, date(ANCHOR_YEAR, 2, 29)),
+        Schedule(YEARLY, 31, date(ANCHOR_YEAR, 1, 31)),
+    ],
+)
+def test_month_instances_match_next_due(conn, schedule):
+    user_id = db.upsert_user(1001)
+    db.add_payment(user_id, "Платёж", Decimal("100"), schedule)
+    first = date(2027, 1, 1)
+    while first < date(2029, 1, 1):
+        db.materialize_month(user_id, first)
+        due = next_due(schedule, first)
+        expected = [due.isoformat()] if (due.year, due.month) == (first.year, first.month) else []
+        rows = conn.execute(
+            "SELECT due_date FROM payment_instances WHERE month = ?", (db.month_key(first),)
+        ).fetchall()
+        assert [row["due_date"] for row in rows] == expected, first
+        first = (first + timedelta(days=31)).replace(day=1)
+
+
+def test_month_batch_takes_the_month_of_each_zone(conn):
+    moscow, tokyo = db.upsert_user(1001), db.upsert_user(1002)
+    db.set_user_timezone(tokyo, "Asia/Tokyo")
+    for user_id in (moscow, tokyo):
+        db.add_payment(user_id, "Аренда", Decimal("30000"), Schedule(MONTHLY, 5))
+
+    # 31.10 23:30 в Москве — уже 01.11 в Токио
+    assert db.materialize_month_batch(date(2026, 10, 31), ["Europe/Moscow"], 0) == tokyo
+    assert db.materialize_month_batch(date(2026, 11, 1), ["Asia/Tokyo"], 0) == tokyo
+    assert db.materialize_month_batch(date(2026, 11, 1), ["Asia/Tokyo"], tokyo) is None
+    rows = conn.execute("SELECT user_id, month FROM payment_instances ORDER BY user_id").fetchall()
+    assert [tuple(row) for row in rows] == [(moscow, "2026-10"), (tokyo, "2026-11")]
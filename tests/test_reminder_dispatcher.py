@@ -0,0 +1,136 @@
+"""
+ReminderDispatcher с поддельным bot.send_message: пауза всех воркеров после
+RetryAfter, повторы при сетевых ошибках и соблюдение лимитов скорости.
+"""
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+import reminders
+from reminders import ReminderDispatcher
+
+
+class FakeBot:
+    """
+    Запоминает (время, chat_id) каждого вызова; errors — исключения,
+    которые по очереди выбрасываются вместо отправки.
+    """
+
+    def __init__(self, errors=()):
+        self.calls: list[tuple[float, int]] = []
+        self.errors = list(errors)
+
+    async def send_message(self, chat_id: int, text: str):
+        self.calls.append((time.monotonic(), chat_id))
+        if self.errors:
+            raise self.errors.pop(0)
+
+
+def _method(chat_id: int = 1) -> SendMessage:
+    return SendMessage(chat_id=chat_id, text="напоминание")
+
+
+def _run(dispatcher: ReminderDispatcher, messages):
+    sent = []
+    failed = []
+
+    async def on_sent(ref):
+        sent.append(ref)
+
+    async def on_failed(ref, error):
+        failed.append((ref, error))
+
+    stats = asyncio.run(dispatcher.run(messages, on_sent=on_sent, on_failed=on_failed))
+    return stats, sent, failed
+
+
+def _assert_rate(times: list[float], rate: float):
+    """
+    Ведро вместимостью rate: за любой промежуток [t_i, t_j] отправлено
+    не больше rate * (1 + t_j - t_i) сообщений (с допуском на округление).
+    """
+    times = sorted(times)
+    for i in range(len(times)):
+        for j in range(i, len(times)):
+            assert j - i + 1 <= rate * (1 + times[j] - times[i]) + 0.1
+
+
+def test_retry_after_pauses_all_workers():
+    bot = FakeBot([TelegramRetryAfter(_method(), "Flood control exceeded", retry_after=1)])
+    dispatcher = ReminderDispatcher(bot, concurrency=4, global_rate=100, per_chat_rate=100)
+
+    stats, sent, failed = _run(dispatcher, [(chat_id, "текст", chat_id) for chat_id in range(8)])
+
+    assert sorted(sent) == list(range(8))
+    assert failed == []
+    assert stats.retried == 1
+    flood_at = bot.calls[0][0]
+    later = [at for at, _chat_id in bot.calls[1:] if at > flood_at]
+    assert later
+    # после RetryAfter ни один воркер не отправляет раньше, чем через retry_after
+    assert min(later) - flood_at >= 0.99
+
+
+def test_network_errors_are_retried_with_backoff_then_failed(monkeypatch):
+    delays = []
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay, *args, **kwargs):
+        delays.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr(reminders.asyncio, "sleep", fake_sleep)
+    error = TelegramNetworkError(_method(), "connection reset")
+    bot = FakeBot([error, error, error])
+    dispatcher = ReminderDispatcher(bot, concurrency=1, global_rate=100, per_chat_rate=100, max_attempts=3)
+
+    stats, sent, failed = _run(dispatcher, [(1, "текст", "ref")])
+
+    assert len(bot.calls) == 3
+    assert delays == [2, 4]
+    assert sent == []
+    assert failed == [("ref", error)]
+    assert stats.failed == 1
+    assert stats.retried == 2
+
+
+def test_network_error_recovers_on_retry(monkeypatch):
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay, *args, **kwargs):
+        await real_sleep(0)
+
+    monkeypatch.setattr(reminders.asyncio, "sleep", fake_sleep)
+    bot = FakeBot([TelegramNetworkError(_method(), "connection reset")])
+    dispatcher = ReminderDispatcher(bot, concurrency=1, global_rate=100, per_chat_rate=100)
+
+    stats, sent, failed = _run(dispatcher, [(1, "текст", "ref")])
+
+    assert len(bot.calls) == 2
+    assert sent == ["ref"]
+    assert failed == []
+    assert stats.sent == 1
+
+
+def test_per_chat_rate():
+    bot = FakeBot()
+    dispatcher = ReminderDispatcher(bot, concurrency=4, global_rate=100, per_chat_rate=5)
+
+    stats, sent, _failed = _run(dispatcher, [(1, "текст", i) for i in range(10)])
+
+    assert len(sent) == 10
+    _assert_rate([at for at, _chat_id in bot.calls], 5)
+    assert stats.elapsed >= 0.95
+
+
+def test_global_rate():
+    bot = FakeBot()
+    dispatcher = ReminderDispatcher(bot, concurrency=8, global_rate=20, per_chat_rate=5)
+
+    stats, sent, _failed = _run(dispatcher, [(chat_id, "текст", chat_id) for chat_id in range(40)])
+
+    assert len(sent) == 40
+    _assert_rate([at for at, _chat_id in bot.calls], 20)
+    assert stats.elapsed >= 0.95
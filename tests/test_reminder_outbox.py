@@ -0,0 +1,124 @@
+"""
+Заполнение outbox напоминаниями: выбор слотов по местному времени
+и продолжение прерванной рассылки.
+"""
+import asyncio
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+import db
+import reminders
+from recurrence import MONTHLY, Schedule
+from reminders import due_reminder_slots, fill_outbox
+
+TODAY = date(2026, 10, 16)
+TZ = "Europe/Moscow"
+
+
+def _user(tg_id: int, remind_hour: int = 9) -> int:
+    user_id = db.upsert_user(tg_id)
+    db.set_user_remind_hour(user_id, remind_hour)
+    return user_id
+
+
+def _payment(user_id: int, title: str, next_due_date: date, amount: str = "100"):
+    db.add_payment(user_id, title, Decimal(amount), Schedule(MONTHLY, next_due_date.day))
+    conn = db.get_connection()
+    conn.execute(
+        "UPDATE payments SET next_due_date = ? WHERE id = (SELECT max(id) FROM payments)",
+        (next_due_date.isoformat(),),
+    )
+    conn.commit()
+
+
+def _outbox(conn):
+    return conn.execute("SELECT user_id, due_date, text FROM reminder_outbox ORDER BY user_id").fetchall()
+
+
+def test_slots_from_the_reminder_hour_to_the_end_of_the_day():
+    slices = [("Europe/Moscow", 9), ("Europe/Moscow", 12), ("Asia/Tokyo", 9), ("America/New_York", 20)]
+    # 10:30 в Москве, 16:30 в Токио, 03:30 в Нью-Йорке
+    now = datetime(2026, 10, 16, 7, 30, tzinfo=timezone.utc)
+    assert due_reminder_slots(slices, now) == [
+        ("Europe/Moscow", 9, date(2026, 10, 16)),
+        ("Asia/Tokyo", 9, date(2026, 10, 16)),
+    ]
+
+
+def test_slot_date_is_the_local_date():
+    # в UTC ещё 15-е, в Токио уже 16-е
+    now = datetime(2026, 10, 15, 22, 0, tzinfo=timezone.utc)
+    assert due_reminder_slots([("Asia/Tokyo", 7)], now) == [("Asia/Tokyo", 7, date(2026, 10, 16))]
+
+
+def test_interrupted_run_is_resumed_without_duplicates(conn, monkeypatch):
+    users = [_user(tg_id) for tg_id in (101, 102, 103)]
+    for user_id in users:
+        _payment(user_id, f"Платёж {user_id}", TODAY)
+
+    # первая порция — один пользователь, после неё процесс «упал»
+    monkeypatch.setattr(reminders, "OUTBOX_BATCH", 1)
+    added, after = reminders._fill_outbox_page(TODAY, TZ, 9, (0, 0))
+    assert added == 1 and after is not None
+    assert not db.is_reminder_run_finished(TZ, 9, TODAY.isoformat())
+
+    assert asyncio.run(fill_outbox(TODAY, TZ, 9)) == 2
+    assert [row["user_id"] for row in _outbox(conn)] == users
+    assert db.is_reminder_run_finished(TZ, 9, TODAY.isoformat())
+    # законченный слот второй раз не заполняется
+    assert asyncio.run(fill_outbox(TODAY, TZ, 9)) == 0
+
+
+def test_missed_day_is_sent_as_overdue(conn):
+    user_id = _user(101)
+    _payment(user_id, "Аренда", date(2026, 10, 15), "30000")
+    _payment(user_id, "Связь", TODAY, "650")
+
+    # рассылка 15-го не состоялась: записи в reminder_runs нет
+    assert asyncio.run(fill_outbox(TODAY, TZ, 9)) == 1
+    [row] = _outbox(conn)
+    assert row["due_date"] == TODAY.isoformat()
+    assert "Сегодня:\nСвязь — 650.00 ₽" in row["text"]
+    assert "Просрочены:\nАренда — 30000.00 ₽, срок 15.10" in row["text"]
+
+
+def test_payment_added_after_the_days_run_is_only_advanced(conn):
+    user_id = _user(101)
+    db.mark_reminder_run_finished(TZ, 9, "2026-10-15", 0)
+    _payment(user_id, "Аренда", date(2026, 10, 15))
+
+    assert asyncio.run(fill_outbox(TODAY, TZ, 9)) == 0
+    assert _outbox(conn) == []
+    next_due_date = conn.execute("SELECT next_due_date FROM payments").fetchone()[0]
+    assert next_due_date == "2026-11-15"
+
+
+class _Bot:
+    def __init__(self):
+        self.sent: list[int] = []
+
+    async def send_message(self, chat_id: int, text: str):
+        self.sent.append(chat_id)
+
+
+def test_drain_waits_for_the_outbox_to_be_filled(conn, monkeypatch):
+    for tg_id in (101, 102, 103):
+        _payment(_user(tg_id), f"Платёж {tg_id}", TODAY)
+    monkeypatch.setattr(reminders, "OUTBOX_BATCH", 1)
+
+    async def scenario():
+        bot = _Bot()
+        filled = asyncio.Event()
+        draining = asyncio.create_task(
+            reminders.drain_outbox(reminders.ReminderDispatcher(bot), (0, 1), filled)
+        )
+        # выгрузка началась раньше заполнения и застала outbox пустым
+        await asyncio.sleep(0.1)
+        assert bot.sent == []
+        await fill_outbox(TODAY, TZ, 9)
+        filled.set()
+        return await draining, bot.sent
+
+    stats, sent = asyncio.run(scenario())
+    assert stats.sent == 3 and sorted(sent) == [101, 102, 103]
+    assert db.claim_outbox_batch(2_000_000_000, 10, 300, (0, 1)) == []
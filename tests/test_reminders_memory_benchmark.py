@@ -0,0 +1,91 @@
+"""
+Память при чтении напоминаний: 100 тысяч и миллион синтетических платежей
+(по 10 на пользователя, все на сегодня). Постраничное чтение
+(iter_payments_due) и заполнение outbox (_fill_outbox_page) сравниваются
+с чтением всей выборки разом. Запуск: pytest --benchmark -s.
+Память считается по tracemalloc — это Python-объекты строк, кэш
+страниц SQLite в замер не входит.
+"""
+import time
+import tracemalloc
+from datetime import date
+
+import pytest
+
+import db
+import reminders
+
+pytestmark = pytest.mark.benchmark
+
+TODAY = date(2026, 10, 16)
+TZ = "Europe/Moscow"
+PAYMENTS_PER_USER = 10
+
+
+def _populate(conn, payments: int):
+    users = payments // PAYMENTS_PER_USER
+    with conn:
+        conn.execute(
+            """
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+            INSERT INTO users (id, tg_id) SELECT i, 1000000 + i FROM n
+            """,
+            (users,),
+        )
+        conn.execute(
+            """
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+            INSERT INTO payments (user_id, title, amount_minor, day_of_month, recurrence, next_due_date)
+            SELECT (i - 1) / ? + 1, 'Платёж ' || i, 100000, ?, 'monthly', ? FROM n
+            """,
+            (payments, PAYMENTS_PER_USER, TODAY.day, TODAY.isoformat()),
+        )
+
+
+def _measure(func):
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = func()
+        _size, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak / 2**20, time.perf_counter() - started
+
+
+def _stream():
+    return sum(1 for _ in db.iter_payments_due(TODAY, TZ, 9))
+
+
+def _fetch_all():
+    return len(db.get_payments_due_page(TODAY, TZ, 9, limit=-1))
+
+
+def _fill_outbox():
+    added = 0
+    after = (0, 0)
+    while after is not None:
+        page_added, after = reminders._fill_outbox_page(TODAY, TZ, 9, after)
+        added += page_added
+    return added
+
+
+@pytest.mark.parametrize("payments", [100_000, 1_000_000])
+def test_reminder_memory_stays_flat(conn, payments):
+    _populate(conn, payments)
+
+    streamed, stream_mb, stream_s = _measure(_stream)
+    fetched, fetch_mb, fetch_s = _measure(_fetch_all)
+    added, fill_mb, fill_s = _measure(_fill_outbox)
+
+    print(
+        f"\n{payments} платежей: постранично {stream_mb:.1f} МБ за {stream_s:.1f} с, "
+        f"разом {fetch_mb:.1f} МБ за {fetch_s:.1f} с, "
+        f"заполнение outbox {fill_mb:.1f} МБ за {fill_s:.1f} с"
+    )
+    assert streamed == fetched == payments
+    assert added == payments // PAYMENTS_PER_USER
+    # пик постраничного чтения — одна страница, он не растёт с числом платежей
+    page_mb = db.REMINDER_PAGE_SIZE * fetch_mb / payments
+    assert stream_mb < 3 * page_mb + 1
+    assert fill_mb < 3 * page_mb + 1
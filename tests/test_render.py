@@ -0,0 +1,120 @@
+"""
+Тексты сообщений. Названия платежей в текстах с parse_mode="HTML"
+экранируются, а в подписях кнопок остаются как есть; остаток в сводке
+и в /rest берётся из итогов monthly_summary.
+"""
+from datetime import date
+
+import db
+from render import (
+    MAX_LISTED_PAYMENTS,
+    NO_PAYMENTS_TEXT,
+    build_dashboard_parts,
+    build_dashboard_text,
+    build_list_text,
+    build_pay_button,
+    build_payment_text,
+    build_reminder_text,
+    build_rest_text,
+)
+
+TITLE = "Кредит <Банк & Ко>"
+ESCAPED = "Кредит &lt;Банк &amp; Ко&gt;"
+
+
+def _payment(title: str = TITLE, amount_minor: int = 150_000):
+    return {
+        "id": 1,
+        "title": title,
+        "amount_minor": amount_minor,
+        "day_of_month": 5,
+        "recurrence": "monthly",
+        "anchor_date": None,
+    }
+
+
+def test_payment_text_escapes_title():
+    assert build_payment_text(_payment()).startswith(f"{ESCAPED} — ")
+
+
+def test_reminder_text_escapes_titles():
+    assert ESCAPED in build_reminder_text([_payment()])
+    digest = build_reminder_text([_payment(), _payment("Связь <дом>", 50_000)])
+    assert ESCAPED in digest and "Связь &lt;дом&gt;" in digest
+    assert "<Банк" not in digest
+
+
+def test_rest_text_escapes_titles():
+    summary = {"payments_count": 1, "paid_count": 0, "paid_minor": 0, "total_minor": 150_000}
+    unpaid = [{"id": 1, "title": TITLE, "amount_minor": 150_000, "due_date": "2026-10-05"}]
+    text = build_rest_text(summary, unpaid, date(2026, 10, 1), 0)
+    assert f"05.10 {ESCAPED} — " in text
+
+
+def test_button_text_is_not_escaped():
+    assert build_pay_button(1, TITLE, 150_000).text.startswith(f"✅ {TITLE} — ")
+
+
+def test_reminder_text_lists_overdue_payments_with_dates():
+    overdue = {**_payment(), "next_due_date": "2026-10-05"}
+    text = build_reminder_text([], [overdue])
+    assert f"Просрочены:\n{ESCAPED} — " in text and ", срок 05.10" in text
+    assert "Сегодня" not in text
+
+
+def test_reminder_digest_fits_into_one_message():
+    rows = [_payment(f"Платёж {number} " + "x" * 200, 100) for number in range(1000)]
+    overdue = [{**row, "next_due_date": "2026-10-05"} for row in rows[:500]]
+    for today, missed in ((rows, ()), (rows[500:], overdue), ([], overdue)):
+        text = build_reminder_text(today, missed)
+        assert len(text) <= 4096
+        count = len(today) + len(missed)
+        shown = sum(line.startswith("Платёж ") for line in text.splitlines())
+        assert 0 < shown < count
+        assert f"… и ещё {count - shown} — все платежи в /list" in text
+        # итог — по всем платежам, не только по показанным
+        assert text.endswith(f"Итого: {count}.00 ₽")
+
+
+def test_rest_text_mentions_weekly_payments():
+    weekly = {"payments_count": 2, "total_minor": 130_000}
+    only_weekly = build_rest_text(None, [], date(2026, 10, 1), 0, weekly)
+    assert only_weekly != NO_PAYMENTS_TEXT
+    assert "Еженедельные платежи (2 на 1300.00 ₽ в неделю)" in only_weekly
+
+    summary = {"payments_count": 1, "paid_count": 1, "paid_minor": 150_000, "total_minor": 150_000}
+    assert "Еженедельные платежи" in build_rest_text(summary, [], date(2026, 10, 1), 0, weekly)
+    assert build_rest_text(None, [], date(2026, 10, 1), 0, {"payments_count": 0, "total_minor": 0}) == NO_PAYMENTS_TEXT
+
+
+def test_dashboard_remaining_follows_monthly_summary():
+    parts = build_dashboard_parts(db.PaymentSummary([_payment()]), date(2026, 10, 1))
+    no_weekly = {"payments_count": 0, "total_minor": 0}
+    unpaid = {"total_minor": 150_000, "paid_minor": 0}
+    paid = {"total_minor": 150_000, "paid_minor": 150_000}
+
+    assert "Осталось оплатить в этом месяце: 1500.00 ₽" in build_dashboard_text(parts, unpaid, no_weekly)
+    assert "Осталось оплатить в этом месяце: 0.00 ₽" in build_dashboard_text(parts, paid, no_weekly)
+    with_weekly = build_dashboard_text(parts, unpaid, {"payments_count": 1, "total_minor": 500})
+    assert "Осталось оплатить в этом месяце (без еженедельных): 1500.00 ₽" in with_weekly
+
+
+def test_long_lists_fit_into_one_message():
+    rows = [_payment(f"Платёж {i}") for i in range(1000)]
+    text = build_list_text(rows)
+    assert len(text) < 4096
+    assert text.count("\n") == MAX_LISTED_PAYMENTS + 2
+    assert text.endswith(f"… и ещё {1000 - MAX_LISTED_PAYMENTS} — все платежи в редакторе, кнопка «✏️ Редактировать / удалять»")
+
+    long_titles = [_payment("Д" * 1000) for _ in range(10)]
+    head, nearest = build_dashboard_parts(db.PaymentSummary(long_titles), date(2026, 10, 1))
+    dashboard = build_dashboard_text((head, nearest), None, {"payments_count": 0, "total_minor": 0})
+    assert len(dashboard) < 4096 and "… и ещё " in head
+
+
+def test_rendered_texts_are_kept_for_the_last_day_only():
+    summary = db.PaymentSummary([_payment()])
+    summary.rendered_for(date(2026, 10, 1))["dashboard"] = "1 октября"
+    assert summary.rendered_for(date(2026, 10, 1)) == {"dashboard": "1 октября"}
+    assert summary.rendered_for(date(2026, 10, 2)) == {}
+    assert summary.rendered_for(date(2026, 10, 1)) == {}
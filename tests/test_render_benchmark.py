@@ -0,0 +1,56 @@
+"""
+Замер отрисовки списков на 10/100/1000 платежей: строки одним join
+и клавиатуры из кэша против сборки заново. Запуск: pytest --benchmark -s.
+"""
+import timeit
+
+import pytest
+
+from render import (
+    build_edit_page_kb,
+    build_list_text,
+    build_payment_inline_kb,
+    build_payment_lines,
+)
+
+pytestmark = pytest.mark.benchmark
+
+
+def _rows(count: int):
+    return [
+        {
+            "id": i,
+            "title": f"Платёж {i}",
+            "amount_minor": 100_000 + i,
+            "day_of_month": i % 28 + 1,
+            "recurrence": "monthly",
+            "anchor_date": None,
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def _best_ms(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1000
+
+
+@pytest.mark.parametrize("count", [10, 100, 1000])
+def test_list_rendering(count):
+    rows = _rows(count)
+    ids = [row["id"] for row in rows]
+    number = max(1, 1000 // count)
+
+    lines_ms = _best_ms(lambda: build_payment_lines(rows), number)
+    list_ms = _best_ms(lambda: build_list_text(rows), number)
+    page_ms = _best_ms(lambda: build_edit_page_kb(rows, 0, 1, False), number)
+    uncached_ms = _best_ms(lambda: [build_payment_inline_kb.__wrapped__(i) for i in ids], number)
+    for payment_id in ids:
+        build_payment_inline_kb(payment_id)
+    cached_ms = _best_ms(lambda: [build_payment_inline_kb(i) for i in ids], number)
+
+    print(
+        f"\n{count} платежей: строки {lines_ms:.3f} мс, /list {list_ms:.3f} мс, "
+        f"клавиатура редактора {page_ms:.3f} мс, "
+        f"клавиатуры платежей {uncached_ms:.3f} мс заново / {cached_ms:.3f} мс из кэша"
+    )
+    assert cached_ms < uncached_ms
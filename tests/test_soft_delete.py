@@ -0,0 +1,64 @@
+"""
+Мягкое удаление платежей и их физическое удаление порциями
+(compact_deleted_payments).
+"""
+import time
+from decimal import Decimal
+
+import db
+from recurrence import MONTHLY, Schedule
+
+
+def _payments(user_id: int, count: int) -> list[int]:
+    for number in range(1, count + 1):
+        db.add_payment(user_id, f"Платёж {number}", Decimal("100"), Schedule(MONTHLY, number))
+    conn = db.get_connection()
+    return [row["id"] for row in conn.execute("SELECT id FROM payments WHERE user_id = ? ORDER BY id", (user_id,))]
+
+
+def _version(conn) -> int:
+    return conn.execute("SELECT version FROM payments_version WHERE id = 1").fetchone()[0]
+
+
+def test_deleted_payment_disappears_from_every_query(conn):
+    user_id = db.upsert_user(1001)
+    first, deleted, last = _payments(user_id, 3)
+    assert len(db.get_payment_summary(user_id).rows) == 3
+
+    started = int(time.time())
+    assert db.delete_payment(user_id, deleted)
+    assert not db.delete_payment(user_id, deleted)
+    # чужой платёж не удаляется
+    assert not db.delete_payment(db.upsert_user(1002), first)
+
+    row = conn.execute("SELECT active, deleted_at FROM payments WHERE id = ?", (deleted,)).fetchone()
+    assert row["active"] == 0 and started <= row["deleted_at"] <= time.time()
+    assert [row["id"] for row in db.get_payment_summary(user_id).rows] == [first, last]
+    assert [row["id"] for row in db.get_payments_page(user_id, 0, 10)] == [first, last]
+    assert [row["id"] for row in db.iter_user_payments(user_id)] == [first, last]
+    assert db.get_payment_by_id(user_id, deleted) is None
+    assert db.get_total_minor(user_id) == 20_000
+    # и без сводки в кэше — одним SUM по таблице
+    db.invalidate_payment_summary(user_id)
+    assert db.get_total_minor(user_id) == 20_000
+
+
+def test_compaction_removes_old_deleted_rows_in_batches(conn):
+    user_id = db.upsert_user(1001)
+    ids = _payments(user_id, 8)
+    old, recent, active = ids[:5], ids[5], ids[6:]
+    for payment_id in [*old, recent]:
+        db.delete_payment(user_id, payment_id)
+    conn.executemany("UPDATE payments SET deleted_at = ? WHERE id = ?", [(100, payment_id) for payment_id in old])
+    conn.execute("UPDATE payments SET deleted_at = 10000 WHERE id = ?", (recent,))
+    conn.commit()
+    version = _version(conn)
+
+    assert db.compact_deleted_payments(1000, batch_size=3) == 3
+    assert db.compact_deleted_payments(1000, batch_size=3) == 2
+    assert db.compact_deleted_payments(1000, batch_size=3) == 0
+
+    left = [row["id"] for row in conn.execute("SELECT id FROM payments ORDER BY id")]
+    assert left == [recent, *active]
+    # удалённые платежи в кэшах не участвуют — их вычистка кэши не сбрасывает
+    assert _version(conn) == version
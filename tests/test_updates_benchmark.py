@@ -0,0 +1,114 @@
+"""
+Записанные обновления (data/updates.json) прогоняются через long polling
+и через webhook; бот в обоих режимах ходит в поддельный Bot API.
+Все обновления становятся доступны сразу: в очереди getUpdates или
+в POST-запросах (не больше WEBHOOK_CONNECTIONS одновременно, как
+max_connections у Telegram). Задержка — от этого момента до ответа
+пользователю. Запуск: pytest --benchmark -s.
+"""
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+
+import pytest
+from aiogram import Dispatcher
+from aiohttp import ClientSession
+from aiohttp.test_utils import TestServer
+
+import main
+from fake_telegram import FakeTelegramAPI
+from fsm_storage import SQLiteStorage
+
+pytestmark = pytest.mark.benchmark
+
+RECORDED = json.loads((Path(__file__).parent / "data" / "updates.json").read_text(encoding="utf-8"))
+USERS = 200
+ROUNDS = 5
+WEBHOOK_CONNECTIONS = 40
+SECRET = "s3cret"
+
+
+def _updates() -> list[dict]:
+    """
+    Записанные обновления от USERS пользователей, ROUNDS раз подряд.
+    """
+    updates = []
+    for _round in range(ROUNDS):
+        for user in range(USERS):
+            for update in RECORDED:
+                message = update["message"]
+                user_id = 10_000 + user
+                updates.append({
+                    **update,
+                    "update_id": len(updates) + 1,
+                    "message": {
+                        **message,
+                        "chat": {**message["chat"], "id": user_id},
+                        "from": {**message["from"], "id": user_id},
+                    },
+                })
+    return updates
+
+
+async def _polling(api: FakeTelegramAPI, dp: Dispatcher, updates: list[dict]) -> float:
+    bot = api.bot()
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=1))
+    await asyncio.sleep(0.5)  # getMe и первый getUpdates
+    started = time.monotonic()
+    await api.push_updates(updates)
+    await api.wait_sent(len(updates), timeout=300)
+    await dp.stop_polling()
+    await polling
+    return started
+
+
+async def _webhook(api: FakeTelegramAPI, dp: Dispatcher, updates: list[dict]) -> float:
+    bot = api.bot()
+    server = TestServer(main.build_webhook_app(bot, dp, SECRET))
+    await server.start_server()
+    limit = asyncio.Semaphore(WEBHOOK_CONNECTIONS)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+
+    async def post(session: ClientSession, update: dict):
+        async with limit:
+            async with session.post(server.make_url(main.WEBHOOK_PATH), json=update, headers=headers) as response:
+                assert response.status == 200
+
+    try:
+        async with ClientSession() as session:
+            started = time.monotonic()
+            await asyncio.gather(*(post(session, update) for update in updates))
+        await api.wait_sent(len(updates))
+    finally:
+        await server.close()
+        await bot.session.close()
+    return started
+
+
+async def _replay(mode) -> tuple[float, list[float]]:
+    api = FakeTelegramAPI()
+    await api.start()
+    storage = SQLiteStorage()
+    dp = Dispatcher(storage=storage)
+    main.register_handlers(dp)
+    updates = _updates()
+    try:
+        started = await mode(api, dp, updates)
+    finally:
+        await storage.close()
+        await api.stop()
+    assert len(api.sent) == len(updates)
+    finished = [sent_at - started for sent_at, _chat_id, _text in api.sent]
+    return max(finished), finished
+
+
+def test_replay_polling_and_webhook(conn):
+    for name, mode in (("long polling", _polling), ("webhook", _webhook)):
+        elapsed, latencies = asyncio.run(_replay(mode))
+        quantiles = statistics.quantiles(latencies, n=100)
+        print(
+            f"\n{name}: {len(latencies)} обновлений за {elapsed:.2f} с ({len(latencies) / elapsed:.0f}/с), "
+            f"задержка p50 {quantiles[49] * 1000:.0f} мс, p99 {quantiles[98] * 1000:.0f} мс"
+        )
@@ -0,0 +1,71 @@
+"""
+Webhook-приложение: проверка живости и отказ запросам без верного
+секрета (X-Telegram-Bot-Api-Secret-Token). Бот ходит в поддельный Bot API.
+"""
+import asyncio
+import json
+from pathlib import Path
+
+from aiogram import Dispatcher
+from aiohttp.test_utils import TestClient, TestServer
+
+import main
+from fake_telegram import FakeTelegramAPI
+from fsm_storage import SQLiteStorage
+
+SECRET = "s3cret"
+UPDATE = json.loads((Path(__file__).parent / "data" / "updates.json").read_text(encoding="utf-8"))[0]
+
+
+async def _with_client(scenario):
+    api = FakeTelegramAPI()
+    await api.start()
+    bot = api.bot()
+    storage = SQLiteStorage(flush_delay=0)
+    dp = Dispatcher(storage=storage)
+    main.register_handlers(dp)
+    client = TestClient(TestServer(main.build_webhook_app(bot, dp, SECRET)))
+    await client.start_server()
+    try:
+        return await scenario(client, api)
+    finally:
+        await client.close()
+        await storage.close()
+        await bot.session.close()
+        await api.stop()
+
+
+def test_healthz(conn):
+    async def scenario(client, api):
+        response = await client.get("/healthz")
+        return response.status, await response.json()
+
+    assert asyncio.run(_with_client(scenario)) == (200, {"status": "ok"})
+
+
+def test_requests_without_the_secret_are_rejected(conn):
+    async def scenario(client, api):
+        statuses = []
+        for headers in ({}, {"X-Telegram-Bot-Api-Secret-Token": "wrong"}):
+            response = await client.post(main.WEBHOOK_PATH, json={**UPDATE, "update_id": 1}, headers=headers)
+            statuses.append(response.status)
+        return statuses, api.sent
+
+    statuses, sent = asyncio.run(_with_client(scenario))
+    assert statuses == [401, 401]
+    assert sent == []
+
+
+def test_update_with_the_secret_is_handled(conn):
+    async def scenario(client, api):
+        response = await client.post(
+            main.WEBHOOK_PATH,
+            json={**UPDATE, "update_id": 1},
+            headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+        )
+        return response.status, api.sent
+
+    status, sent = asyncio.run(_with_client(scenario))
+    assert status == 200
+    [(_time, chat_id, text)] = sent
+    assert chat_id == UPDATE["message"]["chat"]["id"] and text.startswith("Привет!")
@@ -0,0 +1,87 @@
+# validators.py
+"""
+Разбор и проверка полей платежа из текста пользователя.
+Одни и те же правила для диалога добавления, редактирования и импорта;
+при ошибке — ValueError с текстом, который можно показать пользователю.
+"""
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from money import MAX_AMOUNT
+from recurrence import ANCHOR_YEAR, KEYWORDS, MONTHLY, WEEKDAYS, WEEKLY, Schedule, weekly_anchor
+
+
+def parse_title(text: str) -> str:
+    title = text.strip()
+    if not title:
+        raise ValueError("Название не может быть пустым.")
+    return title
+
+
+def parse_amount(text: str) -> Decimal:
+    try:
+        amount = Decimal(text.replace(",", ".").strip())
+    except InvalidOperation:
+        raise ValueError("Не получилось распознать сумму (пример: 15000.50).") from None
+    if not amount.is_finite() or amount <= 0:
+        raise ValueError("Сумма должна быть больше нуля.")
+    if amount > MAX_AMOUNT:
+        raise ValueError("Слишком большая сумма.")
+    if amount.as_tuple().exponent < -2:
+        raise ValueError("Не больше двух знаков после запятой (копейки).")
+    return amount
+
+
+def parse_day(text: str) -> int:
+    try:
+        day = int(text.strip())
+    except ValueError:
+        raise ValueError("Нужно число месяца от 1 до 31.") from None
+    if not 1 <= day <= 31:
+        raise ValueError("Число месяца должно быть от 1 до 31.")
+    return day
+
+
+# Английские синонимы ключевых слов и дней недели — для импорта из файлов
+_RECURRENCE_WORDS = {
+    **{word: recurrence for recurrence, word in KEYWORDS.items()},
+    "ежемесячно": MONTHLY,
+    "monthly": MONTHLY,
+    "weekly": WEEKLY,
+    "quarterly": "quarterly",
+    "yearly": "yearly",
+}
+_WEEKDAY_WORDS = {
+    **{word: number for number, word in enumerate(WEEKDAYS)},
+    **{word: number for number, word in enumerate(("mon", "tue", "wed", "thu", "fri", "sat", "sun"))},
+}
+
+
+def parse_schedule(text: str) -> Schedule:
+    """
+    «15» — каждый месяц 15-го; «еженедельно пн»; «ежеквартально 15.03» —
+    15 марта, июня, сентября и декабря; «ежегодно 15.03».
+    """
+    words = text.strip().lower().split()
+    if len(words) == 1:
+        return Schedule(MONTHLY, parse_day(words[0]))
+
+    recurrence = _RECURRENCE_WORDS.get(words[0]) if len(words) == 2 else None
+    if recurrence is None:
+        raise ValueError(
+            "Укажите число месяца (1–31) или период: "
+            "«еженедельно пн», «ежеквартально 15.03», «ежегодно 15.03»."
+        )
+    if recurrence == MONTHLY:
+        return Schedule(MONTHLY, parse_day(words[1]))
+    if recurrence == WEEKLY:
+        weekday = _WEEKDAY_WORDS.get(words[1])
+        if weekday is None:
+            raise ValueError("День недели: пн, вт, ср, чт, пт, сб или вс.")
+        return Schedule(WEEKLY, 0, weekly_anchor(weekday))
+
+    try:
+        anchor = datetime.strptime(f"{words[1]}.{ANCHOR_YEAR}", "%d.%m.%Y").date()
+    except ValueError:
+        raise ValueError("Дата в виде ДД.ММ, например 15.03.") from None
+    return Schedule(recurrence, anchor.day, anchor)